@@ -0,0 +1,9 @@
+"""
+Performance benchmarks for fault: recording actions with Tester, generating
+code for the Verilator and SystemVerilog targets, expanding background
+pokes, and converting and parsing analog waveforms.  No simulator is needed,
+since only the Python side of each target is exercised.
+
+Run with "python -m benchmarks" from the root of the repository (see
+"python -m benchmarks --help").
+"""
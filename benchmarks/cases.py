@@ -0,0 +1,226 @@
+"""
+Benchmark cases.  Each case is a function of the size `n` (number of actions,
+steps or time points) and a scratch directory, which does any setup that
+shouldn't be timed and returns a pair (body, amount): `body` is the function
+being timed, and `amount` the number of items processed by it, in the unit
+given to the `benchmark` decorator.
+"""
+import os
+from fault.verilator_target import VerilatorTarget
+from fault.verilator_interpreter import VerilatorPortTable, ActionStreamEncoder
+from fault.system_verilog_target import SystemVerilogTarget
+from fault.background_poke import process_action_list
+from fault.pwl import pwc_to_pwl
+from fault.nutascii_parse import nutascii_parse
+from benchmarks import synthetic
+
+
+# name -> (function, unit)
+BENCHMARKS = {}
+
+# number of signals in the raw files
+RAW_SIGNALS = 4
+
+
+def benchmark(unit='actions'):
+    def decorator(func):
+        BENCHMARKS[func.__name__] = (func, unit)
+        return func
+    return decorator
+
+
+def verilator_target(circuit, directory):
+    # code generation only: neither magma nor verilator are run
+    return VerilatorTarget(circuit, directory=directory, skip_compile=True,
+                           skip_verilator=True)
+
+
+def system_verilog_target(circuit, directory):
+    return SystemVerilogTarget(circuit, directory=directory,
+                               simulator='iverilog', skip_compile=True)
+
+
+@benchmark()
+def tester_poke(n, directory):
+    circuit = synthetic.bench_circuit()
+
+    def body():
+        synthetic.flat_tester(circuit, n)
+    return body, n
+
+
+@benchmark()
+def tester_poke_compact(n, directory):
+    circuit = synthetic.bench_circuit()
+
+    def body():
+        synthetic.flat_tester(circuit, n, compact_actions=True)
+    return body, n
+
+
+@benchmark()
+def tester_drive(n, directory):
+    circuit = synthetic.bench_circuit()
+
+    def body():
+        synthetic.drive_tester(circuit, n)
+    return body, n
+
+
+@benchmark()
+def tester_drive_compact(n, directory):
+    circuit = synthetic.bench_circuit()
+
+    def body():
+        synthetic.drive_tester(circuit, n, compact_actions=True)
+    return body, n
+
+
+@benchmark()
+def tester_array_poke(n, directory):
+    circuit = synthetic.bench_circuit()
+
+    def body():
+        synthetic.array_tester(circuit, n)
+    return body, n
+
+
+@benchmark()
+def verilator_codegen(n, directory):
+    circuit = synthetic.bench_circuit()
+    tester = synthetic.flat_tester(circuit, n)
+    target = verilator_target(circuit, directory)
+
+    def body():
+        target.generate_code(tester.actions, [], 0, circuit)
+    return body, len(tester.actions)
+
+
+@benchmark()
+def verilator_codegen_segmented(n, directory):
+    circuit = synthetic.bench_circuit()
+    tester = synthetic.flat_tester(circuit, n)
+    target = verilator_target(circuit, directory)
+
+    def body():
+        target.generate_segmented_code(tester.actions, [], 0, circuit)
+    return body, len(tester.actions)
+
+
+@benchmark()
+def verilator_encode(n, directory):
+    circuit = synthetic.bench_circuit()
+    tester = synthetic.flat_tester(circuit, n)
+    encoder = ActionStreamEncoder(VerilatorPortTable(circuit))
+
+    def body():
+        encoder.encode(tester.actions)
+    return body, len(tester.actions)
+
+
+@benchmark()
+def verilator_encode_compact(n, directory):
+    circuit = synthetic.bench_circuit()
+    tester = synthetic.flat_tester(circuit, n, compact_actions=True)
+    encoder = ActionStreamEncoder(VerilatorPortTable(circuit))
+
+    def body():
+        encoder.encode(tester.actions)
+    return body, len(tester.actions)
+
+
+@benchmark()
+def verilator_codegen_array(n, directory):
+    circuit = synthetic.bench_circuit()
+    tester = synthetic.array_tester(circuit, n)
+    target = verilator_target(circuit, directory)
+
+    def body():
+        target.generate_code(tester.actions, [], 0, circuit)
+    return body, len(tester.actions)
+
+
+@benchmark()
+def verilator_codegen_loops(n, directory):
+    circuit = synthetic.bench_circuit()
+    tester = synthetic.loop_tester(circuit, n)
+    target = verilator_target(circuit, directory)
+
+    def body():
+        target.generate_code(tester.actions, [], 0, circuit)
+    return body, n
+
+
+@benchmark()
+def system_verilog_codegen(n, directory):
+    circuit = synthetic.bench_circuit()
+    tester = synthetic.flat_tester(circuit, n)
+    target = system_verilog_target(circuit, directory)
+
+    def body():
+        target.generate_code(tester.actions, {})
+    return body, len(tester.actions)
+
+
+@benchmark()
+def system_verilog_codegen_loops(n, directory):
+    circuit = synthetic.bench_circuit()
+    tester = synthetic.loop_tester(circuit, n)
+    target = system_verilog_target(circuit, directory)
+
+    def body():
+        target.generate_code(tester.actions, {})
+    return body, n
+
+
+@benchmark()
+def tester_serialize(n, directory):
+    circuit = synthetic.bench_circuit()
+    tester = synthetic.flat_tester(circuit, n)
+    file = os.path.join(directory, 'vectors.npz')
+
+    def body():
+        tester.serialize(file)
+    return body, len(tester.actions)
+
+
+@benchmark()
+def background_poke(n, directory):
+    actions = synthetic.background_actions(synthetic.analog_circuit(), n)
+
+    def body():
+        process_action_list(actions, 1e-9)
+    return body, len(actions)
+
+
+@benchmark(unit='steps')
+def pwc_to_pwl_steps(n, directory):
+    steps = synthetic.pwc_steps(n)
+    t_stop = steps[-1][0] + 1e-9
+
+    def body():
+        pwc_to_pwl(steps, t_stop, 1e-11)
+    return body, n
+
+
+@benchmark(unit='bytes')
+def nutascii_parse_ascii(n, directory):
+    raw_file = os.path.join(directory, 'ascii.raw')
+    size = synthetic.write_raw(raw_file, n, RAW_SIGNALS)
+
+    def body():
+        nutascii_parse(raw_file)
+    return body, size
+
+
+@benchmark(unit='bytes')
+def nutascii_parse_binary(n, directory):
+    raw_file = os.path.join(directory, 'binary.raw')
+    size = synthetic.write_raw(raw_file, n, RAW_SIGNALS, binary=True)
+
+    def body():
+        # copy out the columns, since they are memory-mapped
+        waveform = nutascii_parse(raw_file)
+        for name in waveform:
+            waveform[name](0)
+    return body, size
@@ -0,0 +1,175 @@
+"""
+Runs the benchmark cases and compares the results against a baseline.
+
+Each measurement is done in a freshly forked process (when fork is
+available), so that the peak RSS of one case doesn't hide that of the next
+and garbage from earlier cases doesn't slow down later ones.
+"""
+import argparse
+import fnmatch
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import tempfile
+import fault.instrumentation as instrumentation
+from benchmarks.cases import BENCHMARKS
+
+
+DEFAULT_SIZES = [10**4, 10**5]
+
+# increases of peak memory usage smaller than this (in kB) are ignored when
+# comparing against the baseline, since they are mostly noise
+MEMORY_SLACK = 16 * 1024
+
+
+def measure_case(name, n, directory):
+    """
+    Runs case `name` with size `n`, returning a dictionary with the time and
+    memory used by its timed part.
+    """
+    func, unit = BENCHMARKS[name]
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        body, amount = func(n, scratch)
+        gc.collect()
+        start = instrumentation.snapshot()
+        body()
+        values = instrumentation.measure(start)
+    result = {'name': name, 'size': n, 'unit': unit, 'amount': amount,
+              'wall_time': values['wall_time']}
+    if unit == 'bytes':
+        result['throughput'] = amount / values['wall_time'] / 1e6
+        result['throughput_unit'] = 'MB/s'
+    else:
+        result['throughput'] = amount / values['wall_time']
+        result['throughput_unit'] = f'{unit}/s'
+    if 'max_rss' in values:
+        # kB on Linux
+        result['cpu_time'] = values['cpu_time']
+        result['max_rss'] = values['max_rss']
+        result['rss_increase'] = values['max_rss'] - start['max_rss']
+    return result
+
+
+def measure_isolated(name, n, directory):
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return measure_case(name, n, directory)
+    with multiprocessing.get_context('fork').Pool(1) as pool:
+        return pool.apply(measure_case, (name, n, directory))
+
+
+def run_benchmarks(names, sizes, repeat=3, directory='build/benchmarks'):
+    """
+    Measures each case in `names` at each size in `sizes`, yielding the
+    fastest of `repeat` runs as each case finishes.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in names:
+        for n in sizes:
+            runs = [measure_isolated(name, n, directory)
+                    for _ in range(repeat)]
+            yield min(runs, key=lambda result: result['wall_time'])
+
+
+def compare(result, baseline, tolerance):
+    """
+    Returns a list of regressions of `result` with respect to the matching
+    `baseline` result.
+    """
+    regressions = []
+    if result['throughput'] < (1 - tolerance) * baseline['throughput']:
+        regressions.append(
+            f"throughput {result['throughput']:.4g} vs "
+            f"{baseline['throughput']:.4g} {result['throughput_unit']}")
+    if 'rss_increase' in result and 'rss_increase' in baseline:
+        limit = max((1 + tolerance) * baseline['rss_increase'],
+                    baseline['rss_increase'] + MEMORY_SLACK)
+        if result['rss_increase'] > limit:
+            regressions.append(
+                f"memory {result['rss_increase'] / 1024:.1f} vs "
+                f"{baseline['rss_increase'] / 1024:.1f} MB")
+    return regressions
+
+
+def format_result(result, baseline=None):
+    line = f"{result['name']:<32} {result['size']:>10} " \
+        f"{result['wall_time']:>9.3f}s " \
+        f"{result['throughput']:>12.4g} {result['throughput_unit']:<10}"
+    if 'rss_increase' in result:
+        line += f" {result['rss_increase'] / 1024:>8.1f} MB"
+    if baseline is not None:
+        ratio = result['throughput'] / baseline['throughput']
+        line += f"  x{ratio:.2f}"
+    return line
+
+
+def parse_sizes(text):
+    return [int(float(size)) for size in text.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Runs the fault benchmarks, reporting the throughput '
+                    'and the increase in peak memory usage of each case.')
+    parser.add_argument('-k', dest='patterns', action='append',
+                        help='only run cases matching this glob pattern '
+                             '(may be repeated)')
+    parser.add_argument('--sizes', type=parse_sizes, default=DEFAULT_SIZES,
+                        help='comma-separated list of sizes (e.g. 1e4,1e7)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs of each case (the fastest is '
+                             'reported)')
+    parser.add_argument('--baseline',
+                        help='JSON file of results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slowdown (or memory increase) '
+                             'reported as a regression')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--directory', default='build/benchmarks',
+                        help='scratch directory for generated files')
+    parser.add_argument('--list', action='store_true',
+                        help='list the cases and exit')
+    args = parser.parse_args(argv)
+
+    names = list(BENCHMARKS)
+    if args.patterns:
+        names = [name for name in names
+                 if any(fnmatch.fnmatch(name, pattern)
+                        for pattern in args.patterns)]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            for result in json.load(f)['results']:
+                baseline[(result['name'], result['size'])] = result
+
+    results = []
+    regressions = []
+    for result in run_benchmarks(names, args.sizes, repeat=args.repeat,
+                                 directory=args.directory):
+        results.append(result)
+        base = baseline.get((result['name'], result['size']), None)
+        print(format_result(result, base), flush=True)
+        if base is not None:
+            for regression in compare(result, base, args.tolerance):
+                regressions.append(f"{result['name']}[{result['size']}]: "
+                                   f"{regression}")
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump({'machine': platform.node(),
+                       'python': platform.python_version(),
+                       'results': results}, f, indent=2)
+            f.write('\n')
+
+    if regressions:
+        print(f'Found {len(regressions)} regression(s):')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+    return 0
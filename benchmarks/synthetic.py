@@ -0,0 +1,169 @@
+"""
+Synthetic circuits, testers and simulation results used by the benchmarks.
+Everything is generated deterministically from the requested size, so that
+results can be compared between runs.
+"""
+import numpy as np
+import magma as m
+import fault
+
+
+def bench_circuit(width=128, lanes=8):
+    """
+    Declares a digital circuit with two wide buses, an array of buses and a
+    clock.
+    """
+    return m.DeclareCircuit(
+        f'BenchCircuit{width}x{lanes}',
+        'A', m.In(m.Bits[width]),
+        'B', m.In(m.Bits[width]),
+        'LANES', m.In(m.Array[lanes, m.Bits[16]]),
+        'CLK', m.In(m.Clock),
+        'O', m.Out(m.Bits[width])
+    )
+
+
+def analog_circuit():
+    """
+    Declares a circuit with a real-valued input and a clock, for the
+    actions of analog targets.
+    """
+    return m.DeclareCircuit(
+        'BenchAnalogCircuit',
+        'VIN', fault.RealIn,
+        'CLK', m.In(m.Bit),
+        'VOUT', fault.RealOut
+    )
+
+
+def flat_tester(circuit, n, compact_actions=False):
+    """
+    Returns a tester with about `n` straight-line actions: pokes of the wide
+    buses, expects and clock steps.
+    """
+    tester = fault.Tester(circuit, circuit.CLK,
+                          compact_actions=compact_actions)
+    mask = (1 << len(circuit.A)) - 1
+    value = 0x0123456789abcdef
+    for k in range(n // 4):
+        value = (value * 6364136223846793005 + 1442695040888963407) & mask
+        tester.poke(circuit.A, value)
+        tester.poke(circuit.B, value ^ mask)
+        tester.step(2)
+        tester.expect(circuit.O, value)
+    return tester
+
+
+def drive_tester(circuit, n, compact_actions=False):
+    """
+    Returns a tester with the same actions as flat_tester, recorded with a
+    single call to Tester.drive.
+    """
+    tester = fault.Tester(circuit, circuit.CLK,
+                          compact_actions=compact_actions)
+    width = len(circuit.A)
+    words = (width + 31) // 32
+    rows = n // 5
+    data = np.random.RandomState(0).randint(
+        0, 1 << 32, size=(rows, words), dtype=np.uint64).astype(np.uint32)
+    data[:, -1] &= (1 << (width - 32 * (words - 1))) - 1
+    tester.drive({'A': data, 'B': data[::-1]}, expect={'O': data})
+    return tester
+
+
+def array_tester(circuit, n):
+    """
+    Returns a tester with about `n` actions on the elements of an array port.
+    """
+    tester = fault.Tester(circuit, circuit.CLK)
+    lanes = len(circuit.LANES)
+    for k in range(n // (lanes + 1)):
+        tester.poke(circuit.LANES, [(k + j) & 0xffff for j in range(lanes)])
+        tester.step(2)
+    return tester
+
+
+def loop_tester(circuit, n, depth=3):
+    """
+    Returns a tester with `n` loops nested `depth` deep, each with a few
+    actions at every level.
+    """
+    tester = fault.Tester(circuit, circuit.CLK)
+    for k in range(max(n // (4 * depth), 1)):
+        inner = tester
+        for level in range(depth):
+            inner = inner.loop(4)
+            inner.poke(circuit.A, inner.index)
+            inner.step(2)
+            inner.expect(circuit.O, k & 0xff)
+    return tester
+
+
+def background_actions(circuit, n, period=1e-8):
+    """
+    Returns `n` delayed pokes of the real-valued input, while the clock is
+    driven by a background poke (expanded by process_action_list).
+    """
+    tester = fault.Tester(circuit)
+    tester.poke(circuit.CLK, 0, delay={'type': 'clock', 'period': period})
+    for k in range(n):
+        # pokes land between clock edges
+        tester.poke(circuit.VIN, (k % 10) / 10, delay=0.3 * period)
+    return tester.actions
+
+
+def pwc_steps(n, period=1e-9):
+    """
+    Returns a piecewise-constant waveform with `n` steps, including pairs of
+    steps closer than the transition time.
+    """
+    steps = []
+    t = 0
+    for k in range(n):
+        t += period if k % 8 else period / 100
+        steps.append((t, float(k % 2)))
+    return steps
+
+
+def raw_data(points, signals):
+    # time axis plus a sine wave of a different frequency for each signal
+    time = np.linspace(0, 1e-6, points)
+    data = np.empty((points, signals + 1))
+    data[:, 0] = time
+    for k in range(signals):
+        data[:, k + 1] = np.sin(2 * np.pi * (k + 1) * 1e6 * time)
+    return data
+
+
+def write_raw(file_name, points, signals, binary=False):
+    """
+    Writes a SPICE raw file (nutascii or nutbin) with `points` time points of
+    `signals` node voltages.  Returns the size of the file in bytes.
+    """
+    data = raw_data(points, signals)
+    header = ['Title: fault benchmark',
+              'Date: Thu Jan  1 00:00:00  2020',
+              'Plotname: Transient Analysis',
+              'Flags: real',
+              f'No. Variables: {signals + 1}',
+              f'No. Points: {points}',
+              'Variables:',
+              '\t0\ttime\ttime']
+    header += [f'\t{k + 1}\tv{k}\tvoltage' for k in range(signals)]
+    with open(file_name, 'wb') as f:
+        if binary:
+            header += ['Binary:']
+            f.write(('\n'.join(header) + '\n').encode('ascii'))
+            f.write(data.astype('<f8').tobytes())
+        else:
+            header += ['Values:']
+            f.write(('\n'.join(header) + '\n').encode('ascii'))
+            # one line for the index and first value, then one line per value
+            fmt = '%d\t%.15e\n' + '\t%.15e\n' * signals + '\n'
+            chunk = 1 << 14
+            for start in range(0, points, chunk):
+                rows = data[start:start + chunk]
+                index = np.arange(start, start + len(rows))[:, np.newaxis]
+                values = tuple(np.hstack([index, rows]).ravel().tolist())
+                f.write(((fmt * len(rows)) % values).encode('ascii'))
+        return f.tell()
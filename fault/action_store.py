@@ -0,0 +1,270 @@
+import math
+from array import array
+from collections.abc import Sequence
+import numpy as np
+from hwtypes import BitVector
+import fault
+import fault.actions as actions
+from fault.select_path import SelectPath
+from fault.wrapper import PortWrapper
+
+
+# Row opcodes
+OBJECT = 0
+POKE = 1
+EXPECT = 2
+EXPECT_STRICT = 3
+EVAL = 4
+STEP = 5
+DELAY = 6
+
+# Ways of storing the values of a slot
+INLINE = 0  # integer stored in the values column
+WIDE = 1    # BitVector stored as 32-bit words in the words pool
+REAL = 2    # float stored in the reals pool
+CLOCK = 3   # number of steps stored in the values column
+
+# Largest BitVector stored in the values column
+INLINE_BITS = 63
+
+
+class ActionStore(Sequence):
+    """
+    Compact storage of a Tester's actions, used instead of a list when the
+    Tester is created with compact_actions=True.
+
+    Straight-line actions (Poke, Expect, Eval, Step, Delay) are stored in
+    typed columns: an opcode, a slot (a port along with the type of its
+    values), a value, and a delay.  Values that fit in 63 bits are stored
+    directly, wider BitVectors as 32-bit words in a separate pool, and floats
+    in a pool of doubles.  Any other action (control flow, Read handles,
+    actions with unusual values or options) is kept as is.
+
+    The store behaves as a read-only sequence of actions, which are created
+    as they are accessed, so it can be passed to any target in place of a
+    list.  Targets can also read the columns directly (see
+    ActionStreamEncoder).
+    """
+    def __init__(self, action_list=None):
+        self.ops = array('B')
+        self.slots = array('I')
+        self.values = array('q')
+        self.delays = array('d')
+        self.words = array('I')
+        self.reals = array('d')
+        self.objects = []
+        # slot number -> (port, kind, type of the values)
+        self.slot_list = []
+        # (id(port), key) -> slot number.  Ports are kept alive by slot_list,
+        # so their ids remain valid.
+        self.slot_index = {}
+        if action_list is not None:
+            self.extend(action_list)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.action(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('action index out of range')
+        return self.action(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.action(i)
+
+    def __str__(self):
+        return str(list(self))
+
+    @property
+    def nbytes(self):
+        """
+        Size of the columns and pools in bytes (not counting the objects).
+        """
+        return sum(column.itemsize * len(column) for column in [
+            self.ops, self.slots, self.values, self.delays, self.words,
+            self.reals])
+
+    def slot(self, port, key, kind, type_):
+        slot = self.slot_index.get((id(port), key), None)
+        if slot is None:
+            slot = len(self.slot_list)
+            self.slot_index[(id(port), key)] = slot
+            self.slot_list.append((port, kind, type_))
+        return slot
+
+    @staticmethod
+    def is_plain_port(port):
+        # ports accessed through a path are recreated on each access, so they
+        # aren't worth giving slots to
+        return not isinstance(port, (SelectPath, PortWrapper,
+                                     fault.WrappedVerilogInternalPort))
+
+    def encode_value(self, port, value):
+        """
+        Returns (slot, stored value) for `value` on `port`, or None if it
+        can't be stored in the columns.
+        """
+        type_ = type(value)
+        if isinstance(value, BitVector):
+            width = len(value)
+            if width <= INLINE_BITS:
+                return self.slot(port, type_, INLINE, type_), value.as_uint()
+            offset = len(self.words)
+            n = (width + 31) // 32
+            self.words.frombytes(value.as_uint().to_bytes(4 * n, 'little'))
+            return self.slot(port, type_, WIDE, type_), offset
+        if type_ in (int, bool) and -(1 << 63) <= value < (1 << 63):
+            return self.slot(port, type_, INLINE, type_), int(value)
+        if type_ is float:
+            self.reals.append(value)
+            return self.slot(port, type_, REAL, type_), len(self.reals) - 1
+        return None
+
+    def compact(self, action):
+        """
+        Returns the row (opcode, slot, value, delay) storing `action`, or None
+        if it has to be stored as an object.
+        """
+        cls = type(action)
+        if cls is actions.Eval:
+            return EVAL, 0, 0, math.nan
+        if cls is actions.Delay:
+            if type(action.time) is not float:
+                return None
+            return DELAY, 0, 0, action.time
+        if cls is actions.Step:
+            if not self.is_plain_port(action.clock) or \
+                    type(action.steps) is not int:
+                return None
+            return STEP, self.slot(action.clock, None, CLOCK, int), \
+                action.steps, math.nan
+        if cls is actions.Poke:
+            if action.background_params is not None or \
+                    not self.is_plain_port(action.port):
+                return None
+            if action.delay is None:
+                delay = math.nan
+            elif type(action.delay) is float:
+                delay = action.delay
+            else:
+                return None
+            encoded = self.encode_value(action.port, action.value)
+            if encoded is None:
+                return None
+            return (POKE,) + encoded + (delay,)
+        if cls is actions.Expect:
+            if action.above is not None or action.below is not None or \
+                    action.save_for_later or \
+                    not self.is_plain_port(action.port) or \
+                    action.strict not in (False, True):
+                return None
+            encoded = self.encode_value(action.port, action.value)
+            if encoded is None:
+                return None
+            op = EXPECT_STRICT if action.strict else EXPECT
+            return (op,) + encoded + (math.nan,)
+        return None
+
+    def append(self, action):
+        row = self.compact(action)
+        if row is None:
+            row = OBJECT, 0, len(self.objects), math.nan
+            self.objects.append(action)
+        op, slot, value, delay = row
+        self.ops.append(op)
+        self.slots.append(slot)
+        self.values.append(value)
+        self.delays.append(delay)
+
+    def extend(self, action_list):
+        for action in action_list:
+            self.append(action)
+
+    def decode_value(self, slot, value):
+        _, kind, type_ = self.slot_list[slot]
+        if kind == INLINE:
+            return type_(value)
+        if kind == WIDE:
+            n = (type_.size + 31) // 32
+            data = self.words[value:value + n].tobytes()
+            return type_(int.from_bytes(data, 'little'))
+        if kind == REAL:
+            return self.reals[value]
+        return value
+
+    def action(self, i):
+        """
+        Creates the action stored in row `i`.
+        """
+        op = self.ops[i]
+        if op == OBJECT:
+            return self.objects[self.values[i]]
+        if op == EVAL:
+            return actions.Eval()
+        if op == DELAY:
+            return actions.Delay(time=self.delays[i])
+        slot = self.slots[i]
+        port = self.slot_list[slot][0]
+        if op == STEP:
+            return actions.Step(port, self.values[i])
+        value = self.decode_value(slot, self.values[i])
+        if op == POKE:
+            delay = self.delays[i]
+            return actions.Poke(port, value,
+                                delay=None if math.isnan(delay) else delay)
+        return actions.Expect(port, value, strict=(op == EXPECT_STRICT))
+
+    def append_table(self, pokes, expects, clock=None, steps=0,
+                     delay=None):
+        """
+        Appends the rows of a table of DriveColumns (see Tester.drive): for
+        each row, a poke of each column of `pokes`, an eval, an expect of
+        each column of `expects`, and `steps` steps of `clock` (if `steps`
+        is not 0).  The columns are filled with vectorized operations.
+        """
+        rows = len(pokes[0]) if pokes else len(expects[0])
+        # (opcode, slot, stored values) for each action of a row
+        pattern = []
+        for op, columns in [(POKE, pokes), (EXPECT, expects)]:
+            for column in columns:
+                type_ = column.value_type
+                if column.width is None:
+                    slot = self.slot(column.port, type_, REAL, type_)
+                    stored = len(self.reals) + np.arange(rows)
+                    self.reals.frombytes(
+                        column.values.astype(np.float64).tobytes())
+                elif column.values.ndim == 1:
+                    slot = self.slot(column.port, type_, INLINE, type_)
+                    stored = column.values
+                else:
+                    slot = self.slot(column.port, type_, WIDE, type_)
+                    n = column.values.shape[1]
+                    stored = len(self.words) + n * np.arange(rows)
+                    self.words.frombytes(
+                        column.values.astype('<u4').tobytes())
+                pattern.append((op, slot, stored))
+            if op == POKE:
+                pattern.append((EVAL, 0, 0))
+        if steps:
+            pattern.append((STEP, self.slot(clock, None, CLOCK, int), steps))
+
+        # interleave the actions of each row
+        ops = np.empty((rows, len(pattern)), dtype=np.uint8)
+        slots = np.empty((rows, len(pattern)), dtype=np.uint32)
+        values = np.empty((rows, len(pattern)), dtype=np.int64)
+        delays = np.full((rows, len(pattern)), math.nan)
+        for k, (op, slot, stored) in enumerate(pattern):
+            ops[:, k] = op
+            slots[:, k] = slot
+            values[:, k] = stored
+            if op == POKE and delay is not None:
+                delays[:, k] = delay
+        self.ops.frombytes(ops.tobytes())
+        self.slots.frombytes(slots.astype(self.slots.typecode).tobytes())
+        self.values.frombytes(values.astype(self.values.typecode).tobytes())
+        self.delays.frombytes(delays.tobytes())
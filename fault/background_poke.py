@@ -5,8 +5,17 @@ from functools import total_ordering
 import copy
 
 
-@total_ordering
-class Thread():
+class PeriodicSource:
+    """
+    A background clock or sine wave on `port`, started at time `start` by a
+    Poke whose delay is a dictionary of parameters:
+        type: 'clock' (default) or 'sin'
+        freq or period: defaults to 1MHz
+        clock: duty_cycle (default 0.5), initial_value (default 0)
+        sin: amplitude (default 1), offset (default 0), phase_degrees or
+            phase_radians (default 0), dt (time between updates when
+            expanded to pokes, defaults to period/default_steps_per_cycle)
+    """
     # if sin wave dt is unspecified, use period/default_steps_per_cycle
     default_steps_per_cycle = 10
 
@@ -14,53 +23,78 @@ class Thread():
     # this avoids ambiguity when landing exactly on the clock edge
     epsilon = 1e-18
 
+    def __init__(self, port, params, start=0):
+        self.port = port
+        self.start = start
+        self.type_ = params.get('type', 'clock')
+        freq = params.get('freq', 1e6)
+        self.period = params.get('period', 1/freq)
+        self.freq = 1 / self.period
+
+        if self.type_ == 'clock':
+            self.duty_cycle = params.get('duty_cycle', 0.5)
+            self.initial_value = params.get('initial_value', 0)
+            self.dt = self.period/2
+        elif self.type_ == 'sin':
+            self.amplitude = params.get('amplitude', 1)
+            self.offset = params.get('offset', 0)
+            phase_degrees = params.get('phase_degrees', 0)
+            conv = math.pi / 180.0
+            self.phase_radians = params.get('phase_radians',
+                                            phase_degrees * conv)
+            self.dt = params.get(
+                'dt', 1 / (self.freq*self.default_steps_per_cycle))
+        else:
+            raise NotImplementedError(self.type_)
+
+    def value(self, t):
+        """
+        Returns the value of the source at time `t`.
+        """
+        if self.type_ == 'clock':
+            elapsed = t - self.start + self.epsilon
+            cycle_location = (elapsed / self.period) % 1
+            if self.initial_value == 0:
+                return 1 if cycle_location > (1 - self.duty_cycle) else 0
+            else:
+                return 1 if cycle_location < self.duty_cycle else 0
+        else:
+            angle = (t-self.start)*self.freq*2*math.pi + self.phase_radians
+            x = math.sin(angle)
+            return self.amplitude * x + self.offset
+
+    @property
+    def half_periods(self):
+        """
+        Durations of the two phases of a clock: at its initial value, then
+        at the other value.
+        """
+        if self.initial_value == 0:
+            return ((1 - self.duty_cycle) * self.period,
+                    self.duty_cycle * self.period)
+        else:
+            return (self.duty_cycle * self.period,
+                    (1 - self.duty_cycle) * self.period)
+
+
+@total_ordering
+class Thread():
+    # when checking clock value at time t, check time t+epsilon instead
+    # this avoids ambiguity when landing exactly on the clock edge
+    epsilon = PeriodicSource.epsilon
+
     def __init__(self, time, poke):
         #print('creating thread for', poke, 'at time', time)
         self.poke = copy.copy(poke)
         self.poke.params = None
         self.poke.delay = None
-        params = poke.delay
         self.start = time
         self.next_update = time
-        type_ = params.get('type', 'clock')
-
-        #print('type_ is', type_)
-        #print(params)
 
         # Each type must set a get_val(t) function and a dt
-        if type_ == 'clock':
-            freq = params.get('freq', 1e6)
-            period = params.get('period', 1/freq)
-            freq = 1 / period
-            duty_cycle = params.get('duty_cycle', 0.5)
-            initial_value = params.get('initial_value', 0)
-
-            def get_val(t):
-                cycle_location = ((t - self.start + self.epsilon) / period) % 1
-                if initial_value == 0:
-                    return 1 if cycle_location > (1 - duty_cycle) else 0
-                else:
-                    return 1 if cycle_location < duty_cycle else 0
-
-            self.get_val = get_val
-            self.dt = period/2
-
-        elif type_ == 'sin':
-            freq = params.get('freq', 1e6)
-            period = params.get('period', 1/freq)
-            freq = 1 / period
-            amplitude = params.get('amplitude', 1)
-            offset = params.get('offset', 0)
-            phase_degrees = params.get('phase_degrees', 0)
-            conv = math.pi / 180.0
-            phase_radians = params.get('phase_radians', phase_degrees * conv)
-
-            def get_val(t):
-                x = math.sin((t-self.start)*freq*2*math.pi + phase_radians)
-                return amplitude * x + offset
-
-            self.get_val = get_val
-            self.dt = params.get('dt', 1 / (freq*self.default_steps_per_cycle))
+        self.source = PeriodicSource(poke.port, poke.delay, time)
+        self.get_val = self.source.value
+        self.dt = self.source.dt
 
     def step(self, t):
         '''
@@ -190,6 +224,58 @@ class ThreadPool():
         return new_action_list
 
 
+def get_delay(a, clock_step_delay):
+    # time taken by action `a`
+    if not hasattr(a, 'delay'):
+        return getattr(a, 'time', 0)
+    elif a.delay is not None:
+        if type(a.delay) == dict:
+            return 0
+        else:
+            return a.delay
+    else:
+        return clock_step_delay
+
+
+def is_background(action):
+    return isinstance(action, Poke) and isinstance(action.delay, dict)
+
+
+def extract_periodic_sources(actions, clock_step_delay, accept):
+    """
+    Removes from `actions` the background pokes that a target can generate
+    natively: those of ports (for which `accept(poke)` is true) that aren't
+    poked by any other action, so that the source runs until the end of the
+    simulation.  Returns the remaining actions and the list of
+    PeriodicSources.  Other background pokes are left for
+    process_action_list to expand.
+    """
+    # the number of pokes of each port, including in control flow
+    counts = {}
+
+    def count(action_list):
+        for action in action_list:
+            if isinstance(action, Poke):
+                counts[id(action.port)] = counts.get(id(action.port), 0) + 1
+            for attr in ['actions', 'else_actions']:
+                nested = getattr(action, attr, None)
+                if isinstance(nested, list):
+                    count(nested)
+
+    count(actions)
+
+    t = 0
+    new_action_list = []
+    sources = []
+    for a in actions:
+        if is_background(a) and counts[id(a.port)] == 1 and accept(a):
+            sources.append(PeriodicSource(a.port, a.delay, t))
+        else:
+            new_action_list.append(a)
+        t += get_delay(a, clock_step_delay)
+    return new_action_list, sources
+
+
 def process_action_list(actions, clock_step_delay):
     """
     Replace Pokes with background_params with many individual pokes.
@@ -197,21 +283,9 @@ def process_action_list(actions, clock_step_delay):
     Throws a NotImplementedError if there's a background task during an
     interval of time not known at compile time.
     """
-
-    def get_delay(a):
-        if not hasattr(a, 'delay'):
-            return getattr(a, 'time', 0)
-        elif a.delay is not None:
-            if type(a.delay) == dict:
-                return 0
-            else:
-                return a.delay
-        else:
-            return clock_step_delay
-
     background_pool = ThreadPool(0)
     new_action_list = []
     for a in actions:
-        delay = get_delay(a)
+        delay = get_delay(a, clock_step_delay)
         new_action_list += background_pool.process(a, delay)
     return new_action_list
@@ -0,0 +1,109 @@
+import io
+import time
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+from pathlib import Path
+from fault.parallel import fork_map
+
+
+class JobResult:
+    """
+    Outcome of a single job of a batch.
+    """
+    def __init__(self, index, target, directory, passed, log, error, time):
+        self.index = index
+        self.target = target
+        self.directory = directory
+        self.passed = passed
+        # Everything the job printed (including the output of the simulator
+        # when it fails)
+        self.log = log
+        # Traceback of the exception raised by the job, if any
+        self.error = error
+        # Wall-clock time of compile_and_run, in seconds
+        self.time = time
+
+    def __repr__(self):
+        status = "PASS" if self.passed else "FAIL"
+        return (f"JobResult({self.index}, {self.target}, {status}, "
+                f"{self.time:.2f}s)")
+
+
+class BatchReport:
+    """
+    Aggregated results of run_batch.
+    """
+    def __init__(self, results, wall_time):
+        self.results = results
+        self.wall_time = wall_time
+
+    @property
+    def passed(self):
+        return all(result.passed for result in self.results)
+
+    @property
+    def failures(self):
+        return [result for result in self.results if not result.passed]
+
+    @property
+    def total_time(self):
+        # Sum of the job times, i.e. the time the batch would take serially
+        return sum(result.time for result in self.results)
+
+    def summary(self):
+        lines = [f"{len(self.results) - len(self.failures)}/"
+                 f"{len(self.results)} jobs passed in {self.wall_time:.2f}s "
+                 f"(total job time {self.total_time:.2f}s)"]
+        for result in self.failures:
+            lines += [f"FAILED job {result.index} ({result.target}) in "
+                      f"{result.directory}:", result.error]
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.summary()
+
+
+def run_batch(jobs, processes=None, directory="build/batch", build_cache=None):
+    """
+    Runs `compile_and_run` for many testers in parallel, and returns a
+    BatchReport with the pass/fail status, output and runtime of every job.
+
+    `jobs`: list of (tester, target) or (tester, target, kwargs) tuples, where
+        `target` and `kwargs` are passed to `tester.compile_and_run`
+
+    `processes`: number of jobs run at the same time (defaults to the number
+        of CPUs)
+
+    `directory`: each job is run in its own build directory
+        (<directory>/job_<k>), unless `kwargs` specifies one
+
+    `build_cache`: build cache shared by the verilator jobs (unless `kwargs`
+        specifies one), so that each distinct DUT is only compiled once even
+        if several jobs for it run at the same time.  Defaults to
+        <directory>/build_cache.
+    """
+    jobs = [job if len(job) == 3 else (job[0], job[1], {}) for job in jobs]
+    directory = Path(directory)
+    if build_cache is None:
+        build_cache = directory / "build_cache"
+
+    def run_job(k):
+        tester, target, kwargs = jobs[k]
+        kwargs = dict(kwargs)
+        kwargs.setdefault("directory", str(directory / f"job_{k}"))
+        if target == "verilator":
+            kwargs.setdefault("build_cache", str(build_cache))
+        log = io.StringIO()
+        start = time.time()
+        try:
+            with redirect_stdout(log), redirect_stderr(log):
+                tester.compile_and_run(target, **kwargs)
+            passed, error = True, None
+        except Exception:
+            passed, error = False, traceback.format_exc()
+        return JobResult(k, target, kwargs["directory"], passed,
+                         log.getvalue(), error, time.time() - start)
+
+    start = time.time()
+    results = fork_map(run_job, range(len(jobs)), processes)
+    return BatchReport(results, time.time() - start)
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from fault.user_cfg import FaultConfig
+try:
+    import fcntl
+except ImportError:
+    # locking is only available on POSIX systems
+    fcntl = None
+
+
+DEFAULT_CACHE_DIR = Path.home() / '.fault' / 'build_cache'
+
+
+def get_build_cache(setting=None):
+    """
+    Returns a BuildCache (or None if caching is disabled) based on `setting`:
+        * None: use the "build_cache" option from the fault config files,
+          which may be a path or a boolean.  Caching is disabled if the option
+          is not present.
+        * False: caching is disabled
+        * True: use the default cache directory (~/.fault/build_cache)
+        * str/Path: use the given directory
+    """
+    if setting is None:
+        setting = FaultConfig().opts.get('build_cache', False)
+    if setting is False or setting is None:
+        return None
+    if setting is True:
+        setting = DEFAULT_CACHE_DIR
+    return BuildCache(setting)
+
+
+class BuildCache:
+    """
+    Content-addressed store of build products (e.g. the Verilator obj_dir).
+    Entries are directories named by a hash of everything that went into the
+    build, so any number of targets (or processes) on the same machine can
+    share a single cache directory.  Entries are populated atomically, so a
+    partially-written entry is never visible to a reader.
+    """
+    def __init__(self, root):
+        self.root = Path(root).expanduser()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """
+        Computes a key from `parts`.  Each part may be a Path (whose name and
+        file contents are hashed), a str/bytes, a list/tuple of parts, or any
+        other object (whose str() is hashed).
+        """
+        hasher = hashlib.sha256()
+
+        def update(part):
+            if isinstance(part, Path):
+                hasher.update(b'path:' + part.name.encode())
+                if part.is_file():
+                    with open(part, 'rb') as f:
+                        for chunk in iter(lambda: f.read(1 << 20), b''):
+                            hasher.update(chunk)
+                else:
+                    hasher.update(b'<missing>')
+            elif isinstance(part, bytes):
+                hasher.update(b'bytes:' + part)
+            elif isinstance(part, str):
+                hasher.update(b'str:' + part.encode())
+            elif isinstance(part, (list, tuple)):
+                hasher.update(f'seq{len(part)}:'.encode())
+                for item in part:
+                    update(item)
+            else:
+                hasher.update(f'{type(part).__name__}:{part}'.encode())
+            # separator so that adjacent parts can't run together
+            hasher.update(b'\0')
+
+        for part in parts:
+            update(part)
+        return hasher.hexdigest()
+
+    def entry_path(self, key):
+        return self.root / key[:2] / key
+
+    def lookup(self, key):
+        """
+        Returns the directory of the entry for `key`, or None on a miss.
+        """
+        path = self.entry_path(key)
+        return path if path.is_dir() else None
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Holds an exclusive (inter-process) lock on `key` while in the context,
+        so that concurrent builds of the same entry can be serialized and only
+        one of them has to do the work.
+        """
+        if fcntl is None:
+            yield
+            return
+        path = self.entry_path(key)
+        os.makedirs(path.parent, exist_ok=True)
+        with open(path.parent / f'{key}.lock', 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def store(self, key, src, name=None):
+        """
+        Copies `src` (a file or directory) into the entry for `key` under
+        `name` (defaults to the basename of `src`).  If the entry already
+        exists, it is left untouched.
+        """
+        final = self.entry_path(key)
+        if final.is_dir():
+            return final
+        os.makedirs(final.parent, exist_ok=True)
+        name = name if name is not None else Path(src).name
+        tmp = Path(tempfile.mkdtemp(dir=final.parent, prefix='.tmp_'))
+        try:
+            copy_path(src, tmp / name)
+            try:
+                os.rename(tmp, final)
+            except OSError:
+                # another process populated this entry first
+                if not final.is_dir():
+                    raise
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp)
+        return final
+
+    def fetch(self, key, dst, name):
+        """
+        Copies `name` out of the entry for `key` to `dst`, replacing anything
+        already at `dst`.  Returns True on a hit, False on a miss.
+        """
+        entry = self.lookup(key)
+        if entry is None or not (entry / name).exists():
+            return False
+        dst = Path(dst)
+        if dst.is_dir():
+            shutil.rmtree(dst)
+        elif dst.exists():
+            os.remove(dst)
+        copy_path(entry / name, dst)
+        return True
+
+
+def copy_path(src, dst):
+    # copy2 preserves modification times, which keeps make from rebuilding
+    # objects restored from the cache
+    if Path(src).is_dir():
+        shutil.copytree(src, dst, copy_function=shutil.copy2)
+    else:
+        shutil.copy2(src, dst)
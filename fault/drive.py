@@ -0,0 +1,92 @@
+import numpy as np
+import magma as m
+from hwtypes import BitVector
+from fault.real_type import RealType, RealKind
+
+
+class DriveColumn:
+    """
+    Values of one port for every row of a table passed to Tester.drive,
+    validated against the width of the port.  Values are stored as an int64
+    array for ports of up to 63 bits, as an array of 32-bit words (one row
+    per value, least significant word first) for wider ports, and as a
+    float array for real-valued ports.
+    """
+    def __init__(self, port, values):
+        self.port = port
+        name = port.debug_name
+        if isinstance(port, (RealType, RealKind)):
+            self.width = None
+            self.values = np.asarray(values, dtype=float)
+            if self.values.ndim != 1:
+                raise ValueError(f'Expected a 1-D array of values for {name}')
+            return
+        is_bits = isinstance(port, m.BitsType) or \
+            (isinstance(port, m.ArrayType) and isinstance(port.T, m._BitKind))
+        if isinstance(port, m._BitType):
+            self.width = 1
+        elif is_bits:
+            self.width = len(port)
+        else:
+            raise ValueError(f'Cannot drive {name} with an array of values, '
+                             f'drive its elements instead')
+        self.values = self.validate(name, np.asarray(values))
+
+    def validate(self, name, values):
+        # values may be negative (two's complement) or unsigned
+        width = self.width
+        n = max(1, (width + 31) // 32)
+        if values.ndim == 2:
+            # rows of 32-bit words
+            if values.shape[1] != n or values.dtype.kind not in 'ui':
+                raise ValueError(f'Expected {n} 32-bit words per value of '
+                                 f'{name}, got {values.shape[1]} of type '
+                                 f'{values.dtype}')
+            top = values[:, -1].astype(np.int64) >> (width - 32 * (n - 1))
+            if np.any(values < 0) or np.any(values > 0xffffffff) or \
+                    np.any(top):
+                raise ValueError(f'Values of {name} do not fit in {width} '
+                                 f'bits')
+            if width <= 63:
+                return sum(values[:, k].astype(np.int64) << (32 * k)
+                           for k in range(n))
+            return values.astype(np.uint32)
+        if values.ndim != 1:
+            raise ValueError(f'Expected a 1-D array of values for {name}')
+        if values.dtype.kind == 'b':
+            values = values.astype(np.int64)
+        if values.dtype.kind not in 'uiO':
+            raise ValueError(f'Expected integer values for {name}, got '
+                             f'{values.dtype}')
+        if len(values) > 0:
+            low, high = values.min(), values.max()
+            if int(low) < -(1 << (width - 1)) or int(high) >= (1 << width):
+                raise ValueError(f'Values of {name} do not fit in {width} '
+                                 f'bits (got {low} to {high})')
+        mask = (1 << width) - 1
+        if width <= 63:
+            return values.astype(np.int64) & mask
+        # wide values are split into 32-bit words
+        data = b''.join((int(value) & mask).to_bytes(4 * n, 'little')
+                        for value in values)
+        return np.frombuffer(data, dtype='<u4').reshape(len(values), n)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def value_type(self):
+        return float if self.width is None else BitVector[self.width]
+
+    def objects(self):
+        """
+        Returns the list of values as the objects recorded by Tester.poke and
+        Tester.expect.
+        """
+        if self.width is None:
+            return self.values.tolist()
+        type_ = self.value_type
+        if self.values.ndim == 1:
+            return [type_(value) for value in self.values.tolist()]
+        return [type_(int.from_bytes(row.astype('<u4').tobytes(), 'little'))
+                for row in self.values]
@@ -0,0 +1,172 @@
+"""
+Timing and resource instrumentation of test runs.
+
+Each Tester.compile_and_run is recorded as a "run" made of "phases" (magma
+compilation, code generation, simulator compilation, simulation, result
+processing, ...).  For each phase, the wall time, CPU time of this process
+and of its children (the simulators), and peak RSS are recorded, along with
+phase-specific information such as the size of the generated source.
+
+Finished runs are passed to every sink, which is any callable taking the run
+record (a JSON-serializable dictionary).  JSONLinesSink and LoggingSink are
+provided; sinks are registered with add_sink, and a JSON lines file can also
+be set with the "instrumentation" option of the fault config files.  Phases
+that happen outside of a run (e.g. Tester.compile followed by Tester.run)
+are passed to the sinks individually.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from fault.user_cfg import FaultConfig
+try:
+    import resource
+except ImportError:
+    # resource usage is only available on POSIX systems
+    resource = None
+
+
+_local = threading.local()
+_sinks = []
+_config_loaded = False
+
+
+class JSONLinesSink:
+    """
+    Appends each record as a line of JSON to `path`.  Lines are written with
+    a single write to a file opened in append mode, so that several
+    processes can share a file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str) + '\n'
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+
+class LoggingSink:
+    """
+    Logs a one-line summary of each record with the `logging` module, with
+    the full record in the `fault_record` attribute of the log record.
+    """
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger(
+            'fault.instrumentation')
+        self.level = level
+
+    def __call__(self, record):
+        name = record.get('phase', record.get('target', 'run'))
+        phases = ', '.join(f"{phase['phase']}={phase['wall_time']:.3f}s"
+                           for phase in record.get('phases', []))
+        msg = f"{name}: {record['wall_time']:.3f}s"
+        if phases:
+            msg += f" ({phases})"
+        self.logger.log(self.level, msg, extra={'fault_record': record})
+
+
+def get_sinks():
+    global _config_loaded
+    if not _config_loaded:
+        _config_loaded = True
+        path = FaultConfig().opts.get('instrumentation', None)
+        if path is not None:
+            _sinks.append(JSONLinesSink(path))
+    return _sinks
+
+
+def add_sink(sink):
+    get_sinks().append(sink)
+
+
+def remove_sink(sink):
+    get_sinks().remove(sink)
+
+
+def emit(record):
+    for sink in get_sinks():
+        sink(record)
+
+
+def snapshot():
+    values = {'wall_time': time.perf_counter()}
+    if resource is not None:
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        values['cpu_time'] = self_usage.ru_utime + self_usage.ru_stime
+        values['child_cpu_time'] = \
+            child_usage.ru_utime + child_usage.ru_stime
+        # peak RSS (in kB on Linux) of this process and of the largest child
+        # so far; not reset between phases
+        values['max_rss'] = self_usage.ru_maxrss
+        values['child_max_rss'] = child_usage.ru_maxrss
+    return values
+
+
+def measure(start):
+    end = snapshot()
+    values = {}
+    for key in ['wall_time', 'cpu_time', 'child_cpu_time']:
+        if key in end:
+            values[key] = end[key] - start[key]
+    for key in ['max_rss', 'child_max_rss']:
+        if key in end:
+            values[key] = end[key]
+    return values
+
+
+def current_run():
+    stack = getattr(_local, 'runs', None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def run(**info):
+    """
+    Records a run (e.g. a Tester.compile_and_run), made of all phases that
+    happen in the context on this thread.  `info` is added to the record,
+    which is yielded so that more information can be added.
+    """
+    record = {'event': 'run', 'timestamp': time.time()}
+    record.update(info)
+    record['phases'] = []
+    if not hasattr(_local, 'runs'):
+        _local.runs = []
+    _local.runs.append(record)
+    start = snapshot()
+    try:
+        yield record
+        record['status'] = 'passed'
+    except BaseException as e:
+        record['status'] = 'failed'
+        record['error'] = type(e).__name__
+        raise
+    finally:
+        _local.runs.pop()
+        record.update(measure(start))
+        emit(record)
+
+
+@contextmanager
+def phase(name, **info):
+    """
+    Records a phase of the current run.  `info` is added to the record, which
+    is yielded so that more information (e.g. the size of generated source)
+    can be added.
+    """
+    record = {'phase': name}
+    record.update(info)
+    start = snapshot()
+    try:
+        yield record
+    finally:
+        record.update(measure(start))
+        parent = current_run()
+        if parent is not None:
+            parent['phases'].append(record)
+        elif len(get_sinks()) > 0:
+            emit(dict(event='phase', timestamp=time.time(), **record))
@@ -0,0 +1,542 @@
+import json
+import os
+import tempfile
+from collections import defaultdict
+from functools import lru_cache
+import numpy as np
+import magma as m
+from hwtypes import BitVector, Bit
+
+
+# Values are stored as uint64 arrays with one element per independent copy of
+# the circuit, so ports (and primitives) can be at most this wide
+MAX_WIDTH = 64
+
+
+def mask(width):
+    return np.uint64((1 << width) - 1)
+
+
+def to_signed(value, width):
+    value = value.astype(np.int64)
+    if width < 64:
+        value = np.where(value >= (1 << (width - 1)),
+                         value - (1 << width), value)
+    return value
+
+
+def parse_value(value):
+    """
+    Converts a coreir JSON value (e.g. ["Int", 8], ["Bool", true] or
+    [["BitVector", 8], "8'h2a"]) to an int.  Values that aren't numbers are
+    returned unchanged.
+    """
+    if isinstance(value, list) and len(value) == 2:
+        value = value[1]
+    if isinstance(value, (bool, int)):
+        return int(value)
+    if isinstance(value, str):
+        if "'" in value:
+            value = value.split("'")[1]
+            base = {"h": 16, "b": 2, "d": 10}[value[0]]
+            return int(value[1:], base)
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    return value
+
+
+def type_leaves(type_, path=()):
+    """
+    Returns the bit vectors of the coreir type `type_` as a list of
+    (path, width, is_input) tuples.
+    """
+    if type_ in ("Bit", "BitIn"):
+        return [(path, 1, type_ == "BitIn")]
+    if type_[0] == "Named":
+        # e.g. coreir.clkIn, coreir.arst
+        return [(path, 1, type_[1].endswith("In"))]
+    if type_[0] == "Array":
+        _, n, elem = type_
+        if elem in ("Bit", "BitIn"):
+            return [(path, n, elem == "BitIn")]
+        return [leaf for i in range(n)
+                for leaf in type_leaves(elem, path + (str(i),))]
+    if type_[0] == "Record":
+        fields = type_[1]
+        if isinstance(fields, dict):
+            fields = fields.items()
+        return [leaf for name, field in fields
+                for leaf in type_leaves(field, path + (name,))]
+    raise NotImplementedError(f"Unsupported coreir type {type_}")
+
+
+def where(cond, a, b):
+    return np.where(cond, a, b).astype(np.uint64)
+
+
+def shift(value, amount, width, fn):
+    # numpy (like C) doesn't define shifts by the word size or more
+    shifted = fn(value, np.minimum(amount, np.uint64(63)))
+    return where(amount >= width, 0, shifted & mask(width))
+
+
+def ashr(a, b, width):
+    value = to_signed(a, width) >> np.minimum(b, np.uint64(63)).astype(
+        np.int64)
+    return value.astype(np.uint64) & mask(width)
+
+
+def parity(a):
+    a = a.copy()
+    for k in [32, 16, 8, 4, 2, 1]:
+        a ^= a >> np.uint64(k)
+    return a & np.uint64(1)
+
+
+# Combinational primitives operating on inputs of the same width `w`
+BINARY_OPS = {
+    "add": lambda a, b, w: (a + b) & mask(w),
+    "sub": lambda a, b, w: (a - b) & mask(w),
+    "mul": lambda a, b, w: (a * b) & mask(w),
+    "and": lambda a, b, w: a & b,
+    "or": lambda a, b, w: a | b,
+    "xor": lambda a, b, w: a ^ b,
+    "shl": lambda a, b, w: shift(a, b, w, np.left_shift),
+    "lshr": lambda a, b, w: shift(a, b, w, np.right_shift),
+    "ashr": ashr,
+}
+COMPARE_OPS = {
+    "eq": lambda a, b, w: a == b,
+    "neq": lambda a, b, w: a != b,
+    "ult": lambda a, b, w: a < b,
+    "ule": lambda a, b, w: a <= b,
+    "ugt": lambda a, b, w: a > b,
+    "uge": lambda a, b, w: a >= b,
+    "slt": lambda a, b, w: to_signed(a, w) < to_signed(b, w),
+    "sle": lambda a, b, w: to_signed(a, w) <= to_signed(b, w),
+    "sgt": lambda a, b, w: to_signed(a, w) > to_signed(b, w),
+    "sge": lambda a, b, w: to_signed(a, w) >= to_signed(b, w),
+}
+UNARY_OPS = {
+    "not": lambda a, w: ~a & mask(w),
+    "neg": lambda a, w: (~a + np.uint64(1)) & mask(w),
+    "wire": lambda a, w: a,
+    "wrap": lambda a, w: a,
+}
+REDUCE_OPS = {
+    "andr": lambda a, w: a == mask(w),
+    "orr": lambda a, w: a != 0,
+    "xorr": lambda a, w: parity(a),
+}
+REGISTERS = {"coreir.reg", "coreir.reg_arst", "corebit.reg",
+             "corebit.reg_arst", "corebit.dff"}
+
+
+class Primitive:
+    """
+    A coreir primitive instance: `inputs` and `outputs` are lists of
+    (path, width) and `fn` maps a dict of input values to a dict of output
+    values (both keyed by path).
+    """
+    def __init__(self, ref, inputs, outputs, fn=None, args=None):
+        self.ref = ref
+        self.inputs = inputs
+        self.outputs = outputs
+        self.fn = fn
+        self.args = args if args is not None else {}
+        for _, width in inputs + outputs:
+            if width > MAX_WIDTH:
+                raise NotImplementedError(
+                    f"{ref} is wider than {MAX_WIDTH} bits")
+
+    @property
+    def is_register(self):
+        return self.ref in REGISTERS
+
+    @property
+    def leaves(self):
+        return [(path, width, True) for path, width in self.inputs] + \
+            [(path, width, False) for path, width in self.outputs]
+
+
+def make_primitive(ref, genargs, modargs):
+    args = {}
+    for key, value in list(genargs.items()) + list(modargs.items()):
+        args[key] = parse_value(value)
+    lib, name = ref.split(".", 1)
+    if lib == "commonlib" and name == "muxn":
+        n, w = args["N"], args["width"]
+        sel_width = max(1, (n - 1).bit_length())
+        data = [("in", "data", str(i)) for i in range(n)]
+
+        def muxn(ins):
+            choices = np.stack([ins[path] for path in data])
+            sel = np.minimum(ins[("in", "sel")], np.uint64(n - 1))
+            return {("out",): choices[sel.astype(np.intp),
+                                      np.arange(choices.shape[1])]}
+        inputs = [(path, w) for path in data]
+        inputs += [(("in", "sel"), sel_width)]
+        return Primitive(ref, inputs, [(("out",), w)], muxn)
+    if lib not in ("coreir", "corebit"):
+        raise NotImplementedError(f"Unsupported primitive {ref}")
+    w = args.get("width", 1) if lib == "coreir" else 1
+    in0, in1, out = ("in0",), ("in1",), ("out",)
+    if name in BINARY_OPS or name in COMPARE_OPS:
+        op = BINARY_OPS.get(name) or COMPARE_OPS[name]
+        out_width = w if name in BINARY_OPS else 1
+        return Primitive(ref, [(in0, w), (in1, w)], [(out, out_width)],
+                         lambda ins: {out: op(ins[in0], ins[in1], w).astype(
+                             np.uint64)})
+    if name in UNARY_OPS or name in REDUCE_OPS:
+        op = UNARY_OPS.get(name) or REDUCE_OPS[name]
+        out_width = w if name in UNARY_OPS else 1
+        return Primitive(ref, [(("in",), w)], [(out, out_width)],
+                         lambda ins: {out: op(ins[("in",)], w).astype(
+                             np.uint64)})
+    if name == "mux":
+        return Primitive(ref, [(in0, w), (in1, w), (("sel",), 1)],
+                         [(out, w)],
+                         lambda ins: {out: where(ins[("sel",)], ins[in1],
+                                                 ins[in0])})
+    if name == "const":
+        value = np.uint64(args["value"])
+        return Primitive(ref, [], [(out, w)],
+                         lambda ins: {out: value})
+    if name == "undriven":
+        return Primitive(ref, [], [(out, w)],
+                         lambda ins: {out: np.uint64(0)})
+    if name == "term":
+        return Primitive(ref, [(("in",), w)], [], lambda ins: {})
+    if name == "slice":
+        lo, hi = args["lo"], args["hi"]
+        return Primitive(ref, [(("in",), w)], [(out, hi - lo)],
+                         lambda ins: {out: mask(hi - lo) & (
+                             ins[("in",)] >> np.uint64(lo))})
+    if name == "concat":
+        w0, w1 = args["width0"], args["width1"]
+        return Primitive(ref, [(in0, w0), (in1, w1)], [(out, w0 + w1)],
+                         lambda ins: {out: np.bitwise_or(
+                             ins[in0], ins[in1] << np.uint64(w0))})
+    if name in ("zext", "sext"):
+        w_in, w_out = args["width_in"], args["width_out"]
+
+        def ext(ins):
+            value = ins[("in",)]
+            if name == "sext":
+                value = to_signed(value, w_in).astype(np.uint64)
+            return {out: value & mask(w_out)}
+        return Primitive(ref, [(("in",), w_in)], [(out, w_out)], ext)
+    if ref in REGISTERS:
+        inputs = [(("clk",), 1), (("in",), w)]
+        if name == "reg_arst":
+            inputs += [(("arst",), 1)]
+        return Primitive(ref, inputs, [(out, w)], args=args)
+    raise NotImplementedError(f"Unsupported primitive {ref}")
+
+
+class CoreIRGraph:
+    """
+    Flattened, bit-level connectivity of the top module of a coreir JSON
+    design.  The module hierarchy is inlined so that only primitives remain,
+    and every input of a primitive (or output of the top module) is resolved
+    to the primitive outputs (or top inputs) that drive it.
+    """
+    def __init__(self, design):
+        self.namespaces = design["namespaces"]
+        top = self.find_module(design["top"])
+        self.leaves = {(): type_leaves(top["type"])}
+        self.primitives = {}
+        self.parent = {}
+        self.flatten(top, ())
+
+        # find the driver of every net
+        drivers = {}
+        for node, leaves in self.source_leaves():
+            for path, width, _ in leaves:
+                for bit in range(width):
+                    root = self.find((node, path, bit))
+                    if root in drivers:
+                        raise ValueError(f"Multiple drivers for {root}")
+                    drivers[root] = (node, path, bit)
+
+        # resolve the sinks, as a list of (source, source bit, sink bit,
+        # number of bits) runs
+        self.sinks = {}
+        for node, leaves in self.sink_leaves():
+            for path, width, _ in leaves:
+                bits = [drivers.get(self.find((node, path, bit)))
+                        for bit in range(width)]
+                self.sinks[(node, path)] = self.runs(bits)
+
+    def find_module(self, ref):
+        namespace, name = ref.split(".", 1)
+        if namespace not in self.namespaces:
+            return None
+        return self.namespaces[namespace].get("modules", {}).get(name)
+
+    def flatten(self, module, node):
+        for name, inst in module.get("instances", {}).items():
+            child = node + (name,)
+            ref = inst.get("modref", inst.get("genref"))
+            definition = self.find_module(ref) if "modref" in inst else None
+            is_primitive = definition is None or not (
+                "instances" in definition or "connections" in definition)
+            if not is_primitive:
+                self.leaves[child] = type_leaves(definition["type"])
+                self.flatten(definition, child)
+            else:
+                prim = make_primitive(ref, inst.get("genargs", {}),
+                                      inst.get("modargs", {}))
+                self.leaves[child] = prim.leaves
+                self.primitives[child] = prim
+        for a, b in module.get("connections", []):
+            bits_a = self.bits(node, a)
+            bits_b = self.bits(node, b)
+            if len(bits_a) != len(bits_b):
+                raise ValueError(f"Width mismatch connecting {a} and {b}")
+            for x, y in zip(bits_a, bits_b):
+                self.parent[self.find(x)] = self.find(y)
+
+    def bits(self, node, ref):
+        """
+        Returns the bits referred to by `ref` (e.g. "self.I", "inst0.in.3")
+        in the module instantiated at `node`.
+        """
+        inst, *path = ref.split(".")
+        target = node if inst == "self" else node + (inst,)
+        path = tuple(path)
+        leaves = self.leaves[target]
+        bits = [(target, leaf, bit) for leaf, width, _ in leaves
+                if leaf[:len(path)] == path for bit in range(width)]
+        if bits:
+            return bits
+        # a single bit of a leaf
+        for leaf, width, _ in leaves:
+            if leaf == path[:-1] and int(path[-1]) < width:
+                return [(target, leaf, int(path[-1]))]
+        raise ValueError(f"Could not resolve {ref}")
+
+    def find(self, bit):
+        root = bit
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        # path compression
+        while bit != root:
+            self.parent[bit], bit = root, self.parent[bit]
+        return root
+
+    def source_leaves(self):
+        yield (), [leaf for leaf in self.leaves[()] if leaf[2]]
+        for node, prim in self.primitives.items():
+            yield node, [leaf for leaf in prim.leaves if not leaf[2]]
+
+    def sink_leaves(self):
+        yield (), [leaf for leaf in self.leaves[()] if not leaf[2]]
+        for node, prim in self.primitives.items():
+            yield node, [leaf for leaf in prim.leaves if leaf[2]]
+
+    @staticmethod
+    def runs(bits):
+        runs = []
+        for k, bit in enumerate(bits):
+            if bit is None:
+                continue
+            src_node, src_path, src_bit = bit
+            if runs:
+                src, lo, dst, n = runs[-1]
+                if src == (src_node, src_path) and lo + n == src_bit and \
+                        dst + n == k:
+                    runs[-1] = (src, lo, dst, n + 1)
+                    continue
+            runs.append(((src_node, src_path), src_bit, k, 1))
+        return runs
+
+
+@lru_cache(maxsize=None)
+def coreir_graph(circuit):
+    """
+    Compiles `circuit` to coreir JSON and returns its CoreIRGraph (cached,
+    since the same circuit is typically simulated many times).
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        prefix = os.path.join(directory, circuit.name)
+        m.compile(prefix, circuit, output="coreir")
+        with open(prefix + ".json", "r") as f:
+            return CoreIRGraph(json.load(f))
+
+
+def port_path(name):
+    if isinstance(name, m.ref.ArrayRef):
+        return port_path(name.array.name) + (str(name.index),)
+    if isinstance(name, m.ref.TupleRef):
+        return port_path(name.tuple.name) + (str(name.index),)
+    return (name.name,)
+
+
+class NumpySimulator:
+    """
+    Vectorized simulator of a magma circuit.  The coreir graph of the circuit
+    is compiled into a sequence of NumPy operations on arrays with one
+    element per independent copy of the circuit, so that a single `evaluate`
+    simulates `batch` input vectors at once.
+
+    Supports combinational coreir/corebit primitives, commonlib.muxn and
+    registers (coreir.reg, coreir.reg_arst) with ports up to 64 bits wide.
+    """
+    def __init__(self, circuit, batch=1, graph=None):
+        self.circuit = circuit
+        self.batch = batch
+        if graph is None:
+            graph = coreir_graph(circuit)
+        self.graph = graph
+        self.widths = {((), path): width
+                       for path, width, _ in graph.leaves[()]}
+        self.inputs = {((), path) for path, _, is_input in graph.leaves[()]
+                       if is_input}
+        zeros = np.zeros(batch, dtype=np.uint64)
+        self.values = {key: zeros for key in self.inputs}
+
+        # Order the combinational primitives so that every primitive is
+        # evaluated after the primitives driving it.  Registers are sources,
+        # which breaks any (legal) cycles.
+        self.registers = []
+        deps = {}
+        for node, prim in graph.primitives.items():
+            for path, width in prim.outputs:
+                self.widths[(node, path)] = width
+            if prim.is_register:
+                self.registers.append(node)
+                init = np.uint64(prim.args.get("init", 0))
+                self.values[(node, ("out",))] = zeros + init
+                continue
+            deps[node] = {src[0] for path, _ in prim.inputs
+                          for src, *_ in graph.sinks[(node, path)]
+                          if self.is_combinational(src[0])}
+        self.order = []
+        users = defaultdict(list)
+        for node, node_deps in deps.items():
+            for dep in node_deps:
+                users[dep].append(node)
+        ready = [node for node, node_deps in deps.items() if not node_deps]
+        remaining = {node: len(node_deps) for node, node_deps in deps.items()}
+        while ready:
+            node = ready.pop()
+            self.order.append(node)
+            for user in users[node]:
+                remaining[user] -= 1
+                if remaining[user] == 0:
+                    ready.append(user)
+        if len(self.order) != len(deps):
+            raise ValueError(f"{circuit.name} has a combinational loop")
+
+        # previous value of the clock of each register, to detect edges
+        self.prev_clk = {node: zeros for node in self.registers}
+        self.eval_comb()
+
+    def is_combinational(self, node):
+        prim = self.graph.primitives.get(node)
+        return prim is not None and not prim.is_register
+
+    def gather(self, key):
+        runs = self.graph.sinks[key]
+        # fast path: the whole value comes from one source
+        if len(runs) == 1:
+            src, lo, dst, n = runs[0]
+            if lo == 0 and dst == 0 and self.widths[src] == n:
+                return self.values[src]
+        value = np.zeros(self.batch, dtype=np.uint64)
+        for src, lo, dst, n in runs:
+            bits = (self.values[src] >> np.uint64(lo)) & mask(n)
+            value = value | (bits << np.uint64(dst))
+        return value
+
+    def eval_primitive(self, node):
+        prim = self.graph.primitives[node]
+        ins = {path: self.gather((node, path)) for path, _ in prim.inputs}
+        for path, value in prim.fn(ins).items():
+            self.values[(node, path)] = np.broadcast_to(
+                np.asarray(value, dtype=np.uint64), (self.batch,))
+
+    def eval_comb(self):
+        for node in self.order:
+            self.eval_primitive(node)
+        for path, _, is_input in self.graph.leaves[()]:
+            if not is_input:
+                self.values[((), path)] = self.gather(((), path))
+
+    def update_registers(self):
+        """
+        Updates the registers whose clock has an active edge, returning
+        True if any of them was updated.
+        """
+        updated = False
+        new_values = {}
+        for node in self.registers:
+            args = self.graph.primitives[node].args
+            clk = self.gather((node, ("clk",)))
+            prev = self.prev_clk[node]
+            self.prev_clk[node] = clk
+            if args.get("clk_posedge", 1):
+                edge = (prev == 0) & (clk == 1)
+            else:
+                edge = (prev == 1) & (clk == 0)
+            value = self.values[(node, ("out",))]
+            if edge.any():
+                updated = True
+                value = where(edge, self.gather((node, ("in",))), value)
+            if self.graph.primitives[node].ref.endswith("reg_arst"):
+                arst = self.gather((node, ("arst",)))
+                active = arst == np.uint64(args.get("arst_posedge", 1))
+                if active.any():
+                    updated = True
+                    value = where(active, np.uint64(args.get("init", 0)),
+                                  value)
+            new_values[(node, ("out",))] = value
+        # all registers sample their inputs before any of them is updated
+        self.values.update(new_values)
+        return updated
+
+    def evaluate(self):
+        self.eval_comb()
+        if self.update_registers():
+            self.eval_comb()
+
+    def leaf_key(self, port):
+        return ((), port_path(port.name))
+
+    def set_value(self, port, value):
+        """
+        Sets `port` to `value`, which may be a scalar (applied to all copies
+        of the circuit) or an array with one value per copy.
+        """
+        key = self.leaf_key(port)
+        if key not in self.inputs:
+            if isinstance(port, (m.ArrayType, m.TupleType)):
+                for child, child_value in zip(port, value):
+                    self.set_value(child, child_value)
+                return
+            raise ValueError(f"{port.debug_name} is not an input")
+        if isinstance(value, BitVector):
+            value = value.as_uint()
+        elif isinstance(value, (bool, Bit)):
+            value = int(value)
+        value = np.asarray(value)
+        if value.dtype.kind == "i":
+            # negative values are stored in two's complement
+            value = value.astype(np.int64)
+        value = value.astype(np.uint64) & mask(self.widths[key])
+        self.values[key] = np.broadcast_to(value, (self.batch,))
+
+    def get_value(self, port):
+        """
+        Returns the value of `port` as an array with one value per copy of the
+        circuit (or a list of such arrays for arrays of arrays and tuples).
+        """
+        key = self.leaf_key(port)
+        if key not in self.values:
+            if isinstance(port, (m.ArrayType, m.TupleType)):
+                return [self.get_value(child) for child in port]
+            raise ValueError(f"Could not find {port.debug_name}")
+        return self.values[key]
@@ -0,0 +1,64 @@
+import numpy as np
+import magma as m
+from hwtypes import BitVector
+import fault.actions
+import fault.value_utils as value_utils
+from fault.target import Target
+from fault.numpy_simulator import NumpySimulator
+
+
+class NumpyTarget(Target):
+    """
+    Runs actions on the vectorized NumpySimulator.  Poke values may be
+    arrays with one value per copy of the circuit (`batch` copies are
+    simulated at once), in which case expects are checked for every copy.
+    """
+    def __init__(self, circuit, clock=None, batch=1):
+        super().__init__(circuit)
+        self.clock = clock
+        self.batch = batch
+
+    @staticmethod
+    def check(got, port, expected):
+        if isinstance(got, list):
+            for i, child in enumerate(got):
+                NumpyTarget.check(child, port[i], expected[i])
+            return
+        if value_utils.is_any(expected):
+            return
+        if isinstance(expected, BitVector):
+            expected = expected.as_uint()
+        expected = np.asarray(expected)
+        if expected.dtype.kind == "i":
+            expected = expected.astype(np.int64)
+        width = 1 if isinstance(port, m._BitType) else len(port)
+        expected = expected.astype(np.uint64) & np.uint64((1 << width) - 1)
+        assert np.all(got == expected), f"Got {got}, expected {expected}"
+
+    def run(self, actions):
+        simulator = NumpySimulator(self.circuit, batch=self.batch)
+        for action in actions:
+            if isinstance(action, fault.actions.Poke):
+                simulator.set_value(action.port, action.value)
+            elif isinstance(action, fault.actions.Print):
+                values = tuple(int(simulator.get_value(port)[0])
+                               for port in action.ports)
+                print(f'{action.format_str}' % values)
+            elif isinstance(action, fault.actions.Expect):
+                got = simulator.get_value(action.port)
+                expected = action.value
+                if isinstance(expected, fault.actions.Peek):
+                    expected = simulator.get_value(expected.port)
+                NumpyTarget.check(got, action.port, expected)
+            elif isinstance(action, fault.actions.Eval):
+                simulator.evaluate()
+            elif isinstance(action, fault.actions.Step):
+                if self.clock is not action.clock:
+                    raise RuntimeError(f"Using different clocks: {self.clock}, "
+                                       f"{action.clock}")
+                for _ in range(action.steps):
+                    clock = simulator.get_value(action.clock)
+                    simulator.set_value(action.clock, clock ^ np.uint64(1))
+                    simulator.evaluate()
+            else:
+                raise NotImplementedError(action)
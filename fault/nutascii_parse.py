@@ -1,73 +1,155 @@
 try:
     import numpy as np
-    from scipy.interpolate import interp1d
 except ModuleNotFoundError:
     print('Failed to load libraries for nutascii_parse.')
+from fault.waveform import Waveform
 
 
-def nutascii_parse(file_):
-    # parse the file
+# number of bytes of ASCII values parsed at a time
+CHUNK_SIZE = 1 << 24
+
+
+def nutascii_parse(file_, signals=None):
+    """
+    Parses a SPICE raw file in ASCII (nutascii) or binary (nutbin) format,
+    returning a Waveform with the values of each variable over time.
+
+    `signals`: if not None, only the variables in this collection (compared
+        case-insensitively, since ngspice lowercases node names) are loaded.
+    """
+    with open(file_, 'rb') as f:
+        header = parse_header(f)
+        variables = header['variables']
+
+        # columns to keep
+        wanted = signal_filter(signals)
+        keep = [k for k, variable in enumerate(variables)
+                if variable == 'time' or wanted(variable)]
+
+        if header['format'] == 'Binary':
+            columns = parse_binary(f, header, keep)
+        else:
+            columns = parse_ascii(f, header, keep)
+
+    # return the values of all variables other than time, which is shared
+    time_vec = columns[variables.index('time')]
+    return Waveform(time_vec, {variables[k]: columns[k] for k in keep
+                               if variables[k] != 'time'})
+
+
+def signal_filter(signals):
+    # returns a predicate telling whether a variable is one of `signals`
+    if signals is None:
+        return lambda variable: True
+    names = set()
+    for signal in signals:
+        names.add(f'{signal}'.lower())
+        names.add(f'{signal}'.split('.')[-1].lower())
+    return lambda variable: variable.lower() in names
+
+
+def parse_header(f):
+    # read header lines up to the start of the data ("Values:" or "Binary:")
+    header = {'variables': [], 'points': None, 'flags': '', 'values': []}
     section = None
-    variables = []
-    values = []
-    with open(file_, 'r') as f:
-        for line in f:
-            # split line into tokens
-            tokens = line.strip().split()
-            if len(tokens) == 0:
-                continue
-
-            # change section mode if needed
-            if tokens[0] == 'Values:':
-                section = 'Values'
-                tokens = tokens[1:]
-            elif tokens[0] == 'Variables:':
-                section = 'Variables'
-                tokens = tokens[1:]
-
-            # parse data in a section-dependent manner
-            if section == 'Variables' and len(tokens) >= 2:
-                # sanity check
-                assert int(tokens[0]) == len(variables), 'Out of sync while parsing variables.'  # noqa
-                # add variable
-                variables.append(tokens[1])
-            elif section == 'Values':
-                # start a new list if needed
-                for token in tokens:
-                    # special handling for first entry
-                    if not values or len(values[-1]) == len(variables):
-                        # sanity check
-                        assert int(token) == len(values), 'Out of sync while parsing values.'  # noqa
-                        # clear the value_start flag and start a new
-                        # list of values
-                        values.append([])
-                        continue
-                    else:
-                        values[-1].append(float(token))
-    # sanity check
-    if len(values) > 0:
-        assert len(values[-1]) == len(variables), 'Missing values at end of file.'  # noqa
-
-    # get vector of time values
-    time_vec = np.array([value[variables.index('time')]
-                         for value in values])
-
-    # return a dictionary of time-to-value interpolators
-    results = {}
-    for k, variable in enumerate(variables):
-        # skip time variable -- no need to interpolate time to itself
-        if variable == 'time':
+    while True:
+        line = f.readline()
+        if not line:
+            raise Exception('Missing data section in raw file.')
+        tokens = line.decode('ascii', errors='replace').strip().split()
+        if len(tokens) == 0:
+            continue
+
+        # change section mode if needed
+        if tokens[0] in {'Values:', 'Binary:'}:
+            header['format'] = tokens[0][:-1]
+            # ASCII values may start on the same line
+            header['values'] = line.split()[1:]
+            break
+        elif tokens[0] == 'Variables:':
+            section = 'Variables'
+            tokens = tokens[1:]
+        elif tokens[:2] == ['No.', 'Points:']:
+            header['points'] = int(tokens[2])
+            continue
+        elif tokens[0] == 'Flags:':
+            header['flags'] = ' '.join(tokens[1:])
             continue
 
-        # create vector values for this variable
-        value_vec = np.array([value[k] for value in values])
+        # parse data in a section-dependent manner
+        if section == 'Variables' and len(tokens) >= 2:
+            # sanity check
+            assert int(tokens[0]) == len(header['variables']), 'Out of sync while parsing variables.'  # noqa
+            # add variable
+            header['variables'].append(tokens[1])
+
+    if 'complex' in header['flags']:
+        raise NotImplementedError('Complex raw files are not supported.')
+    if 'time' not in header['variables']:
+        raise Exception('No time variable in raw file.')
+    return header
+
+
+def parse_ascii(f, header, keep):
+    # Values are parsed a chunk of lines at a time and written directly into
+    # preallocated arrays (grown by doubling when the number of points isn't
+    # given in the header).  Each point is an index followed by one token per
+    # variable, possibly spread over several lines.
+    width = len(header['variables']) + 1
+    size = header['points'] if header['points'] is not None else 1024
+    columns = {k: np.empty(size) for k in keep}
+    n = 0
+    leftover = header['values']
+    while True:
+        lines = f.readlines(CHUNK_SIZE)
+        tokens = leftover + [token for line in lines for token in line.split()]
+        if not lines and len(tokens) % width != 0:
+            raise Exception('Missing values at end of file.')
+        count = len(tokens) // width
+        leftover = tokens[count * width:]
+        if count > 0:
+            values = np.array(tokens[:count * width],
+                              dtype=float).reshape(count, width)
+            # sanity check
+            assert np.array_equal(values[:, 0], np.arange(n, n + count)), 'Out of sync while parsing values.'  # noqa
+            if n + count > size:
+                size = max(2 * size, n + count)
+                for k in keep:
+                    columns[k] = np.resize(columns[k], size)
+            for k in keep:
+                columns[k][n:n + count] = values[:, k + 1]
+            n += count
+        if not lines:
+            break
+    return {k: column[:n] for k, column in columns.items()}
+
 
-        # create interpolator
-        result = interp1d(time_vec, value_vec, bounds_error=False,
-                          fill_value=(value_vec[0], value_vec[-1]))
+def parse_binary(f, header, keep):
+    # Points are stored as one double per variable.  The raw file doesn't
+    # specify the byte order, so use whichever one makes the time axis valid.
+    nvars = len(header['variables'])
+    offset = f.tell()
+    f.seek(0, 2)
+    available = (f.tell() - offset) // (8 * nvars)
+    points = available if header['points'] is None \
+        else min(header['points'], available)
+    if points == 0:
+        return {k: np.empty(0) for k in keep}
+    time_index = header['variables'].index('time')
+    data = None
+    for dtype in ['<f8', '>f8']:
+        data = np.memmap(f, dtype=dtype, mode='r', offset=offset,
+                         shape=(points, nvars))
+        if valid_time(data[:, time_index]):
+            break
+    return {k: np.array(data[:, k], dtype=float) for k in keep}
 
-        # add interpolator to dictionary
-        results[variable] = result
 
-    # return results
-    return results
+def valid_time(time_vec):
+    # time values are finite, non-negative and non-decreasing
+    with np.errstate(all='ignore'):
+        if not np.all(np.isfinite(time_vec)):
+            return False
+        if len(time_vec) > 0 and time_vec[0] < 0:
+            return False
+        return bool(np.all(np.diff(time_vec) >= 0))
@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+
+
+# Function being mapped by fork_map.  Worker processes inherit it when they
+# are forked, so it doesn't have to be picklable (e.g. it may refer to magma
+# circuits or Testers).
+_func = None
+
+
+def _call(arg):
+    return _func(arg)
+
+
+def fork_map(func, args, processes=None):
+    """
+    Returns [func(arg) for arg in args], computed by a pool of `processes`
+    worker processes (defaults to the number of CPUs).  Only `args` and the
+    return values have to be picklable, since the workers are forked from the
+    current process.  Falls back to computing the results serially when
+    `processes` is 1 or fork isn't available on this platform.
+    """
+    global _func
+    args = list(args)
+    if processes is None:
+        processes = os.cpu_count()
+    processes = min(processes, len(args))
+    if processes <= 1 or \
+            'fork' not in multiprocessing.get_all_start_methods():
+        return [func(arg) for arg in args]
+    _func = func
+    try:
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            # chunksize=1 since jobs (e.g. simulations) can vary widely in
+            # runtime
+            return pool.map(_call, args, chunksize=1)
+    finally:
+        _func = None
+
+
+def fork_imap(func, args, processes=None):
+    """
+    Like fork_map, but yields the results as they are computed, in the order
+    they complete rather than the order of `args`.  Closing the generator
+    early terminates the workers.
+    """
+    global _func
+    args = list(args)
+    if processes is None:
+        processes = os.cpu_count()
+    processes = min(processes, len(args))
+    if processes <= 1 or \
+            'fork' not in multiprocessing.get_all_start_methods():
+        for arg in args:
+            yield func(arg)
+        return
+    _func = func
+    try:
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            yield from pool.imap_unordered(_call, args, chunksize=1)
+    finally:
+        _func = None
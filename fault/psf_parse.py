@@ -1,17 +1,28 @@
 import re
+from array import array
+from fault.nutascii_parse import signal_filter
 try:
     import numpy as np
-    from scipy.interpolate import interp1d
 except ModuleNotFoundError:
     print('Failed to load libraries for psf_parse.')
+from fault.waveform import Waveform
 
 
-def psf_parse(file_):
+def psf_parse(file_, signals=None):
+    """
+    Parses a PSF ASCII file, returning a Waveform with the values of each
+    variable over time.  Values are accumulated in compact arrays
+    of doubles rather than lists of Python floats.
+
+    `signals`: if not None, only the variables in this collection are
+        loaded.
+    """
     # parse the file
     section = None
     read_mode = None
     variables = []
-    values = []
+    times = array('d')
+    values = array('d')
     with open(file_, 'r') as f:
         for line in f:
             # split line into tokens and strip quotes
@@ -43,15 +54,17 @@ def psf_parse(file_):
                     elif token == 'group':
                         read_mode = 'group'
                     elif read_mode == 'TIME':
-                        values.append((float(token), []))
+                        times.append(float(token))
                         read_mode = None
                     elif read_mode == 'group':
-                        values[-1][1].append(float(token))
+                        values.append(float(token))
                     else:
                         raise Exception('Unknown token parsing state.')
 
-    # get vector of time values
-    time_vec = np.array([value[0] for value in values])
+    # get vector of time values, and one row of values per time
+    time_vec = np.frombuffer(times, dtype=float)
+    value_mat = np.frombuffer(values, dtype=float).reshape(
+        len(time_vec), len(variables))
 
     # re-name voltage variables for consistency
     renamed = []
@@ -62,18 +75,10 @@ def psf_parse(file_):
         else:
             renamed.append(variable)
 
-    # return a dictionary of time-to-value interpolators
-    results = {}
+    # return the values of the requested variables
+    columns = {}
+    wanted = signal_filter(signals)
     for k, variable in enumerate(renamed):
-        # create vector values for this variable
-        value_vec = np.array([value[1][k] for value in values])
-
-        # create interpolator
-        result = interp1d(time_vec, value_vec, bounds_error=False,
-                          fill_value=(value_vec[0], value_vec[-1]))
-
-        # add interpolator to dictionary
-        results[variable] = result
-
-    # return results
-    return results
+        if wanted(variable):
+            columns[variable] = np.array(value_mat[:, k])
+    return Waveform(time_vec, columns)
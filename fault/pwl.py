@@ -1,42 +1,67 @@
-def pwc_to_pwl(pwc, t_stop, t_tr, init=0):
+import numpy as np
+
+
+def pwc_to_pwl_array(times, values, t_stop, t_tr, init=0):
+    """
+    Converts a piecewise-constant stimulus (steps to `values` at
+    non-decreasing `times`) into a piecewise-linear waveform in which each
+    step is a ramp of duration `t_tr`, returned as an array of (time, value)
+    rows.
+
+    The stimulus starts at `init` unless there is a step at time 0.  When
+    there are several steps at the same time, only the last one is kept, and
+    a ramp that would overlap the next step is cut short to end halfway to
+    it.  The waveform ends at `t_stop` with the last value.
+    """
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+
     # add initial value if necessary
-    if len(pwc) == 0 or pwc[0][0] != 0:
-        pwc = pwc.copy()
-        pwc.insert(0, (0, init))
-
-    # then create piecewise-linear implementation
-    # of the piecewise-constant stimulus
-    retval = [pwc[0]]
-    for k in range(1, len(pwc)):
-        t_prev, v_prev = pwc[k - 1]
-        t_curr, v_curr = pwc[k]
-
-        if retval[-1][0] >= t_curr:
-            assert retval[-2][0] <= t_curr, \
-                    'non-increasing pwc steps at time' % t_curr
-            if retval[-2][0] == t_curr:
-                # two values at the same time, just drop the earlier
-                #print('dropping old thing')
-                retval.pop()
-                old_t, old_v = retval.pop()
-                v_prev = old_v
-                #print('prev is now', retval[-2:])
-            else:
-                # make the previous thing happen faster than t_tr
-                #print('DOING THE HALFWAY THING')
-                halfway_time = (retval[-2][0] + t_curr)/2
-                retval[-1] = (halfway_time, retval[-1][1])
-
-        #print('times', t_curr, t_curr + t_tr)
-        retval += [(t_curr, v_prev)]
-        retval += [(t_curr + t_tr, v_curr)]
-
-    # add final value
-    # cut off anything after t_stop
-    while len(retval) > 0 and retval[-1][0] >= t_stop:
-        #print('removing one from end')
-        retval.pop()
-    retval += [(t_stop, pwc[-1][1])]
-
-    # return new waveform
-    return retval
+    if len(times) == 0 or times[0] != 0:
+        times = np.insert(times, 0, 0)
+        values = np.insert(values, 0, init)
+    last = values[-1]
+
+    # two values at the same time, just keep the later one
+    keep = np.append(times[1:] != times[:-1], True)
+    times, values = times[keep], values[keep]
+
+    # each step is a ramp from the previous value, ending t_tr later or
+    # halfway to the next step if that comes first
+    starts = times[1:]
+    ends = starts + t_tr
+    following = np.append(times[2:], np.inf)
+    ends = np.where(ends >= following, (starts + following) / 2, ends)
+
+    pwl = np.empty((2 * len(times) - 1, 2))
+    pwl[0] = times[0], values[0]
+    pwl[1::2, 0] = starts
+    pwl[1::2, 1] = values[:-1]
+    pwl[2::2, 0] = ends
+    pwl[2::2, 1] = values[1:]
+
+    # cut off anything after t_stop, and add final value
+    pwl = pwl[:np.searchsorted(pwl[:, 0], t_stop, side='left')]
+    return np.append(pwl, [[t_stop, last]], axis=0)
+
+
+def pwc_to_pwl(pwc, t_stop, t_tr, init=0):
+    """
+    Same as pwc_to_pwl_array, for a stimulus given as a list of (time,
+    value) steps.  Returns a list of (time, value) tuples.
+    """
+    if len(pwc) == 0:
+        times, values = [], []
+    else:
+        times, values = zip(*pwc)
+    pwl = pwc_to_pwl_array(times, values, t_stop, t_tr, init=init)
+    return [tuple(point) for point in pwl.tolist()]
+
+
+def write_pwl_file(file_, pwl):
+    """
+    Writes a PWL waveform (rows of time and value) to `file_` as two
+    whitespace-separated columns, the format read by the PWL file options
+    of ngspice, Spectre and HSPICE.
+    """
+    np.savetxt(file_, np.asarray(pwl, dtype=float), fmt='%.15g')
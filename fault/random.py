@@ -1,12 +1,17 @@
-
+import hashlib
+import json
+import os
+import tempfile
 import typing as tp
 import random
 import itertools as it
+from pathlib import Path
 from hwtypes import AbstractBitVector, AbstractBit
 from hwtypes import BitVector, Bit, SIntVector
 from hwtypes import z3BitVector, z3Bit
 from collections.abc import Mapping
 import z3
+from fault.parallel import fork_imap
 
 
 def constrained_random_bv(width, pred):
@@ -65,6 +70,18 @@ class FrozenDict(Mapping):
         return f'{type(self).__name__}({repr(self._d)})'
 
 
+def _frozendict_to_ints(solution):
+    # picklable/JSON form of a solution, with the values in label order
+    return [int(bool(v)) if isinstance(v, AbstractBit) else v.as_uint()
+            for v in solution.values()]
+
+
+def _ints_to_frozendict(widths, values):
+    return FrozenDict({k: Bit(bool(value)) if w is None else
+                       BitVector[w](value)
+                       for (k, w), value in zip(widths.items(), values)})
+
+
 def _model_to_frozendict(v_map, model):
     d = {}
     for k, v in v_map.items():
@@ -77,12 +94,17 @@ def _model_to_frozendict(v_map, model):
     return FrozenDict(d)
 
 
+DEFAULT_SOLUTION_CACHE = Path.home() / '.fault' / 'smt_cache'
+
+
 class ConstrainedRandomGenerator:
     def __init__(self,
                  alpha_min: float = 0.1,
                  epoch_length: int = 6,
                  max_epochs: int = 100,
                  call_timeout: int = 10,
+                 processes: tp.Optional[int] = 1,
+                 solution_cache=None,
                  ):
         '''
         alpha_min : Min hit rate before beginning a new epoch,
@@ -90,6 +112,12 @@ class ConstrainedRandomGenerator:
         random outputs but be slower
         max_epochs : maximum number of epochs to run for
         call_timout : per call timeout
+        processes : number of worker processes running epochs in parallel,
+        each with its own solver (None for the number of CPUs)
+        solution_cache : directory where the solutions found for a predicate
+        are saved, keyed by a hash of its z3 expression, so that later calls
+        with the same predicate start from them (True for
+        ~/.fault/smt_cache, None to disable)
         for full details see:
         https://people.eecs.berkeley.edu/~ksen/papers/smtsampler.pdf
         '''
@@ -97,10 +125,19 @@ class ConstrainedRandomGenerator:
         self.epoch_length = epoch_length
         self.max_epochs = max_epochs
         self.call_timeout = call_timeout
+        self.processes = processes
+        if solution_cache is True:
+            solution_cache = DEFAULT_SOLUTION_CACHE
+        self.solution_cache = solution_cache
+        self.solver_pid = None
 
-    def _init_solver(self):
+    def _init_solver(self, v_map, pred):
         self.solver = z3.Optimize()
         self.solver.set('timeout', self.call_timeout)
+        # The predicate is asserted once, each search only pushes (and pops)
+        # its own constraints
+        self.solver.add(pred(**v_map).value)
+        self.solver_pid = os.getpid()
 
     def __call__(self,
                  v_map: tp.Mapping[str, tp.Optional[int]],
@@ -113,47 +150,161 @@ class ConstrainedRandomGenerator:
             (v : AbstractBitVector[w] for v,w in v_map.items()) -> AbstractBit
         N: Numbers of samples
         '''
-        self._init_solver()
-        alpha_min = self.alpha_min
-        epoch_length = self.epoch_length
+        return set(self.iter_samples(v_map, pred, N))
 
+    def iter_samples(self,
+                     v_map: tp.Mapping[str, tp.Optional[int]],
+                     pred: tp.Callable[..., AbstractBit],
+                     N: int,
+                     ) -> tp.Iterator[tp.Mapping[str, BitVector]]:
+        '''
+        Yields up to N distinct samples as they are found (see __call__).
+        Cached solutions are yielded first.
+        '''
+        widths = dict(v_map)
         v_map = {k: z3BitVector[w]() if w is not None else z3Bit()
-                 for k, w in v_map.items()}
+                 for k, w in widths.items()}
+        cache_file = self._cache_file(widths, v_map, pred)
+        cached = self._load_cache(cache_file, widths)
         solutions = set()
+        try:
+            for solution in cached:
+                if len(solutions) >= N:
+                    return
+                solutions.add(solution)
+                yield solution
+            for epoch in self._epochs(widths, v_map, pred, N):
+                if epoch is None:
+                    break
+                for solution in epoch:
+                    if len(solutions) >= N:
+                        return
+                    if solution not in solutions:
+                        solutions.add(solution)
+                        yield solution
+                if len(solutions) >= N:
+                    return
+        finally:
+            if cache_file is not None and not solutions <= set(cached):
+                self._save_cache(cache_file, widths, set(cached) | solutions)
+
+    def _epochs(self, widths, v_map, pred, N):
+        '''
+        Yields the solutions found by each epoch (None if the predicate is
+        unsatisfiable).
+        '''
+        processes = self.processes
+        if processes == 1:
+            self._init_solver(v_map, pred)
+            for _ in range(self.max_epochs):
+                yield self._epoch(v_map, pred, N)
+            return
+
+        # Epochs are independent, so they run in worker processes, each
+        # with its own solver and random seed.  Solutions are sent back as
+        # ints.
+        def run_epoch(seed):
+            if self.solver_pid != os.getpid():
+                self.worker_v_map = {
+                    k: z3BitVector[w]() if w is not None else z3Bit()
+                    for k, w in widths.items()}
+                self._init_solver(self.worker_v_map, pred)
+            random.seed(seed)
+            epoch = self._epoch(self.worker_v_map, pred, N)
+            if epoch is None:
+                return None
+            return [_frozendict_to_ints(solution) for solution in epoch]
+
+        self.solver_pid = None
+        seeds = [random.getrandbits(64) for _ in range(self.max_epochs)]
+        for epoch in fork_imap(run_epoch, seeds, processes):
+            if epoch is None:
+                yield None
+            else:
+                yield [_ints_to_frozendict(widths, solution)
+                       for solution in epoch]
 
-        for _ in range(self.max_epochs):
-            seen = set()
-            if len(solutions) >= N:
-                break
-            seed = self._generate_random(v_map)
-            seen.add(seed)
-            init = self._find_closest(v_map, pred, seed)
+    def _epoch(self, v_map, pred, N):
+        '''
+        Runs an epoch: finds the solution closest to a random seed, then its
+        neighbors and their combinations.  Returns the solutions found
+        (stopping after N), or None if the predicate is unsatisfiable.
+        '''
+        alpha_min = self.alpha_min
+        epoch_length = self.epoch_length
 
-            if init is None:
-                break
+        seen = set()
+        seed = self._generate_random(v_map)
+        seen.add(seed)
+        init = self._find_closest(v_map, pred, seed)
 
-            solutions.add(init)
-            seen.add(init)
+        if init is None:
+            return None
 
-            if epoch_length <= 0:
-                continue
+        solutions = {init}
+        seen.add(init)
 
-            S1 = self._compute_neighbors(v_map, pred, init, seen)
+        if epoch_length <= 0:
+            return solutions
 
-            seen |= S1
-            solutions |= S1
+        S1 = self._compute_neighbors(v_map, pred, init, seen)
 
-            Sk = S1
-            alpha = 1
-            for k in range(1, epoch_length + 1):
-                if alpha < alpha_min or len(solutions) >= N:
-                    break
-                Sk, alpha, seen = self._combine(v_map, Sk, S1, init, seen,
-                                                pred, N - len(solutions))
-                solutions |= Sk
+        seen |= S1
+        solutions |= S1
+
+        Sk = S1
+        alpha = 1
+        for k in range(1, epoch_length + 1):
+            if alpha < alpha_min or len(solutions) >= N:
+                break
+            Sk, alpha, seen = self._combine(v_map, Sk, S1, init, seen,
+                                            pred, N - len(solutions))
+            solutions |= Sk
 
         return solutions
 
+    def _cache_file(self, widths, v_map, pred):
+        '''
+        Returns the path of the cache file for `pred`, which is named by a
+        hash of its z3 expression (with the variables renamed to their
+        labels) and the widths of the variables.
+        '''
+        if self.solution_cache is None:
+            return None
+        renaming = []
+        for k, v in v_map.items():
+            if widths[k] is None:
+                renaming.append((v.value, z3.Bool(k)))
+            else:
+                renaming.append((v.value, z3.BitVec(k, widths[k])))
+        expr = z3.substitute(pred(**v_map).value, *renaming)
+        hasher = hashlib.sha256()
+        hasher.update(json.dumps(sorted(widths.items())).encode())
+        hasher.update(expr.sexpr().encode())
+        return Path(self.solution_cache).expanduser() / \
+            f'{hasher.hexdigest()}.json'
+
+    @staticmethod
+    def _load_cache(cache_file, widths):
+        if cache_file is None or not cache_file.is_file():
+            return []
+        with open(cache_file) as f:
+            solutions = json.load(f)
+        return [_ints_to_frozendict(widths, solution)
+                for solution in solutions]
+
+    @staticmethod
+    def _save_cache(cache_file, widths, solutions):
+        os.makedirs(cache_file.parent, exist_ok=True)
+        solutions = sorted(_frozendict_to_ints(solution)
+                           for solution in solutions)
+        # write to a temporary file first so that readers never see a
+        # partially-written file
+        fd, tmp = tempfile.mkstemp(dir=cache_file.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(solutions, f)
+        os.replace(tmp, cache_file)
+
     def _generate_random(self, v_map):
         '''
         Generates a random seed for an epoch
@@ -171,15 +322,14 @@ class ConstrainedRandomGenerator:
 
     def _find_closest(self, v_map, pred, seed):
         '''
-        Finds the closest the solution to the seed solution by asserting the
-        predicate (pred) and soft constraints that each bit in the solution is
+        Finds the closest the solution to the seed solution by adding
+        soft constraints that each bit in the solution is
         equal to the same bit in the seed.  The solver will try to maximize the
         number of soft constraints satisfied.
         '''
         solver = self.solver
         solver.push()
         solver.set('timeout', self.call_timeout * 4)
-        solver.add(pred(**v_map).value)
         for k, v in v_map.items():
             assignment = seed[k]
             if isinstance(v, AbstractBitVector):
@@ -194,6 +344,7 @@ class ConstrainedRandomGenerator:
             solver.pop()
             return _model_to_frozendict(v_map, model)
         else:
+            solver.pop()
             return None
 
     def _compute_neighbors(self, v_map, pred, init, seen):
@@ -207,7 +358,7 @@ class ConstrainedRandomGenerator:
                 for i in range(v.size):
                     conditions.append(v[i] == init[k][i])
             elif isinstance(v, AbstractBit):
-                conditions.apppend(v == init[k])
+                conditions.append(v == init[k])
             else:
                 raise TypeError()
         S1 = set()
@@ -224,7 +375,6 @@ class ConstrainedRandomGenerator:
         solver = self.solver
         solver.push()
         solver.set('timeout', self.call_timeout)
-        solver.add(pred(**v_map).value)
         solver.add((~c).value)
         solver.push()
         for c_ in conditions:
@@ -287,3 +437,61 @@ class ConstrainedRandomGenerator:
         for k, v in init.items():
             assignment[k] = v ^ ((v ^ sa[k]) | (v ^ sb[k]))
         return FrozenDict(assignment)
+
+
+def is_symbolic_pred(width, pred):
+    '''
+    Returns whether `pred` can be evaluated on a symbolic bit vector of
+    `width` bits, as required by ConstrainedRandomGenerator.
+    '''
+    try:
+        return z3.is_expr(pred(z3BitVector[width]()).value)
+    except (TypeError, AttributeError, ValueError, z3.Z3Exception):
+        return False
+
+
+def sample_constrained_bvs(width, pred, n, sampler='auto', probe=256,
+                           min_hit_rate=0.05, max_distinct=4096,
+                           generator=None):
+    '''
+    Returns a list of `n` random values (as ints) of `width` bits for which
+    `pred` holds.
+
+    sampler : 'rejection' draws random values until `pred` holds (which may
+    take forever if it rarely does), 'smt' uses a ConstrainedRandomGenerator
+    (`generator`, or one with the default options), and 'auto' uses
+    rejection sampling if at least `min_hit_rate` of `probe` random values
+    satisfy `pred`, and the SMT sampler otherwise.  The SMT sampler calls
+    `pred` on a symbolic bit vector, so it needs a predicate written with
+    bit vector operations only (no int(), as_uint() or branching on the
+    value); 'auto' uses rejection sampling for other predicates.
+    max_distinct : maximum number of distinct values found by the SMT
+    sampler, the rest of the values are drawn from them
+    '''
+    values = []
+    if sampler == 'auto':
+        for _ in range(probe):
+            value = random_bv(width)
+            if pred(value):
+                values.append(value.as_uint())
+        if len(values) >= min_hit_rate * probe or \
+                not is_symbolic_pred(width, pred):
+            sampler = 'rejection'
+        else:
+            sampler = 'smt'
+            values = []
+    if sampler == 'rejection':
+        values += [constrained_random_bv(width, pred).as_uint()
+                   for _ in range(n - len(values))]
+        return values[:n]
+    if sampler != 'smt':
+        raise ValueError(f"Unknown sampler {sampler}")
+    if generator is None:
+        generator = ConstrainedRandomGenerator()
+    values = [solution['x'].as_uint() for solution in generator.iter_samples(
+        {'x': width}, lambda x: pred(x), min(n, max_distinct))]
+    if len(values) == 0:
+        raise ValueError("No value satisfies the predicate")
+    # solutions of the same epoch are close to each other
+    random.shuffle(values)
+    return values + [random.choice(values) for _ in range(n - len(values))]
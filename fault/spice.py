@@ -1,3 +1,4 @@
+import numpy as np
 from fault.codegen import CodeGenerator
 
 
@@ -19,6 +20,16 @@ class SpiceNetlist(CodeGenerator):
             line += [f'{p}']
         self.println(' '.join(line))
 
+    def param(self, **kwargs):
+        line = []
+        line += ['.param']
+        for key, val in kwargs.items():
+            line += [f'{key}={val}']
+        self.println(' '.join(line))
+
+    def temp(self, temp):
+        self.println(f'.temp {temp}')
+
     def include(self, file_):
         self.println(f'.include {file_}')
 
@@ -50,7 +61,12 @@ class SpiceNetlist(CodeGenerator):
         port_str = ' '.join(f'{port}' for port in ports)
         self.println(f'X{inst_name} {port_str} {name}')
 
-    def voltage(self, p, n, dc=None, pwl=None, inst_name=None):
+    def voltage(self, p, n, dc=None, pwl=None, pulse=None, sin=None,
+                pwl_file=None, pwl_file_kw='file', inst_name=None):
+        # pwl: sequence of (t, v) points, e.g. a two-column array
+        # pulse: (v1, v2, td, tr, tf, pw, per)
+        # sin: (vo, va, freq, td, theta, phase)
+        # pwl_file: file of (t, v) points, referenced as PWL pwl_file_kw=...
         # set defaults
         if inst_name is None:
             inst_name = f'{next(self.inst_count)}'
@@ -64,8 +80,15 @@ class SpiceNetlist(CodeGenerator):
         if dc is not None:
             line += ['DC', f'{dc}']
         if pwl is not None:
-            pwl_str = ' '.join(f'{t} {v}' for t, v in pwl)
+            points = np.asarray(pwl).tolist()
+            pwl_str = ' '.join(f'{t} {v}' for t, v in points)
             line += [f'PWL({pwl_str})']
+        if pwl_file is not None:
+            line += [f'PWL {pwl_file_kw}="{pwl_file}"']
+        if pulse is not None:
+            line += [f"PULSE({' '.join(f'{x}' for x in pulse)})"]
+        if sin is not None:
+            line += [f"SIN({' '.join(f'{x}' for x in sin)})"]
 
         # print the line
         self.println(' '.join(line))
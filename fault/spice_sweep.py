@@ -0,0 +1,151 @@
+import inspect
+import itertools
+import os
+import traceback
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+import numpy as np
+from fault.actions import Read
+from fault.spice_target import SpiceTarget
+
+
+class SweepResult:
+    """
+    Results of spice_sweep.  `table` is a structured array with one row per
+    sweep point, with a field for each swept parameter, a boolean `passed`
+    field, and a field for each named read.  `errors` holds the traceback of
+    each failed point (None for points that passed), and `directories` the
+    directory each point was simulated in.
+    """
+    def __init__(self, table, errors, directories):
+        self.table = table
+        self.errors = errors
+        self.directories = directories
+
+    def __getitem__(self, key):
+        return self.table[key]
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def passed(self):
+        return bool(np.all(self.table['passed']))
+
+
+def sweep_points(grid):
+    """
+    Returns the list of sweep points (dictionaries of parameter values) for
+    `grid`, which is either a dictionary mapping each parameter to a list of
+    values (all combinations are swept) or already a list of points.
+    """
+    if isinstance(grid, dict):
+        names = list(grid.keys())
+        return [dict(zip(names, values))
+                for values in itertools.product(*grid.values())]
+    return [dict(point) for point in grid]
+
+
+def spice_sweep(tester, grid, reads=None, processes=None,
+                directory="build/sweep", **kwargs):
+    """
+    Runs the actions of `tester` with SpiceTarget at every point of a
+    parameter sweep, running the simulations concurrently.
+
+    `grid`: dictionary mapping parameters to lists of values (the sweep is
+        their cartesian product), or a list of dictionaries, one per point.
+        Parameters are either SpiceTarget arguments (e.g. "vsup",
+        "model_paths", "temp") or netlist parameters (written as .param
+        statements, e.g. for model corners or Monte Carlo seeds).
+
+    `reads`: dictionary mapping names to Read actions of `tester`, whose
+        values are collected into the fields of the same name.
+
+    `processes`: number of simulations run at the same time (defaults to the
+        number of CPUs)
+
+    `directory`: each point is simulated in <directory>/point_<k>
+
+    Any other keyword arguments are passed to SpiceTarget.
+    """
+    reads = reads if reads is not None else {}
+    points = sweep_points(grid)
+    target_args = set(inspect.signature(SpiceTarget).parameters)
+    # arguments set by spice_sweep itself can't be swept or passed through
+    # (netlist parameters are swept by name, and params gives their
+    # defaults)
+    names = set(kwargs) - {'params'}
+    for point in points:
+        names |= set(point)
+    reserved = sorted(names & {'circuit', 'directory', 'params'})
+    if reserved:
+        raise ValueError(f'Arguments set by spice_sweep cannot be swept or '
+                         f'passed to SpiceTarget: '
+                         f'{", ".join(map(repr, reserved))}')
+    directory = Path(directory)
+
+    # Compile the actions and write the netlists (serially, since this is
+    # cheap).  Reads are replaced by a copy for each point so that their
+    # values don't overwrite each other.
+    jobs = []
+    for k, point in enumerate(points):
+        target_kwargs = dict(kwargs)
+        params = dict(target_kwargs.pop('params', {}))
+        for name, value in point.items():
+            if name in target_args:
+                target_kwargs[name] = value
+            else:
+                params[name] = value
+        target = SpiceTarget(tester._circuit,
+                             directory=str(directory / f'point_{k}'),
+                             params=params, **target_kwargs)
+        point_reads = {}
+        actions = []
+        for action in tester.actions:
+            if isinstance(action, Read):
+                copied = Read(action.port, action.style, action.params)
+                point_reads[id(action)] = copied
+                action = copied
+            actions.append(action)
+        comp = target.compile(actions)
+        tb_file = target.write_test_bench(comp)
+        jobs.append((target, comp, tb_file, point_reads))
+
+    def run_point(job):
+        target, comp, tb_file, point_reads = job
+        try:
+            results = target.simulate(tb_file, comp)
+            target.process_results(results, comp)
+        except Exception:
+            return traceback.format_exc(), {}
+        return None, {name: point_reads[id(read)].value
+                      for name, read in reads.items()}
+
+    if processes is None:
+        processes = os.cpu_count()
+    # threads are enough, since the work is done by the simulator processes
+    with ThreadPool(processes) as pool:
+        outcomes = pool.map(run_point, jobs, chunksize=1)
+
+    # collect everything into a structured array
+    fields = list(points[0].keys()) if points else []
+    columns = [[point[name] for point in points] for name in fields]
+    fields.append('passed')
+    columns.append([error is None for error, _ in outcomes])
+    for name in reads:
+        fields.append(name)
+        columns.append([values.get(name, np.nan) for _, values in outcomes])
+    dtype = [(name, column_dtype(column))
+             for name, column in zip(fields, columns)]
+    table = np.array(list(zip(*columns)), dtype=dtype)
+
+    return SweepResult(table, [error for error, _ in outcomes],
+                       [target.directory for target, *_ in jobs])
+
+
+def column_dtype(column):
+    if all(isinstance(x, (bool, np.bool_)) for x in column):
+        return bool
+    if all(isinstance(x, (int, float, np.number)) for x in column):
+        return float
+    return object
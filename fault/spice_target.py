@@ -1,4 +1,6 @@
 import os
+import re
+import math
 from pathlib import Path
 from copy import copy
 import magma as m
@@ -10,10 +12,14 @@ from fault.spice import SpiceNetlist
 from fault.nutascii_parse import nutascii_parse
 from fault.psf_parse import psf_parse
 from fault.subprocess_run import subprocess_run
-from fault.pwl import pwc_to_pwl
+from fault.pwl import pwc_to_pwl_array, write_pwl_file
 from fault.actions import Poke, Expect, Delay, Print, Read
 from fault.select_path import SelectPath
-from fault.background_poke import process_action_list
+from fault.background_poke import (process_action_list,
+                                   extract_periodic_sources)
+import fault.instrumentation as instrumentation
+# edge finder is used for measuring phase, freq, etc.
+from fault.waveform import Signal, EdgeNotFoundError
 
 
 # define a custom error for A2D conversion to make it easier
@@ -22,13 +28,12 @@ from fault.background_poke import process_action_list
 class A2DError(Exception):
     pass
 
-# edge finder is used for measuring phase, freq, etc.
-class EdgeNotFoundError(Exception):
-    pass
 
 class CompiledSpiceActions:
-    def __init__(self, pwls, checks, prints, reads, stop_time, saves):
+    def __init__(self, pwls, checks, prints, reads, stop_time, saves,
+                 sources=None):
         self.pwls = pwls
+        self.sources = sources if sources is not None else []
         self.checks = checks
         self.prints = prints
         self.reads = reads
@@ -42,7 +47,8 @@ class SpiceTarget(Target):
                  t_step=None, clock_step_delay=5e-9, t_tr=0.2e-9, vil_rel=0.4,
                  vih_rel=0.6, rz=1e9, conn_order='alpha', bus_delim='<>',
                  bus_order='descend', flags=None, ic=None,
-                 disp_type='on_error'):
+                 disp_type='on_error', raw_format=None, temp=None,
+                 params=None, native_sources=True, pwl_file_threshold=None):
         """
         circuit: a magma circuit
 
@@ -93,6 +99,28 @@ class SpiceTarget(Target):
         disp_type: 'on_error', 'realtime'.  If 'on_error', only print if there
                    is an error.  If 'realtime', print out STDOUT as lines come
                    in, then print STDERR after the process completes.
+
+        raw_format: 'binary' or 'ascii', the format of the raw file written by
+                    ngspice or spectre.  Binary files are much faster to
+                    write and parse.  Defaults to 'binary' for ngspice and
+                    'ascii' for spectre.
+
+        temp: simulation temperature (in degrees C), or None to use the
+              simulator default.
+
+        params: dictionary of netlist parameters (.param), e.g. to select
+                model corners.
+
+        native_sources: If True, background clocks and sine waves (pokes
+                        with a dictionary as delay) that run until the end
+                        of the simulation are written as PULSE and SIN
+                        sources instead of being expanded into pokes.
+
+        pwl_file_threshold: If not None, PWL waveforms with more points than
+                            this are written to files next to the test bench
+                            and referenced from the netlist (PWL file= for
+                            ngspice, PWLFILE= for spectre and hspice) rather
+                            than written inline.
         """
         # call the super constructor
         super().__init__(circuit)
@@ -100,6 +128,10 @@ class SpiceTarget(Target):
         # sanity check
         if simulator not in {'ngspice', 'spectre', 'hspice'}:
             raise ValueError(f'Unsupported simulator {simulator}')
+        if raw_format is None:
+            raw_format = 'binary' if simulator == 'ngspice' else 'ascii'
+        if raw_format not in {'binary', 'ascii'}:
+            raise ValueError(f'Unsupported raw format {raw_format}')
 
         # make directory if needed
         os.makedirs(directory, exist_ok=True)
@@ -123,20 +155,81 @@ class SpiceTarget(Target):
         self.flags = flags if flags is not None else []
         self.ic = ic if ic is not None else {}
         self.disp_type = disp_type
+        self.raw_format = raw_format
+        self.temp = temp
+        self.params = params if params is not None else {}
+        self.native_sources = native_sources
+        self.pwl_file_threshold = pwl_file_threshold
 
         # place for saving expects that were "save_for_later"
         self.saved_for_later = []
 
     def run(self, actions):
-        # expand background pokes into regular pokes
+        # compile the actions
+        with instrumentation.phase('compile', actions=len(actions)):
+            comp = self.compile(actions)
+
+        # write the testbench
+        with instrumentation.phase('codegen') as record:
+            tb_file = self.write_test_bench(comp)
+            record['source_bytes'] = os.path.getsize(tb_file)
+
+        # run the simulation and process the results
+        results = self.simulate(tb_file, comp)
+        with instrumentation.phase('process_results'):
+            self.process_results(results, comp)
+
+    def compile(self, actions):
+        # write periodic background pokes as sources, and expand the others
+        # into regular pokes
+        sources = []
+        if self.native_sources:
+            actions, sources = extract_periodic_sources(
+                actions, self.clock_step_delay, self.supports_source)
         actions = process_action_list(actions, self.clock_step_delay)
 
         # compile the actions
         comp = self.compile_actions(actions)
+        comp.sources = sources
+        return comp
 
-        # write the testbench
-        tb_file = self.write_test_bench(comp)
-
+    @staticmethod
+    def supports_source(poke):
+        # sources are only written for whole ports, and sine waves only for
+        # analog ports
+        port = poke.port
+        if isinstance(port, SelectPath) or \
+                isinstance(port.name, m.ref.ArrayRef):
+            return False
+        analog = (fault.RealType, fault.ElectType)
+        if poke.delay.get('type', 'clock') == 'clock':
+            return isinstance(port, (m.BitType,) + analog)
+        return isinstance(port, analog)
+
+    def source_params(self, source):
+        """
+        Returns the keyword arguments of SpiceNetlist.voltage for a
+        PeriodicSource.
+        """
+        if source.type_ == 'sin':
+            phase_degrees = source.phase_radians * 180 / math.pi
+            return dict(dc=source.offset,
+                        sin=(source.offset, source.amplitude, source.freq,
+                             source.start, 0, phase_degrees))
+        high = self.vsup if isinstance(source.port, m.BitType) else 1
+        v1, v2 = (0, high) if source.initial_value == 0 else (high, 0)
+        first, second = source.half_periods
+        # transitions take t_tr, as for pokes
+        return dict(dc=v1,
+                    pulse=(v1, v2, source.start + first, self.t_tr,
+                           self.t_tr, max(second - self.t_tr, 0),
+                           source.period))
+
+    def simulate(self, tb_file, comp):
+        """
+        Runs the simulator on `tb_file` and returns the Waveform of the
+        signals saved by `comp`.
+        """
         # generate simulator commands
         if self.simulator == 'ngspice':
             sim_cmds, raw_file = self.ngspice_cmds(tb_file)
@@ -148,33 +241,32 @@ class SpiceTarget(Target):
             raise NotImplementedError(self.simulator)
 
         # run the simulation commands
-        for sim_cmd in sim_cmds:
-            res = subprocess_run(sim_cmd, cwd=self.directory, env=self.sim_env,
-                           disp_type=self.disp_type)
-            #print(res.stdout)
-            stderr = res.stderr.strip()
-            if stderr != '':
-                print('Stderr from spice simulator:')
-                print(stderr)
-
-        # process the results
-        if self.simulator in {'ngspice', 'spectre'}:
-            results = nutascii_parse(raw_file)
-        elif self.simulator in {'hspice'}:
-            results = psf_parse(raw_file)
-        else:
-            raise NotImplementedError(self.simulator)
-
-        #import matplotlib.pyplot as plt
-        #print(results.keys())
-        #print('HELLO')
-        #in_ = results['in_']
-        #out = results['out']
-        #plt.plot(in_.x, in_.y, '-o')
-        #plt.plot(out.x, out.y, '-o')
-        #plt.grid()
-        #plt.show()
+        # (the output is only logged, since it can be very large)
+        with instrumentation.phase('simulate'):
+            for k, sim_cmd in enumerate(sim_cmds):
+                log_file = Path(self.directory) / f'sim_{k}.log'
+                res = subprocess_run(sim_cmd, cwd=self.directory,
+                                     env=self.sim_env,
+                                     disp_type=self.disp_type,
+                                     log_file=log_file, capture_output=False)
+                #print(res.stdout)
+                stderr = res.stderr.strip()
+                if stderr != '':
+                    print('Stderr from spice simulator:')
+                    print(stderr)
+
+        # process the results, only loading the signals that are needed
+        with instrumentation.phase('parse') as record:
+            if os.path.isfile(raw_file):
+                record['raw_bytes'] = os.path.getsize(raw_file)
+            if self.simulator in {'ngspice', 'spectre'}:
+                return nutascii_parse(raw_file, signals=comp.saves)
+            elif self.simulator in {'hspice'}:
+                return psf_parse(raw_file, signals=comp.saves)
+            else:
+                raise NotImplementedError(self.simulator)
 
+    def process_results(self, results, comp):
         # print results
         self.print_results(results=results, prints=comp.prints)
 
@@ -244,7 +336,7 @@ class SpiceTarget(Target):
                 # add port to stimulus dictionary if needed
                 action_port_name = f'{action.port.name}'
                 if action_port_name not in pwc_dict:
-                    pwc_dict[action_port_name] = ([], [])
+                    pwc_dict[action_port_name] = ([], [], [])
                 # determine the stimulus value, performing a digital
                 # to analog conversion if needed and controlling
                 # the output switch as needed
@@ -258,8 +350,10 @@ class SpiceTarget(Target):
                     stim_v = action.value
                     stim_s = 1
                 # add the value to the list of actions
-                pwc_dict[action_port_name][0].append((t, stim_v))
-                pwc_dict[action_port_name][1].append((t, stim_s))
+                times, values, switches = pwc_dict[action_port_name]
+                times.append(t)
+                values.append(stim_v)
+                switches.append(stim_s)
                 # increment time if desired
                 if action.delay is None:
                     t += self.clock_step_delay
@@ -288,10 +382,11 @@ class SpiceTarget(Target):
 
         # refactor stimulus voltages to PWL
         pwls = {}
-        for name, pwc in pwc_dict.items():
+        for name, (times, values, switches) in pwc_dict.items():
             pwls[name] = (
-                pwc_to_pwl(pwc=pwc[0], t_stop=t, t_tr=self.t_tr),
-                pwc_to_pwl(pwc=pwc[1], t_stop=t, t_tr=self.t_tr, init=1)
+                pwc_to_pwl_array(times, values, t_stop=t, t_tr=self.t_tr),
+                pwc_to_pwl_array(times, switches, t_stop=t, t_tr=self.t_tr,
+                                 init=1)
             )
 
         # return PWL waveforms, checks to be performed, and stop time
@@ -308,6 +403,21 @@ class SpiceTarget(Target):
     def pwl_str(pwl):
         return ' '.join(f'{t} {v}' for t, v in pwl)
 
+    def pwl_params(self, net, pwl, tb_file):
+        # long waveforms are written to a file next to the test bench
+        # instead of inline, which keeps the netlist small
+        if self.pwl_file_threshold is None \
+           or len(pwl) <= self.pwl_file_threshold:
+            return dict(pwl=pwl)
+        file_name = re.sub(r'\W', '_', net) + '.pwl'
+        pwl_file = Path(tb_file).parent / file_name
+        write_pwl_file(pwl_file, pwl)
+        if self.simulator == 'ngspice':
+            pwl_file_kw = 'file'
+        else:
+            pwl_file_kw = 'PWLFILE'
+        return dict(dc=pwl[0][1], pwl_file=pwl_file, pwl_file_kw=pwl_file_kw)
+
     def get_ordered_ports(self):
         if self.conn_order == 'alpha':
             return self.get_alpha_ordered_ports()
@@ -362,10 +472,21 @@ class SpiceTarget(Target):
         return retval
 
     def write_test_bench(self, comp, tb_file=None):
+        # determine where the netlist (and any PWL files) will be written
+        tb_file = (tb_file if tb_file is not None
+                   else Path(self.directory) / f'{self.circuit.name}_tb.sp')
+        tb_file = Path(tb_file).absolute()
+
         # create a new netlist
         netlist = SpiceNetlist()
         netlist.comment('Automatically generated file.')
 
+        # set parameters and temperature
+        if self.params:
+            netlist.param(**self.params)
+        if self.temp is not None:
+            netlist.temp(self.temp)
+
         # add include files
         for file_ in self.model_paths:
             netlist.include(file_)
@@ -394,8 +515,18 @@ class SpiceTarget(Target):
             netlist.instantiate('inout_sw_mod', vnet, name, snet, '0')
 
             # instantiate voltage source connected through switch
-            netlist.voltage(vnet, '0', pwl=pwl_v)
-            netlist.voltage(snet, '0', pwl=pwl_s)
+            for net, pwl in [(vnet, pwl_v), (snet, pwl_s)]:
+                pwl_params = self.pwl_params(net, pwl, tb_file)
+                netlist.voltage(net, '0', **pwl_params)
+
+        # write periodic sources, which are always driving their port
+        for source in comp.sources:
+            name = f'{source.port.name}'
+            vnet = f'__{name}_v'
+            snet = f'__{name}_s'
+            netlist.instantiate('inout_sw_mod', vnet, name, snet, '0')
+            netlist.voltage(vnet, '0', **self.source_params(source))
+            netlist.voltage(snet, '0', dc=1)
 
         # save signals that need to be saved
         netlist.probe(*comp.saves)
@@ -419,7 +550,7 @@ class SpiceTarget(Target):
         if self.simulator == 'ngspice':
             netlist.start_control()
             netlist.println('run')
-            netlist.println('set filetype=ascii')
+            netlist.println(f'set filetype={self.raw_format}')
             netlist.println('write')
             netlist.println('exit')
             netlist.end_control()
@@ -430,21 +561,20 @@ class SpiceTarget(Target):
         netlist.end_file()
 
         # write spice file
-        tb_file = (tb_file if tb_file is not None
-                   else Path(self.directory) / f'{self.circuit.name}_tb.sp')
-        tb_file = tb_file.absolute()
         netlist.write_to_file(tb_file)
 
         # return name of the file written
         return tb_file
 
-    def impl_expect(self, results, time, action):
-        # get value
-        name = f'{action.port.name}'.split('.')[-1]
+    @staticmethod
+    def expect_name(action):
+        return f'{action.port.name}'.split('.')[-1]
 
+    def impl_expect(self, results, time, action, value=None):
         # get value, performing analog to digital conversion
         # if necessary
-        value = results[name](time)
+        if value is None:
+            value = results[self.expect_name(action)](time)
         if isinstance(action.port, m.BitType):
             if value <= self.vil_rel * self.vsup:
                 value = 0
@@ -471,93 +601,112 @@ class SpiceTarget(Target):
                 assert value == action.value, f'Expected {action.value}, got {value}'  # noqa
 
     def check_results(self, results, checks):
-        for check in checks:
-            self.impl_expect(results=results, time=check[0], action=check[1])
-
-    def impl_print(self, results, time, action):
+        # evaluate all checks of each signal at once
+        values = results.sample([(self.expect_name(action), time)
+                                 for time, action in checks])
+        for (time, action), value in zip(checks, values):
+            self.impl_expect(results=results, time=time, action=action,
+                             value=value)
+
+    def impl_print(self, results, time, action, port_values=None):
         # get port values
-        port_values = [results[f'{port.name}'](time) for port in action.ports]
+        if port_values is None:
+            port_values = [results[f'{port.name}'](time)
+                           for port in action.ports]
         # print formatted output
         print(action.format_str.format(*port_values))
 
     def print_results(self, results, prints):
-        for print_ in prints:
-            self.impl_print(results=results, time=print_[0], action=print_[1])
+        # evaluate all printed values of each signal at once
+        values = results.sample([(f'{port.name}', time)
+                                 for time, action in prints
+                                 for port in action.ports])
+        values = iter(values)
+        for time, action in prints:
+            port_values = [next(values) for _ in action.ports]
+            self.impl_print(results=results, time=time, action=action,
+                            port_values=port_values)
 
     def process_reads(self, results, reads):
+        # evaluate all single-value reads of each signal at once
+        singles = [(time, read) for time, read in reads
+                   if read.style == 'single']
+        values = results.sample([(f'{read.port.name}', time)
+                                 for time, read in singles])
+        for (time, read), value in zip(singles, values):
+            read.value = value
+
         for time, read in reads:
             res = results[f'{read.port.name}']
             if read.style == 'single':
-                value = res(time)
-                if type(value) == np.ndarray:
-                    value = value.tolist()
-                read.value = value
+                continue
             elif read.style == 'edge':
-                value = self.find_edge(res.x, res.y, time, **read.params)
-                read.value = value
+                params = self.edge_params(read.params)
+                value = res.edges(time, **params) - time
+                read.value = value.tolist()
             elif read.style == 'phase':
                 assert 'ref' in read.params, 'Phase read requires reference signal param'
                 res_ref = results[f'{read.params["ref"].name}']
-                ref = self.find_edge(res_ref.x, res_ref.y, time, count=2)
-                before_cycle_end = self.find_edge(res.x, res.y, time + ref[0])
-                fraction = 1 + before_cycle_end[0] / (ref[0] -ref[1])
+                height = self.edge_params({})['height']
+                ref = res_ref.edges(time, height, count=2) - time
+                before_cycle_end = res.edges(time + ref[0], height) - \
+                    (time + ref[0])
+                fraction = 1 + before_cycle_end[0] / (ref[0] - ref[1])
                 # TODO multiply by 2pi?
                 read.value = fraction
+            elif read.style == 'frequency':
+                # average frequency over the last `count` periods
+                params = self.period_params(read.params, count=1)
+                read.value = 1 / np.mean(res.periods(time, **params))
+            elif read.style == 'duty_cycle':
+                # fraction of the last period for which the signal was high
+                height = self.edge_params(read.params)['height']
+                rising = res.edges(time, height, count=2)
+                falling = res.edges(rising[0], height, rising=False)
+                read.value = (falling[0] - rising[1]) / (rising[0] - rising[1])
+            elif read.style == 'jitter':
+                # standard deviation of the last `count` (default: all)
+                # periods
+                params = self.period_params(read.params)
+                read.value = float(np.std(res.periods(time, **params)))
+            elif read.style == 'period_hist':
+                # histogram of the last `count` (default: all) periods, as a
+                # tuple of (counts, bin edges)
+                params = self.period_params(read.params)
+                counts, bins = np.histogram(res.periods(time, **params),
+                                            bins=read.params.get('bins', 10))
+                read.value = (counts.tolist(), bins.tolist())
             else:
                 raise NotImplementedError(f'Unknown read style "{read.style}"')
 
+    def edge_params(self, params):
+        params = dict(params)
+        params.pop('ref', None)
+        if params.get('height') is None:
+            # default comes out to 0.5
+            params['height'] = self.vsup * (self.vih_rel + self.vil_rel) / 2
+        return params
+
+    def period_params(self, params, count=None):
+        params = self.edge_params(params)
+        params.pop('bins', None)
+        unknown = set(params) - {'height', 'forward', 'count', 'rising'}
+        if unknown:
+            raise ValueError(f'Unsupported read params {sorted(unknown)}')
+        params.setdefault('count', count)
+        return params
+
     def find_edge(self, x, y, t_start, height=None, forward=False, count=1, rising=True):
         '''
         Search through data (x,y) starting at time t_start for when the
         waveform crosses height (defaut is ???). Searches backwards by
         default (frequency now is probably based on the last few edges?)
+        Returns the times of the edges relative to t_start.
         '''
-
-        if height is None:
-            # default comes out to 0.5
-            height = self.vsup * (self.vih_rel + self.vil_rel) / 2
-
-        # deal with `rising` and `forward`
-        # normally a low-to-high finder
-        if (rising ^ forward):
-            y = [(-1*z + 2*height) for z in y]
-        direction = 1 if forward else -1
-        # we want to start on the far side of the interval containing t_start
-        # to make sure we catch any edge near t_start
-        side = 'left' if forward else 'right'
-
-        start_index = np.searchsorted(x, t_start, side=side)
-        if start_index == len(x):
-            # happens when forward=False and the edge find is the end of the sim
-            start_index -= 1
-
-        i = start_index
-        edges = []
-        while len(edges) < count:
-            # move until we hit low
-            while y[i] > height:
-                i += direction
-                if i < 0 or i >= len(y):
-                    msg = f'only {len(edges)} of requested {count} edges found'
-                    raise EdgeNotFoundError(msg)
-            # now move until we hit the high
-            while y[i] <= height:
-                i += direction
-                if i < 0 or i >= len(y):
-                    msg = f'only {len(edges)} of requested {count} edges found'
-                    raise EdgeNotFoundError(msg)
-
-
-            # TODO: there's an issue because of the discrepancy between the requested
-            # start time and actually staring at the nearest edge
-
-            # the crossing happens from i to i+1
-            fraction = (height-y[i]) / (y[i-direction]-y[i])
-            t = x[i] + fraction * (x[i+1] - x[i])
-            if t==t_start:
-                print('EDGE EXACTLY AT EDGE FIND REQUEST')
-            edges.append(t-t_start)
-        return edges
+        params = self.edge_params({'height': height})
+        edges = Signal(x, y).edges(t_start, forward=forward, count=count,
+                                   rising=rising, **params)
+        return (edges - t_start).tolist()
 
     def ngspice_cmds(self, tb_file):
         # build up the command
@@ -577,7 +726,10 @@ class SpiceTarget(Target):
         cmd = []
         cmd += ['spectre']
         cmd += [f'{tb_file}']
-        cmd += ['-format', 'nutascii']
+        if self.raw_format == 'binary':
+            cmd += ['-format', 'nutbin']
+        else:
+            cmd += ['-format', 'nutascii']
         raw_file = (Path(self.directory) / 'out.raw').absolute()
         cmd += ['-raw', f'{raw_file}']
         cmd += self.flags
@@ -1,4 +1,7 @@
+import os
 import shlex
+import threading
+from collections import deque
 from subprocess import Popen, PIPE, CompletedProcess
 from fault.user_cfg import FaultConfig
 
@@ -10,11 +13,20 @@ RED = '\x1b[31m'
 BRIGHT = '\x1b[1m'
 RESET_ALL = '\x1b[0m'
 
+# Default number of lines of each output stream kept in memory for display
+# when an error occurs
+TAIL_LINES = 1000
+
+# Log files are rotated when they reach this size, keeping this many backups
+LOG_MAX_BYTES = 64 * 1024 * 1024
+LOG_BACKUPS = 3
+
 
 class PrintDisplay:
-    def __init__(self, mode):
+    def __init__(self, mode, tail_lines=None):
         self.mode = mode
-        self.lines = []
+        # only the most recent lines are kept for error printing
+        self.lines = deque(maxlen=tail_lines)
 
     def print(self, line):
         line = line.rstrip()
@@ -30,15 +42,16 @@ class PrintDisplay:
             for line in self.lines:
                 print(line)
 
-    def process_output(self, fd, name):
+    def process_output(self, fd, name, on_line=None):
         # generic line-processing function to display lines
         # as they are produced as output in and check for errors.
+        # `on_line` is called with each line as it comes in.
 
-        retval = ''
         any_line = False
         for line in fd:
-            # Add line to value to be returned
-            retval += line
+            # Pass the line on for further processing
+            if on_line is not None:
+                on_line(line)
 
             # Display opening text if needed
             if not any_line:
@@ -52,12 +65,94 @@ class PrintDisplay:
         if any_line:
             self.print(MAGENTA + BRIGHT + f'</{name}>' + RESET_ALL)
 
-        # Return the full output contents for further processing
-        return retval
+
+class RotatingLog:
+    """
+    Log file shared by the output streams of a subprocess.  When the file
+    reaches `max_bytes`, it is renamed to <path>.1 (shifting older backups to
+    <path>.2, ...) and a new file is started, so that the logs of very long
+    simulations use a bounded amount of disk space.
+    """
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'w')
+        self.size = 0
+
+    def write(self, text):
+        with self.lock:
+            if self.size > 0 and self.size + len(text) > self.max_bytes:
+                self.rotate()
+            self.file.write(text)
+            self.size += len(text)
+
+    def rotate(self):
+        self.file.close()
+        for k in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{k}'):
+                os.replace(f'{self.path}.{k}', f'{self.path}.{k+1}')
+        if self.backups > 0:
+            os.replace(self.path, f'{self.path}.1')
+        self.file = open(self.path, 'w')
+        self.size = 0
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class StreamReader(threading.Thread):
+    """
+    Drains one output stream of a subprocess on a background thread, so that
+    neither stream can fill its pipe and stall the subprocess.  Each line is
+    displayed, written to the log (if any), checked for `err_str`, and kept
+    in memory (all lines if `capture` is True, otherwise only the last
+    `tail_lines`).
+    """
+    def __init__(self, fd, name, display, log=None, capture=True,
+                 tail_lines=TAIL_LINES, err_str=None, on_err_str=None):
+        super().__init__(daemon=True)
+        self.fd = fd
+        self.name = name
+        self.display = display
+        self.log = log
+        self.capture = capture
+        self.chunks = [] if capture else deque(maxlen=tail_lines)
+        self.err_str = err_str
+        self.on_err_str = on_err_str
+        self.found_err_str = False
+        self.error = None
+
+    def run(self):
+        # exceptions are passed back to the main thread, since they would
+        # otherwise go unnoticed (e.g. by pytest)
+        try:
+            self.display.process_output(fd=self.fd, name=self.name,
+                                        on_line=self.process_line)
+        except BaseException as e:
+            self.error = e
+
+    def process_line(self, line):
+        self.chunks.append(line)
+        if self.log is not None:
+            self.log.write(line)
+        if self.err_str is not None and not self.found_err_str and \
+                self.err_str in line:
+            self.found_err_str = True
+            if self.on_err_str is not None:
+                self.on_err_str()
+
+    @property
+    def text(self):
+        return ''.join(self.chunks)
 
 
 def subprocess_run(args, cwd=None, env=None, disp_type='on_error', err_str=None,
-                   chk_ret_code=True, shell=False, use_fault_cfg=True):
+                   chk_ret_code=True, shell=False, use_fault_cfg=True,
+                   log_file=None, capture_output=True, tail_lines=TAIL_LINES,
+                   kill_on_err_str=True):
     # "Deluxe" version of subprocess.run that can display STDOUT lines as they
     # come in, looks for errors in STDOUT and STDERR (raising an exception if
     # one is found), and can check the return code from the subprocess
@@ -67,9 +162,11 @@ def subprocess_run(args, cwd=None, env=None, disp_type='on_error', err_str=None,
     # "returncode", "stdout", and "stderr".  This allows for further processing
     # of the results if desired.
     #
-    # Note that only STDOUT is displayed in realtime; STDERR is displayed in
-    # its entirety after the subprocess runs.  This is mainly to avoid the
-    # confusion that arises when interleaving STDOUT and STDERR.
+    # Note that only STDOUT is displayed in realtime; STDERR is displayed
+    # after the subprocess runs.  This is mainly to avoid the
+    # confusion that arises when interleaving STDOUT and STDERR.  Both are
+    # read concurrently, however, so that the subprocess can't stall on a
+    # full STDERR pipe.
     #
     # args: List of arguments, with the same meaning as subprocess.run.
     #       Unlike subprocess.run, however, this should always be a list.
@@ -90,13 +187,25 @@ def subprocess_run(args, cwd=None, env=None, disp_type='on_error', err_str=None,
     #        Verilator)
     # use_fault_cfg: If True (default) and env is None, then use FaultConfig
     #                to fill in default environment variables.
+    # log_file: If not None, STDOUT and STDERR are written to this file as
+    #           they come in (rotated every LOG_MAX_BYTES).
+    # capture_output: If True (default), the full STDOUT and STDERR are
+    #                 returned.  If False, only the last tail_lines lines of
+    #                 each are kept in memory (and returned), which is useful
+    #                 for very chatty subprocesses whose output is not needed.
+    # tail_lines: Number of lines of each stream displayed on error when
+    #             disp_type is 'on_error'.
+    # kill_on_err_str: If True (default), kill the subprocess as soon as
+    #                  err_str is found rather than waiting for it to finish.
 
     # set defaults
     if env is None and use_fault_cfg:
         env = FaultConfig().get_sim_env()
 
-    # set up printing
-    display = PrintDisplay(mode=disp_type)
+    # set up printing.  STDERR is buffered so that it can be displayed after
+    # the subprocess completes.
+    display = PrintDisplay(mode=disp_type, tail_lines=tail_lines)
+    err_display = PrintDisplay(mode='on_error', tail_lines=tail_lines)
 
     # print out the command in a format that can be copy-pasted
     # directly into a terminal (i.e., with proper quoting of arguments)
@@ -109,33 +218,62 @@ def subprocess_run(args, cwd=None, env=None, disp_type='on_error', err_str=None,
 
     # run the subprocess
     err_msg = []
+    log = RotatingLog(log_file) if log_file is not None else None
+    killed = threading.Event()
     with Popen(args, cwd=cwd, env=env, stdout=PIPE, stderr=PIPE, bufsize=1,
                universal_newlines=True, shell=shell) as p:
 
-        # print out STDOUT, then STDERR
-        # threads could be used here but pytest does not detect exceptions
-        # in child threads, so for now the outputs are printed sequentially
-        stdout = display.process_output(fd=p.stdout, name='STDOUT')
-        stderr = display.process_output(fd=p.stderr, name='STDERR')
+        def on_err_str():
+            if kill_on_err_str and not killed.is_set():
+                killed.set()
+                p.kill()
+
+        # drain STDOUT and STDERR concurrently
+        readers = [
+            StreamReader(p.stdout, 'STDOUT', display, log=log,
+                         capture=capture_output, tail_lines=tail_lines,
+                         err_str=err_str, on_err_str=on_err_str),
+            StreamReader(p.stderr, 'STDERR', err_display, log=log,
+                         capture=capture_output, tail_lines=tail_lines,
+                         err_str=err_str, on_err_str=on_err_str)
+        ]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        if log is not None:
+            log.close()
+        for reader in readers:
+            if reader.error is not None:
+                p.kill()
+                raise reader.error
+        stdout, stderr = (reader.text for reader in readers)
+
+        # display STDERR now that the subprocess has completed
+        if disp_type == 'realtime':
+            for line in err_display.lines:
+                print(line)
+            err_display.lines.clear()
 
         # get return code and check result if desired
         returncode = p.wait()
 
-        if chk_ret_code and returncode:
+        if chk_ret_code and returncode and not killed.is_set():
             err_msg += [f'Got return code {returncode}.']
 
         # look for errors in STDOUT or STDERR
-        if err_str is not None:
-            if err_str in stdout:
-                err_msg += [f'Found "{err_str}" in STDOUT.']
-            if err_str in stderr:
-                err_msg += [f'Found "{err_str}" in STDERR.']
+        for reader in readers:
+            if reader.found_err_str:
+                err_msg += [f'Found "{err_str}" in {reader.name}.']
+        if killed.is_set():
+            err_msg += ['Killed the subprocess after the first error.']
 
     # if any errors were found, print out STDOUT and STDERR if they haven't
     # already been printed, then print out what the error(s) were and
     # raise an exception
     if len(err_msg) != 0:
         display.error_printing()
+        err_display.error_printing()
         print(RED + BRIGHT + f'Found {len(err_msg)} error(s):' + RESET_ALL)
         for k, e in enumerate(err_msg):
             print(RED + BRIGHT + f'{k+1}) {e}' + RESET_ALL)
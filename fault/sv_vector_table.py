@@ -0,0 +1,255 @@
+import magma as m
+from hwtypes import BitVector, Bit
+import fault
+import fault.actions as actions
+import fault.value_utils as value_utils
+from fault.select_path import SelectPath
+from fault.wrapper import PortWrapper
+from fault.real_type import RealKind
+
+
+# Row opcodes
+END = 0
+POKE = 1
+EXPECT = 2
+STEP = 3
+
+# Number of bits used for the action index stored in each row (reported in
+# error messages)
+INDEX_BITS = 32
+
+
+task_tpl = """\
+    task __vt_replay(input integer start);
+        begin
+            __vt_row = start;
+            {unpack}
+            while (__vt_op != {end}) begin
+                case (__vt_op)
+                    {poke}: begin
+                        case (__vt_port)
+{poke_cases}
+                            default: ;
+                        endcase
+                        #{poke_delay};
+                    end
+                    {expect}: begin
+                        case (__vt_port)
+{expect_cases}
+                            default: ;
+                        endcase
+                    end
+                    {step}: begin
+                        #5;
+                        case (__vt_port)
+{step_cases}
+                            default: ;
+                        endcase
+                    end
+                    default: ;
+                endcase
+                __vt_row = __vt_row + 1;
+                {unpack}
+            end
+        end
+    endtask
+"""
+
+
+class VectorTable:
+    """
+    Packs straight-line runs of pokes, expects, and clock steps into rows of
+    a stimulus/expected-response memory, which the testbench loads with
+    $readmemh and replays with a generic task.  The size of the testbench
+    source then only depends on the ports used, not on the number of
+    actions.
+
+    Each row holds (from MSB to LSB) the index of the action it came from,
+    an opcode, a strict-comparison flag, a port number, and a value.  Each
+    run of rows is terminated by an END row.
+    """
+    def __init__(self, target, file_name):
+        self.target = target
+        self.file_name = file_name
+        # name -> (port number, width, name to read, name for messages)
+        self.ports = {}
+        self.poke_ports = set()
+        self.expect_ports = set()
+        self.step_ports = set()
+        self.rows = []
+
+    @staticmethod
+    def port_width(port):
+        # width of a top-level digital port, or None if the port can't be
+        # driven from the table
+        if isinstance(port, SelectPath):
+            if len(port) > 2:
+                return None
+            port = port[-1]
+        if isinstance(port, (PortWrapper, fault.WrappedVerilogInternalPort)):
+            return None
+        if isinstance(type(port), RealKind):
+            return None
+        if isinstance(port, m._BitType):
+            return 1
+        if isinstance(port, m.BitsType):
+            return len(port)
+        if isinstance(port, m.ArrayType) and isinstance(port.T, m._BitKind):
+            return len(port)
+        return None
+
+    @staticmethod
+    def encode_value(value, width):
+        # unsigned integer encoding of a constant value (or None if the value
+        # isn't a constant)
+        if isinstance(value, BitVector):
+            value = value.as_uint()
+        elif isinstance(value, Bit):
+            value = int(bool(value))
+        elif not isinstance(value, int):
+            return None
+        return value & ((1 << width) - 1)
+
+    def port_number(self, port, width):
+        name = self.target.make_name(port)
+        if name not in self.ports:
+            read_name = name
+            if actions.is_inout(port):
+                read_name = self.target.input_wire(name)
+            if isinstance(port, SelectPath):
+                debug_name = port[-1].name
+            else:
+                debug_name = port.name
+            self.ports[name] = (len(self.ports), width, read_name,
+                                debug_name)
+        return self.ports[name][0]
+
+    def encode(self, i, action):
+        """
+        Returns the rows implementing action `i`, or None if it has to be
+        compiled to regular testbench code.
+        """
+        if isinstance(action, actions.Eval):
+            # evaluation is implicit in SV simulations
+            return []
+        if isinstance(action, actions.Step):
+            if self.port_width(action.clock) != 1:
+                return None
+            port = self.port_number(action.clock, 1)
+            self.step_ports.add(port)
+            return [(i, STEP, 0, port, 0)] * action.steps
+        if isinstance(action, actions.Poke):
+            width = self.port_width(action.port)
+            if width is None or action.delay is not None:
+                return None
+            value = self.encode_value(action.value, width)
+            if value is None:
+                return None
+            port = self.port_number(action.port, width)
+            self.poke_ports.add(port)
+            return [(i, POKE, 0, port, value)]
+        if isinstance(action, actions.Expect):
+            width = self.port_width(action.port)
+            if width is None:
+                return None
+            if value_utils.is_any(action.value):
+                return []
+            if action.above is not None or action.below is not None:
+                return None
+            value = self.encode_value(action.value, width)
+            if value is None:
+                return None
+            port = self.port_number(action.port, width)
+            self.expect_ports.add(port)
+            return [(i, EXPECT, int(action.strict), port, value)]
+        return None
+
+    def add_run(self, rows):
+        """
+        Appends a run of rows (followed by an END row) to the table,
+        returning the row number at which it starts.
+        """
+        start = len(self.rows)
+        self.rows += rows
+        self.rows.append((0, END, 0, 0, 0))
+        return start
+
+    @property
+    def port_bits(self):
+        return max(len(self.ports) - 1, 1).bit_length()
+
+    @property
+    def value_bits(self):
+        return max([width for _, width, _, _ in self.ports.values()] + [1])
+
+    @property
+    def row_bits(self):
+        return INDEX_BITS + 2 + 1 + self.port_bits + self.value_bits
+
+    @property
+    def depth(self):
+        # rounded up to a power of two, so that the testbench source doesn't
+        # change as long as the number of rows stays in the same range
+        return 1 << max(len(self.rows) - 1, 1).bit_length()
+
+    def data(self):
+        """
+        Contents of the $readmemh file, padded with END rows to the depth of
+        the memory.
+        """
+        port_bits = self.port_bits
+        value_bits = self.value_bits
+        digits = (self.row_bits + 3) // 4
+        lines = []
+        for index, op, strict, port, value in self.rows:
+            row = index
+            row = (row << 2) | op
+            row = (row << 1) | strict
+            row = (row << port_bits) | port
+            row = (row << value_bits) | value
+            lines.append(f'{row:0{digits}x}')
+        lines += ['0' * digits] * (self.depth - len(self.rows))
+        return '\n'.join(lines) + '\n'
+
+    def declarations(self):
+        return [
+            f'    reg [{self.row_bits - 1}:0] __vt_mem [0:{self.depth - 1}];',
+            '    integer __vt_row;',
+            f'    reg [{INDEX_BITS - 1}:0] __vt_index;',
+            '    reg [1:0] __vt_op;',
+            '    reg __vt_strict;',
+            f'    reg [{self.port_bits - 1}:0] __vt_port;',
+            f'    reg [{self.value_bits - 1}:0] __vt_value;',
+            self.replay_task()
+        ]
+
+    def load(self):
+        return [f'$readmemh("{self.file_name}", __vt_mem);']
+
+    def replay(self, start):
+        return [f'__vt_replay({start});']
+
+    def replay_task(self):
+        tab = ' ' * 4
+        poke_cases = []
+        expect_cases = []
+        step_cases = []
+        for name, (port, width, read_name, debug_name) in self.ports.items():
+            value = f'__vt_value[{width - 1}:0]'
+            if port in self.poke_ports:
+                poke_cases.append(f'{port}: {name} = {value};')
+            if port in self.expect_ports:
+                cond = f'__vt_strict ? ({read_name} === {value}) : ({read_name} == {value})'  # noqa
+                err_body = f'"Failed on action=%0d checking port {debug_name}. Expected %x, got %x", __vt_index, {value}, {read_name}'  # noqa
+                expect_cases.append(f'{port}: if (!({cond})) $error({err_body});')  # noqa
+            if port in self.step_ports:
+                step_cases.append(f'{port}: {name} ^= 1;')
+        return task_tpl.format(
+            end=END, poke=POKE, expect=EXPECT, step=STEP,
+            unpack=('{__vt_index, __vt_op, __vt_strict, __vt_port, '
+                    '__vt_value} = __vt_mem[__vt_row];'),
+            poke_delay=self.target.clock_step_delay,
+            poke_cases='\n'.join(f'{7*tab}{c}' for c in poke_cases),
+            expect_cases='\n'.join(f'{7*tab}{c}' for c in expect_cases),
+            step_cases='\n'.join(f'{7*tab}{c}' for c in step_cases)
+        )
@@ -58,9 +58,18 @@ class SymbolicInstanceWrapper(InstanceWrapper):
 
 
 class SymbolicTester(Tester):
-    def __init__(self, circuit, clock=None, num_tests=100):
+    def __init__(self, circuit, clock=None, num_tests=100, sampler='auto'):
+        """
+        `num_tests`: number of random tests of the assumptions and
+            guarantees (verilator target)
+        `sampler`: how the values of the assumed ports are sampled (see
+            `fault.random.sample_constrained_bvs`): 'rejection', 'smt', or
+            'auto' to use the SMT sampler when random values rarely satisfy
+            the assumption
+        """
         super().__init__(circuit, clock)
         self.num_tests = num_tests
+        self.sampler = sampler
 
     def assume(self, port, constraint):
         """
@@ -87,7 +96,8 @@ class SymbolicTester(Tester):
     def run(self, target="verilator"):
         if target == "verilator":
             self.targets[target].run(self.actions, self.verilator_includes,
-                                     self.num_tests, self._circuit)
+                                     self.num_tests, self._circuit,
+                                     self.sampler)
         elif target == "cosa":
             self.targets[target].run(self.actions)
         else:
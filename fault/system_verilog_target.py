@@ -8,11 +8,16 @@ import fault.value_utils as value_utils
 from fault.select_path import SelectPath
 from fault.wrapper import PortWrapper
 from fault.subprocess_run import subprocess_run
-from fault.background_poke import process_action_list
+from fault.background_poke import (process_action_list,
+                                   extract_periodic_sources)
+from fault.build_cache import BuildCache
+from fault.sv_vector_table import VectorTable
+import fault.instrumentation as instrumentation
 import fault
 import fault.expression as expression
 from fault.real_type import RealKind
 import os
+import math
 from numbers import Number
 import re
 
@@ -46,7 +51,8 @@ class SystemVerilogTarget(VerilogTarget):
                  defines=None, flags=None, inc_dirs=None,
                  ext_test_bench=False, top_module=None, ext_srcs=None,
                  use_input_wires=False, parameters=None, disp_type='on_error',
-                 read_tag='fault_read<{read_hash}><{value}>'):
+                 read_tag='fault_read<{read_hash}><{value}>',
+                 incremental=True, vector_table=False, native_sources=True):
         """
         circuit: a magma circuit
 
@@ -121,6 +127,28 @@ class SystemVerilogTarget(VerilogTarget):
 
         read_tag: Text tag for formatting read action hashes and values dumped
                   by the simulator.
+
+        incremental: If True (default), avoid redoing work that is still up to
+                     date: the testbench file is only rewritten when its
+                     contents change, the compiled simulation (iverilog, vcs)
+                     is reused when the testbench, sources, and command line
+                     are all unchanged since the last run, and vcs recompiles
+                     only the modules that changed (-Mupdate).  ncsim performs
+                     its own incremental compilation of the snapshot.
+
+        vector_table: If True, straight-line runs of pokes, expects, and clock
+                      steps are packed into a memory file (loaded with
+                      $readmemh) that is replayed by a generic loop in the
+                      testbench, instead of being written out as one
+                      statement per action.  This keeps the testbench small
+                      (and quick to compile) for very long tests.  Other
+                      actions are still compiled to regular testbench code.
+
+        native_sources: If True, background clocks and sine waves (pokes with
+                        a dictionary as delay) that run until the end of the
+                        simulation are generated by `initial` blocks of the
+                        testbench instead of being expanded into pokes.
+                        Sine waves are only generated for real ports.
         """
         # set default for list of external sources
         if include_verilog_libraries is None:
@@ -175,6 +203,11 @@ class SystemVerilogTarget(VerilogTarget):
         self.parameters = parameters if parameters is not None else {}
         self.disp_type = disp_type
         self.read_tag = read_tag
+        self.incremental = incremental
+        self.vector_table = vector_table
+        self.vector_data = None
+        self.native_sources = native_sources
+        self.periodic_sources = []
 
     def add_decl(self, *decls):
         self.declarations.extend(decls)
@@ -265,6 +298,48 @@ class SystemVerilogTarget(VerilogTarget):
             retval += [f'#({action.delay}*1s);']
         return retval
 
+    @staticmethod
+    def supports_source(poke):
+        # sources are only generated for top-level ports, and sine waves
+        # only for real ports
+        port = poke.port
+        if isinstance(port, (SelectPath, PortWrapper)) or \
+                isinstance(port.name, m.ref.ArrayRef):
+            return False
+        if poke.delay.get('type', 'clock') == 'clock':
+            return isinstance(type(port), (m.BitKind, RealKind))
+        return isinstance(type(port), RealKind)
+
+    def make_periodic_source(self, source, tab='    '):
+        """
+        Returns the declarations of an `initial` block generating a
+        PeriodicSource.
+        """
+        name = self.make_name(source.port)
+        if source.type_ == 'clock':
+            first, second = source.half_periods
+            body = [f'{name} = {source.initial_value};',
+                    f'#({first}*1s);',
+                    f'{name} = {1 - source.initial_value};',
+                    f'#({second}*1s);']
+            decls = []
+        else:
+            # the sine wave is updated every dt
+            t = f'__{name}_t'
+            angle = f'{2 * math.pi * source.freq}*{t} + ' \
+                f'{source.phase_radians}'
+            body = [f'{name} = {source.offset} + '
+                    f'{source.amplitude}*$sin({angle});',
+                    f'#({source.dt}*1s);',
+                    f'{t} = {t} + {source.dt};']
+            decls = [f'{tab}real {t} = 0;']
+        decls += [f'{tab}initial begin',
+                  f'{2*tab}#({source.start}*1s);',
+                  f'{2*tab}forever begin']
+        decls += [f'{3*tab}{line}' for line in body]
+        decls += [f'{2*tab}end', f'{tab}end']
+        return decls
+
     def make_delay(self, i, action):
         return [f'$write("MAKING DELAY\\n"); #({action.time}*1s);']
 
@@ -562,11 +637,38 @@ end
         for name, type_ in self.circuit.IO.ports.items():
             result = self.generate_port_code(name, type_, power_args)
             port_list.extend(result)
-
+        for source in self.periodic_sources:
+            self.add_decl(*self.make_periodic_source(source, tab))
+
+        # when using a vector table, straight-line runs of actions that can
+        # be stored in the table are collected and replayed with a single
+        # task call each
+        table = None
+        if self.vector_table:
+            table = VectorTable(self, self.vector_file.name)
+        run = []
+        code = []
         for i, action in enumerate(actions):
-            code = self.generate_action_code(i, action)
-            for line in code:
-                initial_body += f"        {line}\n"
+            rows = table.encode(i, action) if table is not None else None
+            if rows is not None:
+                run += rows
+                continue
+            if len(run) > 0:
+                code += table.replay(table.add_run(run))
+                run = []
+            code += self.generate_action_code(i, action)
+        if len(run) > 0:
+            code += table.replay(table.add_run(run))
+
+        if table is not None and len(table.rows) > 0:
+            code = table.load() + code
+            self.add_decl(*table.declarations())
+            self.vector_data = table.data()
+        else:
+            self.vector_data = None
+
+        for line in code:
+            initial_body += f"        {line}\n"
 
         param_list = [f'.{name}({value})'
                       for name, value in self.parameters.items()]
@@ -581,18 +683,29 @@ end
 
         return src
 
+    def process_background_pokes(self, actions):
+        # generate periodic background pokes in the testbench, and expand
+        # the others into regular pokes
+        self.periodic_sources = []
+        if self.native_sources:
+            actions, self.periodic_sources = extract_periodic_sources(
+                actions, self.clock_step_delay, self.supports_source)
+        return process_action_list(actions, self.clock_step_delay)
+
     def run(self, actions, power_args=None):
         # set defaults
         power_args = power_args if power_args is not None else {}
 
-        # expand background pokes into regular pokes
-        actions = process_action_list(actions, self.clock_step_delay)
+        actions = self.process_background_pokes(actions)
 
         # assemble list of sources files
         vlog_srcs = []
         if not self.ext_test_bench:
-            tb_file = self.write_test_bench(actions=actions,
-                                            power_args=power_args)
+            with instrumentation.phase('codegen',
+                                       actions=len(actions)) as record:
+                tb_file = self.write_test_bench(actions=actions,
+                                                power_args=power_args)
+                record['source_bytes'] = os.path.getsize(tb_file)
             vlog_srcs += [tb_file]
         if not self.ext_model_file:
             vlog_srcs += [self.verilog_file]
@@ -618,17 +731,34 @@ end
         # add any extra flags
         sim_cmd += self.flags
 
-        # compile the simulation
-        print('calling subprocess with args', sim_cmd, self.directory, self.sim_env, self.disp_type)
-        completed_sim = subprocess_run(sim_cmd, cwd=self.directory, env=self.sim_env,
-                       disp_type=self.disp_type)
+        # compile the simulation, unless it is up to date (only possible if
+        # compiling and running the simulation are separate steps)
+        stamp = None
+        if self.incremental and bin_cmd is not None:
+            stamp = self.compile_stamp(sim_cmd, vlog_srcs)
+        if stamp is None or not self.is_up_to_date(stamp, bin_file):
+            print('calling subprocess with args', sim_cmd, self.directory, self.sim_env, self.disp_type)
+            if self.stamp_file.exists():
+                os.remove(self.stamp_file)
+            # ncsim compiles and runs the simulation in one step
+            with instrumentation.phase('compile' if bin_cmd is not None
+                                       else 'simulate'):
+                completed_sim = subprocess_run(sim_cmd, cwd=self.directory,
+                                               env=self.sim_env,
+                                               disp_type=self.disp_type)
+            if stamp is not None:
+                self.stamp_file.write_text(stamp)
 
         # run the simulation binary (if applicable)
         if bin_cmd is not None:
-            completed_sim = subprocess_run(bin_cmd, cwd=self.directory, env=self.sim_env,
-                           err_str=sim_err_str, disp_type=self.disp_type)
+            with instrumentation.phase('simulate'):
+                completed_sim = subprocess_run(bin_cmd, cwd=self.directory,
+                                               env=self.sim_env,
+                                               err_str=sim_err_str,
+                                               disp_type=self.disp_type)
         result_text = completed_sim.stdout
-        self.process_reads(result_text)
+        with instrumentation.phase('process_reads'):
+            self.process_reads(result_text)
 
     def write_test_bench(self, actions, power_args):
         # determine the path of the testbench file
@@ -638,6 +768,18 @@ end
         # generate source code of test bench
         src = self.generate_code(actions, power_args)
 
+        # write the vector table used by the test bench, if any
+        if self.vector_data is not None:
+            write_if_changed(self.directory / self.vector_file,
+                             self.vector_data)
+
+        # Leave an unchanged test bench untouched, so that the simulator
+        # doesn't recompile it
+        if self.incremental and os.path.isfile(tb_file):
+            with open(tb_file, 'r') as f:
+                if f.read() == src:
+                    return tb_file
+
         # If there's an old test bench file, ncsim might not recompile based on
         # the timestamp (1s granularity), see
         # https://github.com/StanfordAHA/lassen/issues/111
@@ -660,6 +802,37 @@ end
         # return the path to the testbench location
         return tb_file
 
+    @property
+    def vector_file(self):
+        return Path(f'{self.circuit_name}_vectors.hex')
+
+    @property
+    def stamp_file(self):
+        return self.directory / f'{self.circuit_name}_compile.stamp'
+
+    def compile_stamp(self, sim_cmd, sources):
+        # hash of everything that goes into compiling the simulation: the
+        # command line and the contents of all sources, libraries, and files
+        # in the include directories
+        files = [self.directory / Path(src)
+                 for src in list(sources) + list(self.ext_libs)]
+        for dir_ in self.inc_dirs:
+            dir_ = self.directory / Path(dir_)
+            if dir_.is_dir():
+                files += sorted(p for p in dir_.iterdir() if p.is_file())
+        return BuildCache.key('sv-compile', self.simulator,
+                              [f'{arg}' for arg in sim_cmd],
+                              [f'{file_}' for file_ in files], files)
+
+    def is_up_to_date(self, stamp, bin_file):
+        # the compiled simulation can be reused if it exists and was built
+        # from the same inputs
+        if not (self.directory / Path(bin_file)).exists():
+            return False
+        if not self.stamp_file.is_file():
+            return False
+        return self.stamp_file.read_text() == stamp
+
     @staticmethod
     def input_wire(name):
         return f'__{name}_wire'
@@ -770,6 +943,8 @@ end
         cmd += ['-Wl,--no-as-needed']
         if self.dump_vcd:
             cmd += ['+vcs+vcdpluson', '-debug_pp']
+        if self.incremental:
+            cmd += ['-Mupdate']
 
         # return arg list and binary file location
         return cmd, './simv'
@@ -803,3 +978,13 @@ end
 
         # return arg list and binary file location
         return cmd, bin_file
+
+
+def write_if_changed(path, text):
+    # leave the file untouched if its contents wouldn't change
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            if f.read() == text:
+                return
+    with open(path, 'w') as f:
+        f.write(text)
@@ -2,9 +2,13 @@ from magma import BitKind, ArrayKind, SIntKind, UIntKind, BitsKind
 from magma.simulator.python_simulator import PythonSimulator
 from hwtypes import BitVector, SIntVector, UIntVector, Bit
 from inspect import signature
-from itertools import product
+import os
+import random
+import numpy as np
 import pytest
 import fault
+from fault.numpy_simulator import NumpySimulator, coreir_graph
+from fault.parallel import fork_map
 
 
 class TestVector:
@@ -64,45 +68,275 @@ def flatten_tests(tests):
     return [TestVector(x) for x in flattened_tests]
 
 
-@pytest.mark.skip(reason="Not a test")
-def generate_function_test_vectors(circuit, func, input_ranges=None,
-                                   mode='complete', flatten=True):
-    check(circuit, func)
-
-    args = []
+def get_input_domains(circuit, input_ranges=None, skip_unsupported=False):
+    """
+    Returns (type, values) for each input of `circuit`: the type of its test
+    values (Bit, BitVector[N] or SIntVector[N]) and the integers it takes
+    (a range, or the sequence given in `input_ranges`, which is indexed by
+    port number).  Inputs of other types raise NotImplementedError, unless
+    `skip_unsupported` is set.
+    """
+    domains = []
     for i, (name, port) in enumerate(circuit.IO.items()):
         if port.isinput():
             if isinstance(port, BitKind):
-                args.append([Bit(0), Bit(1)])
+                domains.append((Bit, range(2)))
             elif isinstance(port, ArrayKind) and isinstance(port.T, BitKind):
                 num_bits = port.N
+                if input_ranges is not None:
+                    input_range = input_ranges[i]
+                elif isinstance(port, SIntKind):
+                    # We don't subtract one because range end is exclusive
+                    input_range = range(-2**(num_bits - 1), 2**(num_bits - 1))
+                else:
+                    input_range = range(1 << num_bits)
                 if isinstance(port, SIntKind):
-                    if input_ranges is None:
-                        input_range = range(-2**(num_bits - 1),
-                                            2**(num_bits - 1))
-                    else:
-                        input_range = input_ranges[i]
-                    args.append([SIntVector[num_bits](x)
-                                 for x in input_range])
+                    domains.append((SIntVector[num_bits], input_range))
                 else:
-                    if input_ranges is None:
-                        input_range = range(1 << num_bits)
-                    else:
-                        input_range = input_ranges[i]
-                    args.append([BitVector[num_bits](x)
-                                 for x in input_range])
+                    domains.append((BitVector[num_bits], input_range))
+            elif not skip_unsupported:
+                raise NotImplementedError(type(port))
+    return domains
+
+
+def get_output_types(circuit):
+    types = []
+    for name, port in circuit.IO.items():
+        if port.isoutput():
+            if isinstance(port, BitKind):
+                types.append(Bit)
+            elif isinstance(port, SIntKind):
+                types.append(SIntVector[len(port)])
+            elif isinstance(port, ArrayKind) and isinstance(port.T, BitKind):
+                types.append(BitVector[len(port)])
             else:
                 raise NotImplementedError(type(port))
+    return types
 
-    tests = []
-    for test in product(*args):
-        result = func(*list(test))
-        test = [list(test), []]
-        if isinstance(result, tuple):
-            test[-1].extend(result)
+
+def domain_size(values):
+    # len() fails for ranges of more than sys.maxsize values
+    if isinstance(values, range):
+        step = values.step
+        span = values.stop - values.start + step - (1 if step > 0 else -1)
+        return max(0, span // step)
+    return len(values)
+
+
+def splitmix64(x):
+    # hash of each element of a uint64 array
+    x = x + np.uint64(0x9e3779b97f4a7c15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def iter_indices(total, chunk_size=4096, shard=0, num_shards=1,
+                 samples=None, seed=0):
+    """
+    Yields arrays of indices into the product of input domains (of `total`
+    vectors), in increasing order.
+
+    With `samples` (stratified mode), the index space is split into
+    `samples` strata of (nearly) equal size and one index is drawn from each
+    stratum.  The index drawn from a stratum only depends on `seed` and the
+    stratum, so the vectors don't depend on `chunk_size` or `num_shards`.
+
+    The vectors (or strata) are split into `num_shards` contiguous blocks,
+    and only those of block `shard` are yielded, so the shards together
+    cover every vector exactly once.
+    """
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"shard should be in [0, {num_shards}), got {shard}")
+    stratified = samples is not None and samples < total
+    count = samples if stratified else total
+    # indices that may not fit in 64 bits are handled as Python ints
+    if total < (1 << 63):
+        dtype = np.int64
+    elif total <= (1 << 64):
+        dtype = np.uint64
+    else:
+        dtype = object
+    if stratified:
+        # the first r strata have q + 1 vectors, the others q
+        q, r = divmod(total, count)
+        q, r = np.array([q, r], dtype=dtype)
+    start = shard * count // num_shards
+    stop = (shard + 1) * count // num_shards
+    for begin in range(start, stop, chunk_size):
+        points = np.arange(begin, min(begin + chunk_size, stop), dtype=dtype)
+        if not stratified:
+            yield points
+            continue
+        larger = points < r
+        low = points * q + np.where(larger, points, r)
+        width = q + larger.astype(dtype)
+        if dtype is not object:
+            keys = points.astype(np.uint64) ^ \
+                splitmix64(np.array([seed], dtype=np.uint64))
+            offsets = splitmix64(keys) % width.astype(np.uint64)
+            yield low + offsets.astype(dtype)
+        else:
+            yield low + np.array([random.Random(f"{seed}:{point}")
+                                  .randrange(size)
+                                  for point, size in zip(points, width)],
+                                 dtype=object)
+
+
+def decode_indices(indices, domains):
+    """
+    Returns the integer values of each input for `indices` (see
+    iter_indices), the last input varying fastest as in itertools.product.
+    """
+    columns = []
+    for type_, values in reversed(domains):
+        size = domain_size(values)
+        if indices.dtype != object and size > np.iinfo(indices.dtype).max:
+            # every index is smaller than the domain size
+            digits, indices = indices, np.zeros_like(indices)
+        else:
+            digits = indices % size
+            indices = indices // size
+        if size <= (1 << 63):
+            # digits are smaller than the size, so they fit in 63 bits
+            digits = digits.astype(np.int64)
+        if isinstance(values, range) and digits.dtype != object and \
+                max(abs(values.start), abs(values.stop)) < (1 << 62):
+            columns.append(values.start + digits * values.step)
+        elif isinstance(values, range):
+            columns.append(np.array([values[digit] for digit in digits],
+                                    dtype=object))
         else:
-            test[-1].append(result)
-        tests.append(test)
+            column = np.array(list(values))
+            if column.dtype.kind not in 'iub':
+                column = np.array(list(values), dtype=object)
+            columns.append(column[digits.astype(np.int64)])
+    return columns[::-1]
+
+
+def to_objects(columns, domains):
+    # rows of input values, as Bits and BitVectors
+    lists = [[type_(value) for value in column.tolist()]
+             for column, (type_, _) in zip(columns, domains)]
+    return [list(row) for row in zip(*lists)]
+
+
+def from_arrays(result, types, length):
+    # converts the result of a vectorized function to rows of output values
+    if not isinstance(result, tuple):
+        result = (result,)
+    if len(result) != len(types):
+        raise ValueError(f"Expected {len(types)} outputs, got {len(result)}")
+    lists = []
+    for values, type_ in zip(result, types):
+        values = np.broadcast_to(np.asarray(values), (length,)).tolist()
+        width = 1 if type_ is Bit else type_.size
+        mask = (1 << width) - 1
+        if type_ is Bit:
+            lists.append([Bit(int(value) & 1) for value in values])
+        else:
+            lists.append([type_(int(value) & mask) for value in values])
+    return [list(row) for row in zip(*lists)]
+
+
+def iter_input_columns(domains, mode='complete', chunk_size=4096, shard=0,
+                       num_shards=1, samples=None, seed=0):
+    # yields chunks of input values, as one array per input (see
+    # decode_indices)
+    if mode not in ('complete', 'stratified'):
+        raise NotImplementedError(mode)
+    if mode == 'stratified' and samples is None:
+        raise ValueError("samples is required in stratified mode")
+    total = 1
+    for _, values in domains:
+        total *= domain_size(values)
+    for indices in iter_indices(total, chunk_size, shard, num_shards,
+                                samples if mode == 'stratified' else None,
+                                seed):
+        yield decode_indices(indices, domains)
+
+
+def iter_function_tests(circuit, func, input_ranges=None, mode='complete',
+                        chunk_size=4096, shard=0, num_shards=1, samples=None,
+                        seed=0, vectorized=False):
+    # yields chunks of [inputs, outputs] pairs
+    check(circuit, func)
+    domains = get_input_domains(circuit, input_ranges)
+    if vectorized:
+        output_types = get_output_types(circuit)
+    for columns in iter_input_columns(domains, mode, chunk_size, shard,
+                                      num_shards, samples, seed):
+        inputs = to_objects(columns, domains)
+        if vectorized:
+            outputs = from_arrays(func(*columns), output_types, len(inputs))
+            yield [[test, output] for test, output in zip(inputs, outputs)]
+            continue
+        tests = []
+        for test in inputs:
+            result = func(*test)
+            if isinstance(result, tuple):
+                tests.append([test, list(result)])
+            else:
+                tests.append([test, [result]])
+        yield tests
+
+
+def iter_function_test_vectors(circuit, func, input_ranges=None,
+                               mode='complete', chunk_size=4096, shard=0,
+                               num_shards=1, samples=None, seed=0,
+                               vectorized=False):
+    """
+    Generator version of `generate_function_test_vectors`, for input spaces
+    too large to hold in memory.  Yields lists of at most `chunk_size` test
+    vectors, each being the input values followed by the outputs of `func`
+    for them (as with flatten=False).
+
+    `mode`: 'complete' covers the product of the input ranges in the order
+        of itertools.product, 'stratified' draws `samples` vectors spread
+        evenly over it (see iter_indices), with `seed`
+    `shard`, `num_shards`: only yield the vectors of shard number `shard`
+        out of `num_shards` contiguous, deterministic shards, e.g. to split
+        a sweep across processes or machines
+    `vectorized`: call `func` once per chunk with a NumPy integer array for
+        each input (signed for SInt inputs, 0/1 for Bit inputs), returning
+        an array (or a tuple of arrays) of outputs, which are truncated to
+        the width of the output ports.  Only use this if `func` computes
+        the same results on arrays as on Bits and BitVectors.
+    """
+    for tests in iter_function_tests(circuit, func, input_ranges, mode,
+                                     chunk_size, shard, num_shards, samples,
+                                     seed, vectorized):
+        yield [test[0] + test[1] for test in tests]
+
+
+def map_function_test_vectors(circuit, func, consumer, num_shards=None,
+                              processes=None, **kwargs):
+    """
+    Splits the test vectors of `iter_function_test_vectors` into
+    `num_shards` shards (defaults to the number of processes) processed in
+    parallel, and returns [consumer(chunks) for each shard], where `chunks`
+    is the iterator over the chunks of test vectors of the shard.  `consumer`
+    should return a summary of the vectors (e.g. counts or failures), which
+    is sent back from the worker process, so memory use is bounded by the
+    chunk size.  The remaining arguments are passed to
+    `iter_function_test_vectors`.
+    """
+    if num_shards is None:
+        num_shards = processes or os.cpu_count()
+
+    def run_shard(shard):
+        return consumer(iter_function_test_vectors(
+            circuit, func, shard=shard, num_shards=num_shards, **kwargs))
+
+    return fork_map(run_shard, range(num_shards), processes)
+
+
+@pytest.mark.skip(reason="Not a test")
+def generate_function_test_vectors(circuit, func, input_ranges=None,
+                                   mode='complete', flatten=True):
+    tests = []
+    for chunk in iter_function_tests(circuit, func, input_ranges):
+        tests += chunk
     if flatten:
         tests = flatten_tests(tests)
     else:
@@ -110,41 +344,85 @@ def generate_function_test_vectors(circuit, func, input_ranges=None,
     return tests
 
 
-def generate_simulator_test_vectors(circuit, input_ranges=None,
-                                    mode='complete', flatten=True):
-    ntest = len(circuit.interface.ports.items())
+def iter_simulator_tests(circuit, input_ranges=None, mode='complete',
+                         chunk_size=4096, shard=0, num_shards=1, samples=None,
+                         seed=0, backend='python'):
+    # yields chunks of [inputs, outputs] pairs
+    if backend not in ('python', 'numpy'):
+        raise NotImplementedError(backend)
+    domains = get_input_domains(circuit, input_ranges, skip_unsupported=True)
+    if backend == 'numpy':
+        # the circuit is only compiled once, for simulators of every chunk
+        graph = coreir_graph(circuit)
+    else:
+        simulator = PythonSimulator(circuit)
+    for columns in iter_input_columns(domains, mode, chunk_size, shard,
+                                      num_shards, samples, seed):
+        inputs = to_objects(columns, domains)
+        if backend == 'numpy':
+            yield numpy_simulator_tests(circuit, columns, inputs, graph)
+        else:
+            yield python_simulator_tests(circuit, inputs, simulator)
 
-    simulator = PythonSimulator(circuit)
 
-    args = []
-    for i, (name, port) in enumerate(circuit.IO.items()):
-        if port.isinput():
-            if isinstance(port, BitKind):
-                args.append([Bit(0), Bit(1)])
-            elif isinstance(port, ArrayKind) and isinstance(port.T, BitKind):
-                num_bits = port.N
-                if isinstance(port, SIntKind):
-                    if input_ranges is None:
-                        start = -2**(num_bits - 1)
-                        # We don't subtract one because range end is exclusive
-                        end = 2**(num_bits - 1)
-                        input_range = range(start, end)
-                    else:
-                        input_range = input_ranges[i]
-                    args.append([SIntVector[num_bits](x)
-                                 for x in input_range])
-                else:
-                    if input_ranges is None:
-                        input_range = range(1 << num_bits)
-                    else:
-                        input_range = input_ranges[i]
-                    args.append([BitVector[num_bits](x)
-                                 for x in input_range])
-            else:
-                assert True, "can't test Tuples"
+def iter_simulator_test_vectors(circuit, input_ranges=None, mode='complete',
+                                chunk_size=4096, shard=0, num_shards=1,
+                                samples=None, seed=0, backend='python'):
+    """
+    Generator version of `generate_simulator_test_vectors`, for input spaces
+    too large to hold in memory.  Yields lists of at most `chunk_size` test
+    vectors, each being the input values followed by the outputs of the
+    circuit for them (as with flatten=False).  With the 'numpy' backend,
+    each chunk is evaluated as one NumpySimulator batch.
+
+    `mode`, `samples`, `seed`, `shard` and `num_shards` are as in
+    `iter_function_test_vectors`.
+    """
+    for tests in iter_simulator_tests(circuit, input_ranges, mode,
+                                      chunk_size, shard, num_shards, samples,
+                                      seed, backend):
+        yield [test[0] + test[1] for test in tests]
+
+
+def map_simulator_test_vectors(circuit, consumer, num_shards=None,
+                               processes=None, **kwargs):
+    """
+    Version of `map_function_test_vectors` for the test vectors of
+    `iter_simulator_test_vectors`, to which the remaining arguments are
+    passed.
+    """
+    if num_shards is None:
+        num_shards = processes or os.cpu_count()
+
+    def run_shard(shard):
+        return consumer(iter_simulator_test_vectors(
+            circuit, shard=shard, num_shards=num_shards, **kwargs))
+
+    return fork_map(run_shard, range(num_shards), processes)
+
 
+def generate_simulator_test_vectors(circuit, input_ranges=None,
+                                    mode='complete', flatten=True,
+                                    backend='python'):
+    """
+    `backend`: 'python' evaluates each test vector with the magma
+        PythonSimulator, 'numpy' evaluates them in batches with the
+        vectorized NumpySimulator (much faster for large input ranges)
+    """
     tests = []
-    for test in product(*args):
+    for chunk in iter_simulator_tests(circuit, input_ranges,
+                                      backend=backend):
+        tests += chunk
+    if flatten:
+        tests = flatten_tests(tests)
+    else:
+        tests = [test[0] + test[1] for test in tests]
+    return tests
+
+
+def python_simulator_tests(circuit, inputs, simulator):
+    tests = []
+    for test in inputs:
         testv = [list(test), []]
         j = 0
         for i, (name, port) in enumerate(circuit.IO.items()):
@@ -166,9 +444,29 @@ def generate_simulator_test_vectors(circuit, input_ranges=None,
                 testv[1].append(val)
 
         tests.append(testv)
-
-    if flatten:
-        tests = flatten_tests(tests)
-    else:
-        tests = [test[0] + test[1] for test in tests]
     return tests
+
+
+def numpy_simulator_tests(circuit, columns, inputs, graph=None):
+    # evaluate a chunk of input values (see decode_indices) in one batch
+    simulator = NumpySimulator(circuit, batch=len(inputs), graph=graph)
+    names = [name for name, port in circuit.IO.items() if port.isinput()]
+    for name, column in zip(names, columns):
+        if column.dtype == object:
+            # values of 63 or 64 bit inputs, in two's complement
+            column = np.array([value % (1 << 64) for value in column],
+                              dtype=np.uint64)
+        simulator.set_value(getattr(circuit, name), column)
+    simulator.evaluate()
+
+    outputs = []
+    for name, port in circuit.IO.items():
+        if port.isoutput():
+            values = simulator.get_value(getattr(circuit, name)).tolist()
+            if isinstance(port, BitKind):
+                outputs.append([bool(x) for x in values])
+            else:
+                outputs.append([BitVector[len(port)](x) for x in values])
+
+    return [[test, [output[k] for output in outputs]]
+            for k, test in enumerate(inputs)]
@@ -13,7 +13,10 @@ from fault.verilator_target import VerilatorTarget
 from fault.system_verilog_target import SystemVerilogTarget
 from fault.verilogams_target import VerilogAMSTarget
 from fault.spice_target import SpiceTarget
+from fault.numpy_target import NumpyTarget
 from fault.actions import Loop, While, If
+from fault.action_store import ActionStore
+from fault.drive import DriveColumn
 from fault.circuit_utils import check_interface_is_subset
 from fault.wrapper import CircuitWrapper, PortWrapper
 from fault.file import File
@@ -24,6 +27,7 @@ import inspect
 from fault.config import get_test_dir
 from typing import List
 import tempfile
+import fault.instrumentation as instrumentation
 
 
 class Tester:
@@ -60,7 +64,7 @@ class Tester:
 
     def __init__(self, circuit: m.Circuit, clock: m.ClockType = None,
                  reset: m.ResetType = None, poke_delay_default=None,
-                 expect_strict_default=False):
+                 expect_strict_default=False, compact_actions=False):
         """
         `circuit`: the device under test (a magma circuit)
         `clock`: optional, a port from `circuit` corresponding to the clock
@@ -69,11 +73,16 @@ class Tester:
         at None, the target-specific default will be used.
         `expect_strict_default`: if True, use strict equality check if
         not specified by the user.
+        `compact_actions`: if True, store actions in an ActionStore, which
+        keeps pokes, expects and steps in typed columns rather than as
+        individual objects.  This greatly reduces the memory used by long
+        tests.
         """
         self._circuit = circuit
         self.poke_delay_default = poke_delay_default
         self.expect_strict_default = expect_strict_default
-        self.actions = []
+        self.compact_actions = compact_actions
+        self.actions = ActionStore() if compact_actions else []
         if clock is not None and not isinstance(clock, m.ClockType):
             raise TypeError(f"Expected clock port: {clock, type(clock)}")
         self.clock = clock
@@ -90,7 +99,7 @@ class Tester:
         corresponding target object.
 
         Supported values of target: "verilator", "coreir", "python",
-            "system-verilog", "verilog-ams"
+            "system-verilog", "verilog-ams", "spice", "numpy"
         """
         if target == "verilator":
             return VerilatorTarget(self._circuit, **kwargs)
@@ -112,6 +121,8 @@ class Tester:
             return VerilogAMSTarget(self._circuit, **kwargs)
         elif target == "spice":
             return SpiceTarget(self._circuit, **kwargs)
+        elif target == "numpy":
+            return NumpyTarget(self._circuit, clock=self.clock, **kwargs)
         raise NotImplementedError(target)
 
     def is_recursive_type(self, T):
@@ -203,6 +214,79 @@ class Tester:
         """
         self.actions.append(actions.Eval())
 
+    def drive(self, pokes, expect=None, step_per_row=True):
+        """
+        Records a table of cycles in one call.  `pokes` and `expect` map
+        ports (or port names) to arrays with one value per row (they may also
+        be given as sequences of (port, values) pairs).  For each
+        row, the `pokes` values are poked, the DUT is evaluated, the
+        `expect` values are checked, and the clock is stepped by a full
+        cycle (or by `step_per_row` steps if it's an integer, or not at all
+        if it's False).
+
+        Values are integers (negative values are taken as two's complement)
+        or, for ports wider than 63 bits, either Python integers or 2-D
+        arrays with one row of 32-bit words per value, least significant
+        word first.  Real-valued ports take floats.  All values are checked
+        against the width of their port before any action is recorded.
+        """
+        expect = expect if expect is not None else {}
+        if isinstance(pokes, dict):
+            pokes = pokes.items()
+        if isinstance(expect, dict):
+            expect = expect.items()
+        pokes = [DriveColumn(self.drive_port(port), values)
+                 for port, values in pokes]
+        expects = [DriveColumn(self.drive_port(port), values)
+                   for port, values in expect]
+        if len(pokes) == 0 and len(expects) == 0:
+            raise ValueError("Nothing to drive")
+        rows = {len(column) for column in pokes + expects}
+        if len(rows) != 1:
+            raise ValueError(f"All columns must have the same number of "
+                             f"rows (got {sorted(rows)})")
+        rows = rows.pop()
+        for column in pokes:
+            if actions.is_input(column.port):
+                raise ValueError(f"Can only poke inputs: "
+                                 f"{column.port.debug_name}")
+        steps = 2 if step_per_row is True else int(step_per_row)
+        if steps and self.clock is None:
+            raise RuntimeError("Stepping tester without a clock (did you "
+                               "specify a clock during initialization?)")
+
+        delay = self.poke_delay_default
+        if isinstance(self.actions, ActionStore) and \
+                (delay is None or type(delay) is float):
+            self.actions.append_table(pokes, expects, self.clock, steps,
+                                      delay)
+            return
+
+        poke_values = [column.objects() for column in pokes]
+        expect_values = [column.objects() for column in expects]
+        for k in range(rows):
+            for column, values in zip(pokes, poke_values):
+                self.actions.append(actions.Poke(column.port, values[k],
+                                                 delay=delay))
+            self.actions.append(actions.Eval())
+            for column, values in zip(expects, expect_values):
+                self.actions.append(actions.Expect(column.port, values[k]))
+            if steps:
+                self.actions.append(actions.Step(self.clock, steps))
+
+    def drive_port(self, port):
+        # top-level port given by name or through tester.circuit
+        if isinstance(port, str):
+            return self._circuit.interface.ports[port]
+        if isinstance(port, PortWrapper):
+            port = port.select_path
+        if isinstance(port, SelectPath):
+            if len(port) > 2:
+                raise NotImplementedError(
+                    "Only top-level ports can be driven with drive()")
+            port = port[-1]
+        return port
+
     def delay(self, time):
         """
         Wait the specified amount of time before proceeding
@@ -218,13 +302,19 @@ class Tester:
                                "specify a clock during initialization?)")
         self.actions.append(actions.Step(self.clock, steps))
 
-    def serialize(self):
+    def serialize(self, file=None):
         """
         Serialize the action sequence into a set of test vectors
+
+        If `file` is given, the vectors are also saved to it in binary form
+        (see VectorStore.save), and can be loaded back with
+        `fault.vector_builder.VectorStore.load` to be compared or replayed.
         """
         builder = VectorBuilder(self._circuit)
         for action in self.actions:
             builder.process(action)
+        if file is not None:
+            builder.save(file)
         return builder.vectors
 
     def _make_directory(self, directory):
@@ -292,8 +382,10 @@ class Tester:
         that the build directory already exists (this allow for some
         in using temporary vs. persistent directories)
         """
-        self._compile(target, **kwargs)
-        self.run(target)
+        with instrumentation.run(target=target, circuit=self._circuit.name,
+                                 actions=len(self.actions)):
+            self._compile(target, **kwargs)
+            self.run(target)
 
     def compile_and_run(self, target="verilator", tmp_dir=False, **kwargs):
         """
@@ -339,7 +431,7 @@ class Tester:
         Reset the tester by removing any existing actions. Useful for reusing a
         Tester (e.g. one with verilator already compiled).
         """
-        self.actions = []
+        self.actions = ActionStore() if self.compact_actions else []
 
     def __str__(self):
         """
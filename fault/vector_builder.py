@@ -1,62 +1,396 @@
+import json
+from array import array
+from bisect import bisect_right
+import numpy as np
 from hwtypes import BitVector
 import magma
 import fault.actions as actions
-from fault.value_utils import make_value
-from fault.value import AnyValue
+from fault.array import Array
+from fault.value import Value, AnyValue
+from fault.real_type import RealType, RealKind
+
+
+# States of a stored value
+VALUE = 0
+OBJECT = 1 + len(Value)
+# ... and 1 + member.value for each member of fault.value.Value
+
+# Version of the binary vector file format
+FORMAT_VERSION = 1
+
+
+class VectorStore:
+    """
+    Test vectors (the value of each leaf port at each cycle), stored column
+    by column.  Only changes are recorded: for each leaf, the cycles at
+    which its value changes and the new values, so the memory used is
+    proportional to the number of changes rather than to ports x cycles.
+
+    Values of leaves of up to 63 bits are stored as integers, wider values
+    as 32-bit words, real values as doubles, and AnyValue/UnknownValue/HiZ
+    as states.  Any other value (e.g. a Peek) is kept as an object, but
+    can't be saved.
+    """
+    def __init__(self, names, widths):
+        """
+        `names`: name of each leaf
+        `widths`: width of each leaf (None for real-valued leaves)
+        """
+        self.names = list(names)
+        self.widths = list(widths)
+        n = len(self.names)
+        self.cycles = [array('Q') for _ in range(n)]
+        self.states = [array('B') for _ in range(n)]
+        self.codes = [array('q') for _ in range(n)]
+        self.words = [array('I') for _ in range(n)]
+        self.reals = [array('d') for _ in range(n)]
+        self.objects = [[] for _ in range(n)]
+        # values of the current (last) cycle, and the last recorded value of
+        # each leaf as (state, payload)
+        self.current = [AnyValue] * n
+        self.last = [None] * n
+        self.dirty = set(range(n))
+        self.length = 1
+
+    def __len__(self):
+        return self.length
+
+    def set(self, leaf, value):
+        self.current[leaf] = value
+        self.dirty.add(leaf)
+
+    def get(self, leaf):
+        return self.current[leaf]
+
+    def encode(self, leaf, value):
+        # (state, payload) of a value, compared to detect changes
+        if isinstance(value, Value):
+            return 1 + value.value, None
+        width = self.widths[leaf]
+        if width is None and isinstance(value, (int, float)) and \
+                not isinstance(value, bool):
+            return VALUE, float(value)
+        if width is not None and isinstance(value, BitVector) and \
+                len(value) == width:
+            return VALUE, value.as_uint()
+        return OBJECT, value
+
+    def commit(self):
+        # record the leaves whose value changed in the current cycle
+        cycle = self.length - 1
+        for leaf in sorted(self.dirty):
+            state, payload = self.encode(leaf, self.current[leaf])
+            last = self.last[leaf]
+            if last is not None and last[0] == state:
+                if last[1] is payload or state != OBJECT and \
+                        last[1] == payload:
+                    continue
+            self.last[leaf] = (state, payload)
+            if self.cycles[leaf] and self.cycles[leaf][-1] == cycle:
+                # changed again in the same cycle
+                for column in [self.cycles, self.states, self.codes]:
+                    column[leaf].pop()
+            self.cycles[leaf].append(cycle)
+            self.states[leaf].append(state)
+            self.codes[leaf].append(self.store_payload(leaf, state, payload))
+        self.dirty.clear()
+
+    def store_payload(self, leaf, state, payload):
+        if state == OBJECT:
+            self.objects[leaf].append(payload)
+            return len(self.objects[leaf]) - 1
+        if state != VALUE:
+            return 0
+        width = self.widths[leaf]
+        if width is None:
+            self.reals[leaf].append(payload)
+            return len(self.reals[leaf]) - 1
+        if width <= 63:
+            return payload
+        n = (width + 31) // 32
+        self.words[leaf].frombytes(payload.to_bytes(4 * n, 'little'))
+        return len(self.words[leaf]) // n - 1
+
+    def next_cycle(self):
+        """
+        Ends the current cycle.  The next one starts with the same values.
+        """
+        self.commit()
+        self.length += 1
+
+    def decode(self, leaf, k):
+        # value of the k-th change of a leaf
+        state = self.states[leaf][k]
+        code = self.codes[leaf][k]
+        if state == VALUE:
+            width = self.widths[leaf]
+            if width is None:
+                return self.reals[leaf][code]
+            if width <= 63:
+                return BitVector[width](code)
+            n = (width + 31) // 32
+            data = self.words[leaf][n * code:n * (code + 1)].tobytes()
+            return BitVector[width](int.from_bytes(data, 'little'))
+        if state == OBJECT:
+            return self.objects[leaf][code]
+        return Value(state - 1)
+
+    def value(self, leaf, cycle):
+        """
+        Returns the value of `leaf` at `cycle`.
+        """
+        self.commit()
+        k = bisect_right(self.cycles[leaf], cycle) - 1
+        return self.decode(leaf, k)
+
+    def vectors(self):
+        """
+        Returns the vector of leaf values for each cycle (as lists).
+        """
+        self.commit()
+        n = len(self.names)
+        pos = [0] * n
+        current = [None] * n
+        vectors = []
+        for cycle in range(self.length):
+            for leaf in range(n):
+                cycles = self.cycles[leaf]
+                if pos[leaf] < len(cycles) and cycles[pos[leaf]] == cycle:
+                    current[leaf] = self.decode(leaf, pos[leaf])
+                    pos[leaf] += 1
+            vectors.append(list(current))
+        return vectors
+
+    def column(self, leaf):
+        """
+        Returns the changes of `leaf` (a name or a number) as NumPy arrays
+        (cycles, states, values): the cycle of each change, its state
+        (VALUE, or 1 + the value of a fault.value.Value), and the new value.
+        Values are int64 for leaves of up to 63 bits, rows of 32-bit words
+        for wider leaves, and float64 for real-valued leaves.
+        """
+        self.commit()
+        if isinstance(leaf, str):
+            leaf = self.names.index(leaf)
+        cycles = np.frombuffer(self.cycles[leaf], dtype=np.uint64)
+        states = np.frombuffer(self.states[leaf], dtype=np.uint8)
+        if OBJECT in self.states[leaf]:
+            raise ValueError(f'{self.names[leaf]} has values that are not '
+                             f'constants')
+        codes = np.frombuffer(self.codes[leaf], dtype=np.int64)
+        width = self.widths[leaf]
+        if width is not None and width <= 63:
+            values = np.where(states == VALUE, codes, 0)
+        elif width is None:
+            reals = np.frombuffer(self.reals[leaf], dtype=np.float64)
+            values = np.zeros(len(codes))
+            values[states == VALUE] = reals[codes[states == VALUE]]
+        else:
+            n = (width + 31) // 32
+            words = np.frombuffer(self.words[leaf],
+                                  dtype=np.uint32).reshape(-1, n)
+            values = np.zeros((len(codes), n), dtype=np.uint32)
+            values[states == VALUE] = words[codes[states == VALUE]]
+        return cycles, states, values
+
+    def dense(self, leaf):
+        """
+        Returns (states, values) of `leaf` at every cycle, expanded from its
+        changes.
+        """
+        cycles, states, values = self.column(leaf)
+        lengths = np.diff(np.append(cycles.astype(np.int64), self.length))
+        return np.repeat(states, lengths), np.repeat(values, lengths, axis=0)
+
+    def diff(self, other):
+        """
+        Compares with the vectors of `other`, returning a dictionary mapping
+        the name of each leaf that differs to the array of cycles at which
+        it differs.  Cycles present in only one of the stores are counted as
+        differences.
+        """
+        if self.names != other.names or self.widths != other.widths:
+            raise ValueError('Vectors are for different ports')
+        length = min(self.length, other.length)
+        result = {}
+        for leaf, name in enumerate(self.names):
+            states0, values0 = self.dense(leaf)
+            states1, values1 = other.dense(leaf)
+            differ = states0[:length] != states1[:length]
+            same_values = values0[:length] == values1[:length]
+            if same_values.ndim > 1:
+                same_values = np.all(same_values, axis=1)
+            differ |= (states0[:length] == VALUE) & ~same_values
+            cycles = np.flatnonzero(differ)
+            if self.length != other.length:
+                cycles = np.append(cycles, np.arange(
+                    length, max(self.length, other.length)))
+            if len(cycles) > 0:
+                result[name] = cycles
+        return result
+
+    def save(self, file):
+        """
+        Saves the vectors to `file` (a file name or file object) in a
+        compressed NumPy .npz archive.
+        """
+        header = {'version': FORMAT_VERSION, 'names': self.names,
+                  'widths': self.widths, 'length': self.length}
+        data = {'header': np.array(json.dumps(header))}
+        for leaf in range(len(self.names)):
+            cycles, states, values = self.column(leaf)
+            data[f'cycles_{leaf}'] = cycles
+            data[f'states_{leaf}'] = states
+            data[f'values_{leaf}'] = values
+        np.savez_compressed(file, **data)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Loads vectors saved with `save`.
+        """
+        with np.load(file) as data:
+            header = json.loads(str(data['header']))
+            if header['version'] != FORMAT_VERSION:
+                raise ValueError(f"Unsupported vector file version "
+                                 f"{header['version']}")
+            store = cls(header['names'], header['widths'])
+            store.length = header['length']
+            for leaf, width in enumerate(store.widths):
+                cycles = data[f'cycles_{leaf}']
+                states = data[f'states_{leaf}']
+                values = data[f'values_{leaf}']
+                store.cycles[leaf] = array('Q', cycles.tolist())
+                store.states[leaf] = array('B', states.tolist())
+                if width is None:
+                    store.reals[leaf] = array('d', values.tolist())
+                    codes = np.arange(len(values))
+                elif width <= 63:
+                    codes = values
+                else:
+                    store.words[leaf].frombytes(
+                        values.astype('<u4').tobytes())
+                    codes = np.arange(len(values))
+                store.codes[leaf] = array('q', codes.tolist())
+                if len(cycles) > 0:
+                    k = len(cycles) - 1
+                    store.current[leaf] = store.decode(leaf, k)
+                    store.last[leaf] = store.encode(leaf,
+                                                    store.current[leaf])
+            store.dirty.clear()
+        return store
 
 
 class VectorBuilder:
+    """
+    Builds test vectors from a sequence of actions: each Eval (or clock
+    step) ends a cycle, inputs keep their values from one cycle to the next,
+    and outputs are only known in the cycles in which they are expected.
+
+    Ports are split into leaves (bits or bit vectors, or real values) whose
+    values are stored in a VectorStore.  `vectors` returns the vectors as
+    lists with one value per top-level port.
+    """
     def __init__(self, circuit):
         self.circuit = circuit
         self.port_to_index = {}
+        self.names = []
+        self.widths = []
+        # for each top-level port, its leaf number, or a list of the trees
+        # of its elements
+        self.trees = []
+        self.outputs = []
         for i, port in enumerate(self.circuit.interface.ports.values()):
             self.port_to_index[port] = i
-        self.vectors = [self.__empty_vector()]
+            tree = self.__add_leaves(port)
+            self.trees.append(tree)
+            if port.isinput():
+                self.outputs += self.__leaves(tree)
+        self.store = VectorStore(self.names, self.widths)
 
-    def __empty_vector(self):
-        ports = self.circuit.interface.ports
-        return [make_value(port, AnyValue) for port in ports.values()]
+    def __add_leaves(self, port):
+        if isinstance(port, (RealType, RealKind)):
+            width = None
+        elif isinstance(port, magma._BitType):
+            width = 1
+        elif isinstance(port, magma.ArrayType):
+            if isinstance(port.T, magma._BitKind):
+                width = len(port)
+            else:
+                return [self.__add_leaves(child) for child in port]
+        else:
+            raise NotImplementedError(port, type(port))
+        self.names.append(port.debug_name)
+        self.widths.append(width)
+        return len(self.names) - 1
+
+    def __leaves(self, tree):
+        if isinstance(tree, int):
+            return [tree]
+        return [leaf for child in tree for leaf in self.__leaves(child)]
 
-    def __indices(self, port):
+    def __tree(self, port):
         if port in self.port_to_index:
-            return (self.port_to_index[port],)
+            return self.trees[self.port_to_index[port]]
         if isinstance(port.name, magma.ref.ArrayRef):
-            indices = self.__indices(port.name.array)
-            return (*indices, port.name.index)
+            return self.__tree(port.name.array)[port.name.index]
         raise NotImplementedError(port, type(port))
 
-    def __get(self, indices):
-        out = self.vectors[-1]
-        for idx in indices:
-            out = out[idx]
-        return out
+    def __set(self, tree, value):
+        if isinstance(tree, int):
+            self.store.set(tree, value)
+        elif isinstance(value, Value):
+            for child in tree:
+                self.__set(child, value)
+        else:
+            for k, child in enumerate(tree):
+                self.__set(child, value[k])
 
-    def __set(self, indices, value):
-        parent = self.vectors[-1]
-        for idx in indices[:-1]:
-            parent = parent[idx]
-        parent[indices[-1]] = value
+    def __value(self, tree, cycle):
+        if isinstance(tree, int):
+            return self.store.value(tree, cycle)
+        return Array([self.__value(child, cycle) for child in tree],
+                     len(tree))
 
     def __eval(self):
-        self.vectors.append(self.vectors[-1].copy())
-        for port in self.circuit.interface.ports.values():
-            if port.isinput():
-                index = self.port_to_index[port]
-                self.vectors[-1][index] = make_value(port, AnyValue)
+        self.store.next_cycle()
+        for leaf in self.outputs:
+            self.store.set(leaf, AnyValue)
+
+    @property
+    def vectors(self):
+        """
+        The vectors as a list with, for each cycle, a list of the values of
+        the top-level ports.  Created on each access.
+        """
+        leaf_vectors = self.store.vectors()
+
+        def value(tree, vector):
+            if isinstance(tree, int):
+                return vector[tree]
+            return Array([value(child, vector) for child in tree], len(tree))
+
+        return [[value(tree, vector) for tree in self.trees]
+                for vector in leaf_vectors]
+
+    def save(self, file):
+        """
+        Saves the vectors in binary form (see VectorStore.save).
+        """
+        self.store.save(file)
 
     def process(self, action):
         if isinstance(action, (actions.Poke, actions.Expect)):
-            indices = self.__indices(action.port)
-            self.__set(indices, action.value)
+            self.__set(self.__tree(action.port), action.value)
         elif isinstance(action, actions.Eval):
             self.__eval()
         elif isinstance(action, actions.Step):
-            indices = self.__indices(action.clock)
-            val = self.__get(indices)
+            leaf = self.__tree(action.clock)
+            val = self.store.get(leaf)
             for step in range(action.steps):
                 val ^= BitVector[1](1)
                 self.__eval()
-                self.__set(indices, val)
+                self.store.set(leaf, val)
         elif isinstance(action, actions.Print):
             # Skip Print actions for test vectors
             return
@@ -0,0 +1,602 @@
+import math
+import struct
+import magma as m
+from hwtypes import BitVector, Bit
+import fault
+import fault.actions as actions
+import fault.action_store as action_store
+import fault.value_utils as value_utils
+from fault.select_path import SelectPath
+from fault.verilog_utils import verilator_name
+
+
+# Opcodes of the binary action stream.  The stream is a sequence of
+# little-endian 32-bit words, starting with STREAM_MAGIC and terminated by
+# END (or the end of the file):
+#     POKE   <port> <value words...>
+#     EXPECT <port> <action index> <value words...>
+#     EVAL
+#     STEP   <port> <steps>
+#     PEEK   <port>                  (writes the value words to the output)
+END = 0
+POKE = 1
+EXPECT = 2
+EVAL = 3
+STEP = 4
+PEEK = 5
+
+STREAM_MAGIC = 0x31544c46  # "FLT1"
+
+
+interp_tpl = """\
+{includes}
+#include <fcntl.h>
+#include <unistd.h>
+
+// Whether the model was built with --savable, so that checkpoints can be
+// taken (see fault_checkpoint) and the cycles before a failure replayed with
+// tracing enabled
+#define FAULT_CHECKPOINT {checkpoint}
+#if FAULT_CHECKPOINT
+#include "verilated_save.h"
+#endif
+
+vluint64_t main_time = 0;       // Current simulation time
+
+double sc_time_stamp () {{       // Called by $time in Verilog
+    return main_time;
+}}
+
+#if VM_TRACE
+VerilatedVcdC* tracer = NULL;
+#endif
+
+// Set while replaying the cycles before a failure from a checkpoint
+static bool fault_replaying = false;
+
+enum {{
+  FAULT_END = {END},
+  FAULT_POKE = {POKE},
+  FAULT_EXPECT = {EXPECT},
+  FAULT_EVAL = {EVAL},
+  FAULT_STEP = {STEP},
+  FAULT_PEEK = {PEEK}
+}};
+
+#define FAULT_STREAM_MAGIC {STREAM_MAGIC}u
+#define FAULT_MAX_WORDS {max_words}
+
+// Number of 32-bit words and mask of the most significant word of each port
+static const int fault_port_words[] = {{ {port_words} }};
+static const uint32_t fault_port_masks[] = {{ {port_masks} }};
+static const char* fault_port_names[] = {{ {port_names} }};
+
+// Buffered reader of 32-bit words that works for both files and pipes
+class FaultReader {{
+ public:
+  explicit FaultReader(int fd, off_t start = 0)
+      : fd(fd), pos(0), len(0), total(start) {{}}
+
+  // offset in the stream of the next word to be read
+  off_t offset() const {{ return total - (len - pos); }}
+
+  bool next(uint32_t& word) {{
+    unsigned char* out = reinterpret_cast<unsigned char*>(&word);
+    for (int k = 0; k < 4; k++) {{
+      if (pos == len) {{
+        ssize_t n = read(fd, buf, sizeof(buf));
+        if (n <= 0) return false;
+        pos = 0;
+        len = n;
+        total += n;
+      }}
+      out[k] = buf[pos++];
+    }}
+    return true;
+  }}
+
+  uint32_t get() {{
+    uint32_t word;
+    if (!next(word)) {{
+      std::cerr << "Unexpected end of action stream" << std::endl;
+      exit(1);
+    }}
+    return word;
+  }}
+
+ private:
+  int fd;
+  unsigned char buf[1 << 16];
+  ssize_t pos, len;
+  off_t total;
+}};
+
+static void fault_poke(V{circuit_name}* top, uint32_t port,
+                       const uint32_t* words) {{
+  switch (port) {{
+{poke_cases}
+    default:
+      std::cerr << "Cannot poke port " << port << std::endl;
+      exit(1);
+  }}
+}}
+
+static void fault_peek(V{circuit_name}* top, uint32_t port, uint32_t* words) {{
+  switch (port) {{
+{peek_cases}
+    default:
+      std::cerr << "Cannot peek port " << port << std::endl;
+      exit(1);
+  }}
+}}
+
+static void fault_toggle(V{circuit_name}* top, uint32_t port) {{
+  switch (port) {{
+{toggle_cases}
+    default:
+      std::cerr << "Cannot step port " << port << std::endl;
+      exit(1);
+  }}
+}}
+
+static void fault_dump() {{
+  main_time++;
+#if VM_TRACE
+  if (tracer) tracer->dump(main_time);
+#endif
+}}
+
+// Returns false (after reporting the mismatch) if the check fails
+static bool fault_expect(V{circuit_name}* top, uint32_t port,
+                         const uint32_t* expected, uint32_t i) {{
+  uint32_t got[FAULT_MAX_WORDS];
+  fault_peek(top, port, got);
+  int n = fault_port_words[port];
+  for (int k = 0; k < n; k++) {{
+    uint32_t mask = (k == n - 1) ? fault_port_masks[port] : 0xFFFFFFFFu;
+    if ((got[k] & mask) != (expected[k] & mask)) {{
+      // the mismatch was already reported before replaying
+      if (fault_replaying) return false;
+      std::cerr << std::endl;  // end the current line
+      std::cerr << "Got      : 0x" << std::hex;
+      for (int j = n - 1; j >= 0; j--)
+        std::cerr << std::setfill('0') << std::setw(j == n - 1 ? 1 : 8)
+                  << (got[j] & (j == n - 1 ? mask : 0xFFFFFFFFu));
+      std::cerr << std::endl;
+      std::cerr << "Expected : 0x" << std::hex;
+      for (int j = n - 1; j >= 0; j--)
+        std::cerr << std::setfill('0') << std::setw(j == n - 1 ? 1 : 8)
+                  << (expected[j] & (j == n - 1 ? mask : 0xFFFFFFFFu));
+      std::cerr << std::endl;
+      std::cerr << "i        : " << std::dec << i << std::endl;
+      std::cerr << "Port     : " << fault_port_names[port] << std::endl;
+      return false;
+    }}
+  }}
+  return true;
+}}
+
+#if FAULT_CHECKPOINT
+static std::string fault_checkpoint_file(int slot) {{
+  return "{circuit_name}_checkpoint_" + std::to_string(slot) + ".dat";
+}}
+
+// Saves the model state, the simulation time, and the position in the
+// action stream
+static void fault_checkpoint(V{circuit_name}* top, int slot, off_t offset) {{
+  VerilatedSave os;
+  os.open(fault_checkpoint_file(slot).c_str());
+  vluint64_t position = offset;
+  os << main_time << position;
+  os << *top;
+  os.close();
+}}
+
+static off_t fault_restore(V{circuit_name}* top, int slot) {{
+  VerilatedRestore os;
+  os.open(fault_checkpoint_file(slot).c_str());
+  vluint64_t position;
+  os >> main_time >> position;
+  os >> *top;
+  os.close();
+  return position;
+}}
+#endif
+
+// Executes the action stream until its end (returning 0) or a failed expect
+// (returning 1).  If `checkpoint_interval` is nonzero, the state is saved
+// every `checkpoint_interval` time steps, alternating between two slots so
+// that the older checkpoint is always at least one interval before a failure.
+static int fault_run(V{circuit_name}* top, FaultReader& reader, int out_fd,
+                     vluint64_t checkpoint_interval, int& checkpoints) {{
+  uint32_t words[FAULT_MAX_WORDS];
+  uint32_t op;
+#if FAULT_CHECKPOINT
+  vluint64_t next_checkpoint = main_time;
+#endif
+  while (reader.next(op) && op != FAULT_END) {{
+    switch (op) {{
+      case FAULT_POKE: {{
+        uint32_t port = reader.get();
+        for (int k = 0; k < fault_port_words[port]; k++)
+          words[k] = reader.get();
+        fault_poke(top, port, words);
+        break;
+      }}
+      case FAULT_EXPECT: {{
+        uint32_t port = reader.get();
+        uint32_t i = reader.get();
+        for (int k = 0; k < fault_port_words[port]; k++)
+          words[k] = reader.get();
+        if (!fault_expect(top, port, words, i)) return 1;
+        break;
+      }}
+      case FAULT_EVAL:
+        top->eval();
+        fault_dump();
+        break;
+      case FAULT_STEP: {{
+        uint32_t port = reader.get();
+        uint32_t steps = reader.get();
+        top->eval();
+        for (uint32_t k = 0; k < steps; k++) {{
+          fault_toggle(top, port);
+          top->eval();
+          fault_dump();
+        }}
+        break;
+      }}
+      case FAULT_PEEK: {{
+        uint32_t port = reader.get();
+        fault_peek(top, port, words);
+        fflush(stdout);
+        if (write(out_fd, words, 4 * fault_port_words[port]) < 0) {{
+          std::cerr << "Could not write peeked value" << std::endl;
+          exit(1);
+        }}
+        break;
+      }}
+      default:
+        std::cerr << "Unknown opcode " << op << std::endl;
+        exit(1);
+    }}
+#if FAULT_CHECKPOINT
+    // checkpoints are only taken between actions
+    if (checkpoint_interval > 0 && main_time >= next_checkpoint) {{
+      fault_checkpoint(top, checkpoints % 2, reader.offset());
+      checkpoints++;
+      next_checkpoint = main_time + checkpoint_interval;
+    }}
+#endif
+  }}
+  return 0;
+}}
+
+int main(int argc, char **argv) {{
+  Verilated::commandArgs(argc, argv);
+  V{circuit_name}* top = new V{circuit_name};
+
+  // +fault_checkpoint=<n> takes a checkpoint every n time steps.  Tracing is
+  // then only enabled when replaying the cycles before a failure.
+  vluint64_t checkpoint_interval = 0;
+  const char* checkpoint_arg =
+      Verilated::commandArgsPlusMatch("fault_checkpoint=");
+  if (FAULT_CHECKPOINT && checkpoint_arg[0])
+    checkpoint_interval = atoll(strchr(checkpoint_arg, '=') + 1);
+
+#if VM_TRACE
+  Verilated::traceEverOn(true);
+  if (checkpoint_interval == 0) {{
+    tracer = new VerilatedVcdC;
+    top->trace(tracer, 99);
+    mkdir("logs", S_IRWXU | S_IRWXG | S_IROTH | S_IXOTH);
+    tracer->open("logs/{circuit_name}.vcd");
+  }}
+#endif
+
+  // The action stream is read from the file named by the first argument, or
+  // from stdin if the argument is missing or "-".  Peeked values are written
+  // to the file descriptor given by the second argument (default stdout).
+  int in_fd = 0;
+  if (argc > 1 && std::string(argv[1]) != "-") {{
+    in_fd = open(argv[1], O_RDONLY);
+    if (in_fd < 0) {{
+      std::cerr << "Could not open action stream " << argv[1] << std::endl;
+      return 1;
+    }}
+  }} else {{
+    // the replay needs to seek back in the stream
+    checkpoint_interval = 0;
+  }}
+  int out_fd = (argc > 2) ? atoi(argv[2]) : 1;
+  FaultReader reader(in_fd);
+
+  if (reader.get() != FAULT_STREAM_MAGIC) {{
+    std::cerr << "Invalid action stream" << std::endl;
+    return 1;
+  }}
+
+  int checkpoints = 0;
+  int status = fault_run(top, reader, out_fd, checkpoint_interval,
+                         checkpoints);
+
+#if FAULT_CHECKPOINT
+  if (status != 0 && checkpoints > 0) {{
+    // Re-run from the older of the two checkpoints with tracing enabled, on a
+    // fresh model, up to the failure
+    int slot = (checkpoints >= 2) ? checkpoints % 2 : 0;
+    delete top;
+    top = new V{circuit_name};
+#if VM_TRACE
+    tracer = new VerilatedVcdC;
+    top->trace(tracer, 99);
+    mkdir("logs", S_IRWXU | S_IRWXG | S_IROTH | S_IXOTH);
+    tracer->open("logs/{circuit_name}_failure.vcd");
+#endif
+    off_t offset = fault_restore(top, slot);
+    lseek(in_fd, offset, SEEK_SET);
+    FaultReader replay_reader(in_fd, offset);
+    fault_replaying = true;
+    fault_run(top, replay_reader, out_fd, 0, checkpoints);
+#if VM_TRACE
+    // Dump one more timestep so we see the current values
+    fault_dump();
+    std::cerr << "Waveform of the failure: logs/{circuit_name}_failure.vcd"
+              << std::endl;
+#endif
+  }}
+#endif
+
+#if VM_TRACE
+  if (tracer) {{
+    if (status != 0 && checkpoint_interval == 0)
+      fault_dump();
+    tracer->close();
+  }}
+#endif
+  if (status != 0)
+    return status;
+  top->final();
+  delete top;
+}}
+"""  # nopep8
+
+
+def num_words(width):
+    return max(1, math.ceil(width / 32))
+
+
+class VerilatorPortTable:
+    """
+    Numbers the leaf (bit or bit vector) ports of a circuit so that actions
+    can refer to them in the binary action stream.  Arrays and tuples are
+    flattened the same way Verilator flattens them (e.g. I_0, I_1, ...).
+    """
+    def __init__(self, circuit):
+        self.names = []
+        self.debug_names = []
+        self.widths = []
+        self.pokeable = []
+        self.index = {}
+        for port in circuit.interface.ports.values():
+            self.add(port)
+
+    def add(self, port):
+        is_bits = isinstance(port, m.BitsType) or \
+            (isinstance(port, m.ArrayType) and isinstance(port.T, m._BitKind))
+        if isinstance(port, (m.TupleType, m.ArrayType)) and not is_bits:
+            for child in port:
+                self.add(child)
+            return
+        name = verilator_name(port.name)
+        self.index[name] = len(self.names)
+        self.names.append(name)
+        self.debug_names.append(port.debug_name)
+        self.widths.append(1 if isinstance(port, m._BitType) else len(port))
+        self.pokeable.append(port.isoutput())
+
+    def lookup(self, port):
+        if isinstance(port, SelectPath):
+            if len(port) > 2:
+                raise NotImplementedError(
+                    "Internal signals are not supported by the interpreter "
+                    "driver, use driver_mode='codegen' instead")
+            port = port[-1]
+        if isinstance(port, fault.WrappedVerilogInternalPort):
+            raise NotImplementedError(
+                "Internal signals are not supported by the interpreter "
+                "driver, use driver_mode='codegen' instead")
+        try:
+            return self.index[verilator_name(port.name)]
+        except KeyError:
+            raise NotImplementedError(port)
+
+    def words(self, port_id):
+        return num_words(self.widths[port_id])
+
+    def mask(self, port_id):
+        width = self.widths[port_id]
+        bits = width - 32 * (self.words(port_id) - 1)
+        return (1 << bits) - 1
+
+    def generate_code(self, circuit_name, includes, checkpoint=False):
+        """
+        Returns the source of the interpreter driver.  If `checkpoint` is
+        True, the model must be built with --savable (and --trace to capture
+        the failure window), and the driver supports taking checkpoints.
+        """
+        poke_cases = []
+        peek_cases = []
+        toggle_cases = []
+        for k, (name, width) in enumerate(zip(self.names, self.widths)):
+            n = num_words(width)
+            if width <= 32:
+                peek = [f"words[0] = top->{name};"]
+                poke = [f"top->{name} = words[0];"]
+            elif width <= 64:
+                peek = [f"words[0] = (uint32_t) top->{name};",
+                        f"words[1] = (uint32_t) (top->{name} >> 32);"]
+                poke = [f"top->{name} = ((QData) words[1] << 32) | "
+                        f"words[0];"]
+            else:
+                peek = [f"for (int k = 0; k < {n}; k++) "
+                        f"words[k] = top->{name}[k];"]
+                poke = [f"for (int k = 0; k < {n}; k++) "
+                        f"top->{name}[k] = words[k];"]
+            peek_cases += [f"    case {k}:"]
+            peek_cases += [f"      {line}" for line in peek + ["break;"]]
+            if self.pokeable[k]:
+                poke_cases += [f"    case {k}:"]
+                poke_cases += [f"      {line}" for line in poke + ["break;"]]
+                if width == 1:
+                    toggle_cases += [f"    case {k}:",
+                                     f"      top->{name} ^= 1;",
+                                     "      break;"]
+
+        includes = includes + ['<iomanip>', '<string>', '<cstring>']
+        return interp_tpl.format(
+            includes="\n".join("#include " + i for i in includes),
+            circuit_name=circuit_name,
+            checkpoint=int(checkpoint),
+            END=END, POKE=POKE, EXPECT=EXPECT, EVAL=EVAL, STEP=STEP,
+            PEEK=PEEK, STREAM_MAGIC=STREAM_MAGIC,
+            max_words=max(num_words(w) for w in self.widths),
+            port_words=", ".join(str(num_words(w)) for w in self.widths),
+            port_masks=", ".join(f"0x{self.mask(k):x}u"
+                                 for k in range(len(self.widths))),
+            port_names=", ".join(f'"{name}"' for name in self.debug_names),
+            poke_cases="\n".join(poke_cases),
+            peek_cases="\n".join(peek_cases),
+            toggle_cases="\n".join(toggle_cases),
+        )
+
+
+class ActionStreamEncoder:
+    """
+    Serializes straight-line Poke/Expect/Eval/Step actions into the binary
+    action stream executed by the interpreter driver.
+    """
+    def __init__(self, port_table):
+        self.port_table = port_table
+        self.words = bytearray(struct.pack("<I", STREAM_MAGIC))
+
+    def encode_value(self, port_id, value):
+        if isinstance(value, BitVector):
+            value = value.as_uint()
+        elif isinstance(value, (bool, int, Bit)):
+            value = int(value)
+        else:
+            raise NotImplementedError(
+                f"Cannot encode value {value} in the action stream, use "
+                f"driver_mode='codegen' instead")
+        n = self.port_table.words(port_id)
+        # negative values are sign extended to the width of the port
+        value %= 1 << (32 * n)
+        return value.to_bytes(4 * n, "little")
+
+    def poke(self, port, value):
+        port_id = self.port_table.lookup(port)
+        self.words += struct.pack("<II", POKE, port_id)
+        self.words += self.encode_value(port_id, value)
+
+    def expect(self, port, value, i):
+        if value_utils.is_any(value):
+            return
+        port_id = self.port_table.lookup(port)
+        self.words += struct.pack("<III", EXPECT, port_id, i)
+        self.words += self.encode_value(port_id, value)
+
+    def eval(self):
+        self.words += struct.pack("<I", EVAL)
+
+    def step(self, clock, steps):
+        port_id = self.port_table.lookup(clock)
+        self.words += struct.pack("<III", STEP, port_id, steps)
+
+    def peek(self, port):
+        port_id = self.port_table.lookup(port)
+        return self.peek_id(port_id)
+
+    def peek_id(self, port_id):
+        self.words += struct.pack("<II", PEEK, port_id)
+        return port_id
+
+    def port_action(self, is_poke, port, value, i):
+        if isinstance(port, SelectPath):
+            port = port[-1] if len(port) == 2 else port
+        # arrays of arrays are split into one action per element
+        if isinstance(port, m.ArrayType) and \
+                not isinstance(port.T, m._BitKind):
+            for j in range(port.N):
+                self.port_action(is_poke, port[j], value[j], i)
+        elif is_poke:
+            self.poke(port, value)
+        else:
+            self.expect(port, value, i)
+
+    def encode(self, action_list, start=0):
+        # failures of expects are reported with their index in
+        # `action_list`, offset by `start`
+        if isinstance(action_list, action_store.ActionStore):
+            return self.encode_store(action_list, start)
+        for i, action in enumerate(action_list, start):
+            self.encode_action(i, action)
+        return self
+
+    def encode_action(self, i, action):
+        if isinstance(action, (actions.Poke, actions.Expect)):
+            self.port_action(isinstance(action, actions.Poke),
+                             action.port, action.value, i)
+        elif isinstance(action, actions.Eval):
+            self.eval()
+        elif isinstance(action, actions.Step):
+            self.step(action.clock, action.steps)
+        else:
+            raise NotImplementedError(
+                f"{action} is not supported by the interpreter driver, "
+                f"use driver_mode='codegen' instead")
+
+    def encode_store(self, store, start=0):
+        # Encodes the rows of an ActionStore directly from its columns,
+        # without creating action objects.  Values stored as words (wide
+        # BitVectors of the same width as the port) are copied as is.
+        ports = {}
+        for i, op in enumerate(store.ops):
+            if op in (action_store.OBJECT, action_store.DELAY):
+                self.encode_action(start + i, store.action(i))
+                continue
+            if op == action_store.EVAL:
+                self.eval()
+                continue
+            slot = store.slots[i]
+            if slot not in ports:
+                port, kind, type_ = store.slot_list[slot]
+                port_id = self.port_table.lookup(port)
+                if kind == action_store.WIDE and \
+                        type_.size == self.port_table.widths[port_id]:
+                    words = self.port_table.words(port_id)
+                else:
+                    words = 0
+                ports[slot] = (port_id, kind, words)
+            port_id, kind, words = ports[slot]
+            value = store.values[i]
+            if op == action_store.STEP:
+                self.words += struct.pack("<III", STEP, port_id, value)
+                continue
+            if op == action_store.POKE:
+                self.words += struct.pack("<II", POKE, port_id)
+            else:
+                self.words += struct.pack("<III", EXPECT, port_id,
+                                          start + i)
+            if words:
+                self.words += store.words[value:value + words].tobytes()
+            elif kind == action_store.INLINE:
+                self.words += self.encode_value(port_id, value)
+            else:
+                self.words += self.encode_value(
+                    port_id, store.decode_value(slot, value))
+        return self
+
+    def end(self):
+        self.words += struct.pack("<I", END)
+        return bytes(self.words)
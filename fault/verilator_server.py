@@ -0,0 +1,174 @@
+import os
+from pathlib import Path
+from subprocess import Popen, STDOUT, PIPE
+from hwtypes import BitVector
+from fault.user_cfg import FaultConfig
+from fault.verilator_target import VerilatorTarget
+from fault.verilator_interpreter import ActionStreamEncoder
+
+
+class VerilatorServer:
+    """
+    Long-lived Verilator simulation of a circuit, controlled from Python.
+
+    The circuit is compiled once with the interpreter driver of
+    VerilatorTarget (driver_mode="interpreter") and the resulting executable
+    is kept running.  Commands are buffered and sent to it over a pipe in
+    the binary action stream format; `peek` sends the pending commands and
+    waits for the value of the port to come back on a second pipe.  This
+    makes it possible to interleave simulation with Python code (e.g. a
+    reference model) without starting a new process for every test.
+
+    Example:
+        with VerilatorServer(circuit, circuit.CLK, flags=["-Wno-fatal"]) as s:
+            s.poke(circuit.I, 3)
+            s.step(2)
+            out = s.peek(circuit.O)
+    """
+    def __init__(self, circuit, clock=None, directory="build/", **kwargs):
+        """
+        `circuit`: magma circuit to simulate
+        `clock`: default clock port used by `step`
+        `directory`: build directory of the simulation
+        Any other keyword arguments are passed to VerilatorTarget.
+        """
+        self.circuit = circuit
+        self.clock = clock
+        self.target = VerilatorTarget(circuit, directory=directory,
+                                      driver_mode="interpreter", **kwargs)
+        self.port_table = self.target.port_table
+        self.encoder = ActionStreamEncoder(self.port_table)
+        # Index of the next command, reported when an expect fails
+        self.num_commands = 0
+
+        # Build the driver (this is a no-op if the circuit interface hasn't
+        # changed since the last build)
+        self.target.build_driver(self.target.generate_interpreter_code())
+
+        # Start the simulator: commands are read from stdin and peeked values
+        # are written to a dedicated pipe, while STDOUT and STDERR go to a
+        # logfile so that they can't fill up and block the simulator
+        directory = Path(self.target.directory)
+        self.log = directory / 'obj_dir' / f'{self.target.circuit_name}.log'
+        self.log_file = open(self.log, 'w')
+        resp_r, resp_w = os.pipe()
+        try:
+            self.proc = Popen(
+                [f'./obj_dir/V{self.target.circuit_name}', '-', str(resp_w)],
+                cwd=directory, env=FaultConfig().get_sim_env(), stdin=PIPE,
+                stdout=self.log_file, stderr=STDOUT, pass_fds=(resp_w,)
+            )
+        finally:
+            os.close(resp_w)
+        self.resp = os.fdopen(resp_r, 'rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.kill()
+
+    def poke(self, port, value):
+        self.encoder.port_action(True, port, value, self.num_commands)
+        self.num_commands += 1
+
+    def expect(self, port, value):
+        """
+        Checks the value of `port`.  Failures are reported (by raising an
+        AssertionError) the next time the simulator is synchronized with
+        (`peek`, `flush` or `close`).
+        """
+        self.encoder.port_action(False, port, value, self.num_commands)
+        self.num_commands += 1
+
+    def eval(self):
+        self.encoder.eval()
+        self.num_commands += 1
+
+    def step(self, steps=1, clock=None):
+        if clock is None:
+            clock = self.clock
+        if clock is None:
+            raise ValueError("No clock specified")
+        self.encoder.step(clock, steps)
+        self.num_commands += 1
+
+    def run(self, actions):
+        """
+        Queues a list of Poke/Expect/Eval/Step actions, e.g. the actions of a
+        Tester.
+        """
+        self.encoder.encode(actions, start=self.num_commands)
+        self.num_commands += len(actions)
+
+    def peek(self, port):
+        """
+        Returns the current value of `port` as a BitVector.
+        """
+        return self.read_value(self.encoder.peek(port))
+
+    def flush(self):
+        """
+        Sends all pending commands and waits until they have been executed.
+        """
+        # the simulator only responds to peeks, so peek an arbitrary port to
+        # know when it has caught up
+        self.read_value(self.encoder.peek_id(0))
+
+    def read_value(self, port_id):
+        self.num_commands += 1
+        self.send()
+        nbytes = 4 * self.port_table.words(port_id)
+        data = self.resp.read(nbytes)
+        if len(data) != nbytes:
+            self.fail()
+        width = self.port_table.widths[port_id]
+        return BitVector[width](int.from_bytes(data, 'little'))
+
+    def send(self):
+        try:
+            self.proc.stdin.write(self.encoder.words)
+            self.proc.stdin.flush()
+        except BrokenPipeError:
+            self.fail()
+        self.encoder.words.clear()
+
+    def close(self):
+        """
+        Sends all pending commands, stops the simulator and raises an
+        AssertionError if any expect failed.
+        """
+        if self.proc.poll() is None:
+            self.encoder.end()
+            self.send()
+            self.proc.stdin.close()
+        returncode = self.proc.wait()
+        self.cleanup()
+        if returncode:
+            self.fail()
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.wait()
+        self.cleanup()
+
+    def cleanup(self):
+        if not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.resp.close()
+        self.log_file.close()
+
+    def fail(self):
+        returncode = self.proc.wait()
+        self.cleanup()
+        with open(self.log, 'r') as f:
+            output = f.read()
+        raise AssertionError(
+            f"Verilator simulation failed (return code {returncode}):\n"
+            f"{output}")
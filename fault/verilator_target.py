@@ -1,30 +1,38 @@
 import fault
+import filecmp
+import os
 from pathlib import Path
 import magma as m
 import fault.actions as actions
-from fault.actions import Poke, Eval
+from fault.actions import Eval
 from fault.verilog_target import VerilogTarget
 from fault.verilog_utils import verilator_name
 import fault.value_utils as value_utils
 from fault.verilator_utils import (verilator_make_cmd, verilator_comp_cmd,
-                                   verilator_version)
+                                   verilator_version, verilator_user_makefile)
 from fault.select_path import SelectPath
 from fault.wrapper import PortWrapper, InstanceWrapper
 import math
 from hwtypes import BitVector, AbstractBitVectorMeta
-from fault.random import constrained_random_bv
+import numpy as np
+from fault.random import sample_constrained_bvs
 from fault.subprocess_run import subprocess_run
+from fault.build_cache import get_build_cache
+import fault.instrumentation as instrumentation
+from fault.verilator_interpreter import (VerilatorPortTable,
+                                         ActionStreamEncoder)
 import fault.utils as utils
 import fault.expression as expression
 import platform
+from contextlib import contextmanager, ExitStack
 
 
 max_bits = 64 if platform.architecture()[0] == "64bit" else 32
 
 
-src_tpl = """\
-{includes}
-
+# Definitions of the simulation time, tracer and assertion helpers, which
+# are shared by all files of a segmented driver
+defs_tpl = """\
 // Based on https://www.veripool.org/projects/verilator/wiki/Manual-verilator#CONNECTING-TO-C
 vluint64_t main_time = 0;       // Current simulation time
 // This is a 64-bit integer to reduce wrap over issues and
@@ -39,6 +47,16 @@ double sc_time_stamp () {{       // Called by $time in Verilog
 VerilatedVcdC* tracer;
 #endif
 
+void fault_fail() {{
+#if VM_TRACE
+  // Dump one more timestep so we see the current values
+  main_time++;
+  tracer->dump(main_time);
+  tracer->close();
+#endif
+  exit(1);
+}}
+
 void my_assert(
     unsigned int got,
     unsigned int expected,
@@ -50,16 +68,73 @@ void my_assert(
     std::cerr << \"Expected : 0x\" << std::hex << expected << std::endl;
     std::cerr << \"i        : \" << std::dec << i << std::endl;
     std::cerr << \"Port     : \" << port << std::endl;
-#if VM_TRACE
-    // Dump one more timestep so we see the current values
-    main_time++;
-    tracer->dump(main_time);
-    tracer->close();
-#endif
-    exit(1);
+    fault_fail();
+  }}
+}}
+
+"""  # nopep8
+
+# Helpers for wide and array values, defined in every file that uses them
+helpers_tpl = """\
+// Copy/compare wide values (stored as 32-bit words) from the constant pool
+template <typename T>
+void fault_poke_words(T& dst, const uint32_t* src, int n) {{
+  std::memcpy(&dst[0], src, n * sizeof(uint32_t));
+}}
+
+template <typename T>
+void fault_expect_words(
+    T& got,
+    const uint32_t* expected,
+    int n,
+    int i,
+    const char* port) {{
+  if (std::memcmp(&got[0], expected, n * sizeof(uint32_t)) != 0) {{
+    std::cerr << std::endl;  // end the current line
+    for (int j = 0; j < n; j++) {{
+      if (got[j] != expected[j]) {{
+        std::cerr << \"Word     : \" << std::dec << j << std::endl;
+        std::cerr << \"Got      : 0x\" << std::hex << got[j] << std::endl;
+        std::cerr << \"Expected : 0x\" << std::hex << expected[j] << std::endl;
+      }}
+    }}
+    std::cerr << \"i        : \" << std::dec << i << std::endl;
+    std::cerr << \"Port     : \" << port << std::endl;
+    fault_fail();
+  }}
+}}
+
+// Copy/compare the elements of array ports (through a table of pointers to
+// the elements) from the constant pool
+template <typename T>
+void fault_poke_array(T* const* dst, const uint32_t* src, int n) {{
+  for (int j = 0; j < n; j++) {{
+    *dst[j] = src[j];
+  }}
+}}
+
+template <typename T>
+void fault_expect_array(
+    T* const* got,
+    const uint32_t* expected,
+    int n,
+    int i,
+    const char* port) {{
+  for (int j = 0; j < n; j++) {{
+    if (*got[j] != expected[j]) {{
+      std::cerr << std::endl;  // end the current line
+      std::cerr << \"Got      : 0x\" << std::hex << *got[j] << std::endl;
+      std::cerr << \"Expected : 0x\" << std::hex << expected[j] << std::endl;
+      std::cerr << \"i        : \" << std::dec << i << std::endl;
+      std::cerr << \"Port     : \" << port << \"[\" << j << \"]\" << std::endl;
+      fault_fail();
+    }}
   }}
 }}
 
+"""  # nopep8
+
+main_tpl = """\
 int main(int argc, char **argv) {{
   Verilated::commandArgs(argc, argv);
   V{circuit_name}* top = new V{circuit_name};
@@ -72,6 +147,7 @@ int main(int argc, char **argv) {{
   tracer->open("logs/{circuit_name}.vcd");
 #endif
 
+{pointer_tables}
 {main_body}
 
 #if VM_TRACE
@@ -80,13 +156,51 @@ int main(int argc, char **argv) {{
 }}
 """  # nopep8
 
+src_tpl = "{includes}\n\n" + defs_tpl + helpers_tpl + "{constants}\n" + \
+    main_tpl
+
+# Files of a driver split into segments (see generate_segmented_code): a
+# header shared by all files, a bounded number of files with the segment
+# functions and the main file with the definitions and the calls of the
+# segments
+segment_header_tpl = """\
+#pragma once
+{includes}
+
+extern vluint64_t main_time;
+#if VM_TRACE
+extern VerilatedVcdC* tracer;
+#endif
+
+void fault_fail();
+void my_assert(
+    unsigned int got,
+    unsigned int expected,
+    int i,
+    const char* port);
+extern const uint32_t fault_pool[];
+
+""" + helpers_tpl
+
+segment_tpl = """\
+
+void fault_segment_{k}(V{circuit_name}* top) {{
+{pointer_tables}
+{body}}}
+"""
+
+segment_main_tpl = '#include "{header}"\n\n' + defs_tpl + \
+    "{constants}\n{declarations}\n" + main_tpl
+
 
 class VerilatorTarget(VerilogTarget):
     def __init__(self, circuit, directory="build/",
                  flags=None, skip_compile=False, include_verilog_libraries=None,
                  include_directories=None, magma_output="coreir-verilog",
                  circuit_name=None, magma_opts=None, skip_verilator=False,
-                 disp_type='on_error'):
+                 disp_type='on_error', build_cache=None,
+                 driver_mode="codegen", checkpoint_interval=None,
+                 segment_size=5000):
         """
         Params:
             `include_verilog_libraries`: a list of verilog libraries to include
@@ -96,6 +210,35 @@ class VerilatorTarget(VerilogTarget):
             `include_directories`: a list of directories to include using the
             -I flag. From the the verilator docs:
                 -I<dir>                    Directory to search for includes
+
+            `build_cache`: directory of a build cache shared by all targets
+            on this machine.  The results of `verilator` and `make` are stored
+            there keyed by a hash of the Verilog sources, flags, Verilator
+            version, and driver source, so identical builds are reused
+            instead of being rerun.  True selects ~/.fault/build_cache, False
+            disables the cache, and None (default) uses the "build_cache"
+            option from the fault config files (disabled if not set).
+
+            `driver_mode`: "codegen" (default) unrolls the actions into C++
+            code in the driver.  "interpreter" uses a fixed driver that
+            depends only on the circuit interface and executes a binary
+            stream of Poke/Expect/Eval/Step actions read at runtime, so
+            changing the test does not require recompiling the driver.
+
+            `checkpoint_interval`: if not None (requires the interpreter
+            driver), the simulation runs without tracing and saves the model
+            state every `checkpoint_interval` time steps (the model is built
+            with --savable).  If an expect fails, the driver re-runs the
+            actions from the checkpoint preceding the failure with tracing
+            enabled, writing a waveform of just that window to
+            logs/<circuit_name>_failure.vcd.
+
+            `segment_size`: if the code of the actions (with the codegen
+            driver) is longer than `segment_size` lines, it is split into
+            functions of about that many lines, spread over a few files
+            per core, which make compiles in parallel.  Tests that open
+            files or declare variables are always generated as a single
+            file.  None disables splitting.
         """
         # Set defaults
         if include_verilog_libraries is None:
@@ -105,11 +248,32 @@ class VerilatorTarget(VerilogTarget):
 
         # Save settings
         self.disp_type = disp_type
+        if driver_mode not in {"codegen", "interpreter"}:
+            raise ValueError(f"Unsupported driver_mode {driver_mode}")
+        self.driver_mode = driver_mode
+        if checkpoint_interval is not None:
+            if driver_mode != "interpreter":
+                raise ValueError("checkpoint_interval requires "
+                                 "driver_mode='interpreter'")
+            flags = list(flags) if flags is not None else []
+            flags += [flag for flag in ["--savable", "--trace"]
+                      if flag not in flags]
+        self.checkpoint_interval = checkpoint_interval
+        self.segment_size = segment_size
 
         # Call super constructor
         super().__init__(circuit, circuit_name, directory, skip_compile,
                          include_verilog_libraries, magma_output, magma_opts)
 
+        # Initialize variables
+        self.debug_includes = set()
+        self.reset_constants()
+        self.verilator_version = verilator_version(disp_type=self.disp_type)
+
+        # Content-addressed cache of verilator/make results (None if disabled)
+        self.build_cache = get_build_cache(build_cache)
+        self.comp_key = None
+
         # Compile the design using `verilator`, if not skip
         if not skip_verilator:
             driver_file = self.directory / Path(
@@ -122,13 +286,66 @@ class VerilatorTarget(VerilogTarget):
                 driver_filename=driver_file.name,
                 verilator_flags=flags
             )
-            # shell=True since 'verilator' is actually a shell script
-            subprocess_run(comp_cmd, cwd=self.directory, shell=True,
-                           disp_type=self.disp_type)
+            if self.build_cache is not None:
+                self.comp_key = self.build_cache.key(
+                    'verilator', comp_cmd, self.verilator_version,
+                    *self.verilog_sources(include_directories)
+                )
+            # Prefer an obj_dir that already has the model objects built, so
+            # that only the driver has to be compiled by make
+            with self.lock_build(self.comp_key):
+                if not self.fetch_obj_dir(self.model_key, self.comp_key):
+                    # shell=True since 'verilator' is actually a shell script
+                    with instrumentation.phase('verilator'):
+                        subprocess_run(comp_cmd, cwd=self.directory,
+                                       shell=True, disp_type=self.disp_type,
+                                       capture_output=False)
+                    self.store_obj_dir(self.comp_key)
+
+    def verilog_sources(self, include_directories=None):
+        """
+        Returns the paths of all files read by verilator, relative to the
+        directory where verilator is run.
+        """
+        sources = [self.directory / self.verilog_file]
+        sources += [self.directory / lib
+                    for lib in self.include_verilog_libraries]
+        for dir_ in (include_directories or []):
+            sources += sorted(path for path in (self.directory / dir_).glob('*')
+                              if path.is_file())
+        return sources
+
+    @property
+    def model_key(self):
+        if self.comp_key is None:
+            return None
+        return self.build_cache.key(self.comp_key, 'model')
+
+    def fetch_obj_dir(self, *keys):
+        """
+        Replaces obj_dir with the first entry of the build cache found for
+        `keys`, returning True if one was found.
+        """
+        for key in keys:
+            if key is not None and self.build_cache.fetch(
+                    key, self.directory / 'obj_dir', 'obj_dir'):
+                return True
+        return False
+
+    @contextmanager
+    def lock_build(self, key):
+        # Builds of the same key (e.g. by parallel jobs sharing a build cache)
+        # are serialized, so that all but the first can fetch the result
+        if key is None:
+            yield
+        else:
+            with self.build_cache.lock(key):
+                yield
 
-        # Initialize variables
-        self.debug_includes = set()
-        self.verilator_version = verilator_version(disp_type=self.disp_type)
+    def store_obj_dir(self, *keys):
+        for key in keys:
+            if key is not None:
+                self.build_cache.store(key, self.directory / 'obj_dir')
 
     def get_verilator_prefix(self):
         if self.verilator_version > 3.874:
@@ -222,16 +439,13 @@ class VerilatorTarget(VerilogTarget):
 
         if isinstance(action.value, BitVector) and \
                 action.value.num_bits > max_bits:
-            pokes = []
-            # For some reason, verilator chunks it by 32 instead of max_bits
-            slice_range = 32
-            for i in range(math.ceil(action.value.num_bits / slice_range)):
-                value = action.value[i * slice_range:min(
-                    (i + 1) * slice_range, action.value.num_bits)]
-                pokes += [f"top->{name}[{i}] = {value};"]
             if is_reg_poke:
                 raise NotImplementedError()
-            return pokes
+            # copy the words of the value from the constant pool
+            words = self.wide_words(action.value)
+            offset = self.pool_offset(words)
+            return [f"fault_poke_words(top->{name}, fault_pool + {offset}, "
+                    f"{len(words)});"]
         else:
             value = action.value
             if isinstance(value, actions.FileRead):
@@ -322,15 +536,11 @@ class VerilatorTarget(VerilogTarget):
             value = f"top->{prefix}->" + value.select_path.verilator_path
         if isinstance(action.value, BitVector) and \
                 action.value.num_bits > max_bits:
-            asserts = []
-            # For some reason, verilator chunks it by 32 instead of max_bits
-            slice_range = 32
-            for j in range(math.ceil(action.value.num_bits / slice_range)):
-                value = action.value[j * slice_range:min(
-                    (j + 1) * slice_range, action.value.num_bits)]
-                asserts += [f"my_assert(top->{name}[{j}], {value}, "
-                            f"{i}, \"{debug_name}\");"]
-            return asserts
+            # compare all words of the value against the constant pool
+            words = self.wide_words(action.value)
+            offset = self.pool_offset(words)
+            return [f"fault_expect_words(top->{name}, fault_pool + {offset}, "
+                    f"{len(words)}, {i}, \"{debug_name}\");"]
         else:
             value = self.process_value(action.port, value)
             port = action.port
@@ -347,6 +557,101 @@ class VerilatorTarget(VerilogTarget):
             return [f"my_assert(top->{name}, {value} & {mask}, "
                     f"{i}, \"{debug_name}\");"]
 
+    def reset_constants(self):
+        # 32-bit words of the wide and array values used by the driver, with
+        # identical values stored only once
+        self.const_pool = []
+        self.const_offsets = {}
+        # tables of pointers to the elements of array ports
+        self.pointer_tables = {}
+        self.pointer_decls = []
+        # tables used by the current segment of a segmented driver
+        self.used_pointer_tables = set()
+
+    @staticmethod
+    def wide_words(value):
+        # Verilator stores wide values as arrays of 32-bit words (rather than
+        # max_bits words), least significant first
+        value_int = value.as_uint()
+        return tuple((value_int >> (32 * j)) & 0xFFFFFFFF
+                     for j in range(math.ceil(value.num_bits / 32)))
+
+    def pool_offset(self, words):
+        words = tuple(words)
+        if words not in self.const_offsets:
+            self.const_offsets[words] = len(self.const_pool)
+            self.const_pool.extend(words)
+        return self.const_offsets[words]
+
+    def generate_constants(self, static=True):
+        if len(self.const_pool) == 0:
+            return ""
+        lines = []
+        for k in range(0, len(self.const_pool), 8):
+            words = self.const_pool[k:k + 8]
+            lines.append("  " + ", ".join(f"0x{word:08x}" for word in words))
+        body = ",\n".join(lines)
+        qualifiers = "static const" if static else "const"
+        return f"{qualifiers} uint32_t fault_pool[] = {{\n{body}\n}};\n"
+
+    def pointer_table(self, port):
+        # name of a table of pointers to the elements of an array port
+        name = verilator_name(port.name)
+        if name not in self.pointer_tables:
+            table = f"fault_ptrs_{len(self.pointer_tables)}"
+            elements = [f"&top->{verilator_name(elem.name)}" for elem in port]
+            self.pointer_decls.append(
+                f"decltype({elements[0]}) const {table}[] = "
+                f"{{{', '.join(elements)}}};")
+            self.pointer_tables[name] = table
+        self.used_pointer_tables.add(self.pointer_tables[name])
+        return self.pointer_tables[name]
+
+    @staticmethod
+    def bulk_array_words(action):
+        # Values of the elements of a constant poke/expect of a top-level
+        # array of (at most 32-bit) words, or None if the action must be
+        # split into one action per element
+        if not isinstance(action, (actions.Poke, actions.Expect)):
+            return None
+        if isinstance(action, actions.Expect) and \
+                (action.above is not None or action.below is not None):
+            return None
+        port = action.port
+        if not isinstance(port, m.ArrayType) or \
+                isinstance(port, fault.WrappedVerilogInternalPort):
+            return None
+        words = []
+        for j, elem in enumerate(port):
+            if not isinstance(elem, m.BitsType) or len(elem) > 32:
+                return None
+            try:
+                value = action.value[j]
+            except (TypeError, IndexError):
+                return None
+            if isinstance(value, BitVector):
+                value = value.as_uint()
+            elif not isinstance(value, int):
+                return None
+            words.append(value & ((1 << len(elem)) - 1))
+        return words
+
+    def generate_array_action_code(self, i, action):
+        # Constant values for arrays of words are copied from the constant
+        # pool in a loop over a table of pointers to the elements, instead of
+        # generating an action for each element
+        words = self.bulk_array_words(action)
+        if words is None:
+            return super().generate_array_action_code(i, action)
+        table = self.pointer_table(action.port)
+        offset = self.pool_offset(words)
+        if isinstance(action, actions.Poke):
+            return [f"fault_poke_array({table}, fault_pool + {offset}, "
+                    f"{len(words)});"]
+        else:
+            return [f"fault_expect_array({table}, fault_pool + {offset}, "
+                    f"{len(words)}, {i}, \"{action.port.debug_name}\");"]
+
     def make_eval(self, i, action):
         return ["top->eval();", "main_time++;", "#if VM_TRACE",
                 "tracer->dump(main_time);", "#endif"]
@@ -483,7 +788,7 @@ for ({loop_expr}) {{
         # TODO: figure out how delay should be interpreted for VerilatorTarget
         raise NotImplementedError
 
-    def generate_code(self, actions, verilator_includes, num_tests, circuit):
+    def driver_includes(self, verilator_includes):
         if verilator_includes:
             # Include the top circuit by default
             verilator_includes.insert(
@@ -495,64 +800,294 @@ for ({loop_expr}) {{
             '"verilated.h"',
             '<iostream>',
             '<fstream>',
+            '<cstring>',
             '<verilated_vcd_c.h>',
             '<sys/types.h>',
             '<sys/stat.h>',
         ]
+        includes += [f'"V{self.circuit_name}_{include}.h"' for include in
+                     self.debug_includes]
+        return "\n".join(["#include " + i for i in includes])
 
-        main_body = ""
+    def generate_code(self, actions, verilator_includes, num_tests, circuit,
+                      sampler='auto'):
+        self.reset_constants()
+        main_body = []
         for i, action in enumerate(actions):
             code = self.generate_action_code(i, action)
-            for line in code:
-                main_body += f"  {line}\n"
-
-        for i in range(num_tests):
-            main_body += self.add_assumptions(circuit, actions, i)
-            code = self.make_eval(i, Eval())
-            for line in code:
-                main_body += f"  {line}\n"
-            main_body += self.add_guarantees(circuit, actions, i)
+            main_body += [f"  {line}\n" for line in code]
+        return self.format_driver(main_body, verilator_includes, num_tests,
+                                  circuit, sampler)
+
+    def format_driver(self, main_body, verilator_includes, num_tests,
+                      circuit, sampler):
+        # Values of the assumed ports are sampled up front and read from a
+        # table by a single loop
+        self.assumption_table = None
+        if num_tests:
+            main_body.append(
+                self.add_assumptions(circuit, num_tests, sampler))
 
-        includes += [f'"V{self.circuit_name}_{include}.h"' for include in
-                     self.debug_includes]
-
-        includes_src = "\n".join(["#include " + i for i in includes])
         src = src_tpl.format(
-            includes=includes_src,
-            main_body=main_body,
+            includes=self.driver_includes(verilator_includes),
+            main_body="".join(main_body),
             circuit_name=self.circuit_name,
+            constants=self.generate_constants(),
+            pointer_tables="\n".join(f"  {decl}"
+                                     for decl in self.pointer_decls),
         )
 
         return src
 
+    @staticmethod
+    def can_segment(action_list):
+        # Files and variables are declared as locals of main(), so the
+        # actions using them can't be moved to other functions
+        for action in action_list:
+            if isinstance(action, (actions.FileOpen, actions.Var)):
+                return False
+            inner = getattr(action, "actions", []) + \
+                getattr(action, "else_actions", [])
+            if not VerilatorTarget.can_segment(inner):
+                return False
+        return True
+
+    @staticmethod
+    def segment_files():
+        # number of files the segments of a driver are split into: enough
+        # for make to keep every core busy, but not so many that the number
+        # of files grows with the length of the test
+        return 2 * (os.cpu_count() or 1)
+
+    def generate_segmented_code(self, actions, verilator_includes, num_tests,
+                                circuit, sampler='auto'):
+        """
+        Same as generate_code, but once the code of the actions grows longer
+        than `self.segment_size` lines it is split into functions
+        fault_segment_<k>, called in turn by main().  Each function is
+        written as soon as it is complete, round-robin to one of at most
+        `segment_files()` files <circuit_name>_driver_<j>.cpp, so that make
+        compiles a bounded number of files of similar size.  Returns the
+        source of the main driver file and the paths of the segment files
+        and of the header <circuit_name>_driver.h shared by all files (none
+        if the code fits in a single segment).
+        """
+        header = f"{self.circuit_name}_driver.h"
+        self.reset_constants()
+        num_files = self.segment_files()
+        # segment files, written to temporary files until complete
+        files = []
+        num_segments = 0
+        body = []
+
+        def write_segment():
+            nonlocal num_segments
+            j = num_segments % num_files
+            if j == len(files):
+                segment = self.directory / Path(
+                    f"{self.circuit_name}_driver_{j}.cpp")
+                f = stack.enter_context(open(f"{segment}.tmp", "w"))
+                f.write(f'#include "{header}"\n')
+                files.append((segment, f))
+            # pointer tables are local to each function that uses them
+            pointer_tables = [
+                f"  {decl}" for table, decl in
+                zip(self.pointer_tables.values(), self.pointer_decls)
+                if table in self.used_pointer_tables]
+            files[j][1].write(segment_tpl.format(
+                k=num_segments,
+                circuit_name=self.circuit_name,
+                pointer_tables="\n".join(pointer_tables),
+                body="".join(body)
+            ))
+            num_segments += 1
+            body.clear()
+            self.used_pointer_tables = set()
+
+        with ExitStack() as stack:
+            for i, action in enumerate(actions):
+                code = self.generate_action_code(i, action)
+                body += [f"  {line}\n" for line in code]
+                if len(body) >= self.segment_size:
+                    write_segment()
+            if num_segments and body:
+                write_segment()
+
+        if not num_segments:
+            return self.format_driver(body, verilator_includes, num_tests,
+                                      circuit, sampler), []
+        # Leave the files that didn't change untouched, so that make doesn't
+        # have to recompile them
+        segments = []
+        for segment, f in files:
+            if segment.is_file() and filecmp.cmp(f.name, segment,
+                                                 shallow=False):
+                os.remove(f.name)
+            else:
+                os.replace(f.name, segment)
+            segments.append(segment)
+
+        self.assumption_table = None
+        main_body = [f"  fault_segment_{k}(top);\n"
+                     for k in range(num_segments)]
+        if num_tests:
+            main_body.append(
+                self.add_assumptions(circuit, num_tests, sampler))
+        includes = self.driver_includes(verilator_includes)
+        header_file = self.directory / Path(header)
+        self.write_source(header_file,
+                          segment_header_tpl.format(includes=includes))
+        declarations = [f"void fault_segment_{k}(V{self.circuit_name}* top);"
+                        f"\n" for k in range(num_segments)]
+        src = segment_main_tpl.format(
+            header=header,
+            constants=self.generate_constants(static=False),
+            declarations="".join(declarations),
+            main_body="".join(main_body),
+            circuit_name=self.circuit_name,
+            pointer_tables=""
+        )
+
+        return src, segments + [header_file]
+
     def run(self, actions, verilator_includes=None, num_tests=0,
-            _circuit=None):
+            _circuit=None, sampler='auto'):
         # Set defaults
         if verilator_includes is None:
             verilator_includes = []
 
-        # Write the verilator driver to file.
-        src = self.generate_code(actions, verilator_includes, num_tests,
-                                 _circuit)
-        driver_file = self.directory / Path(f"{self.circuit_name}_driver.cpp")
-        with open(driver_file, "w") as f:
-            f.write(src)
-
-        # Run makefile created by verilator
-        make_cmd = verilator_make_cmd(self.circuit_name)
-        subprocess_run(make_cmd, cwd=self.directory, disp_type=self.disp_type)
+        # Write the verilator driver to file.  In interpreter mode the driver
+        # is fixed and the actions are written to a binary stream instead.
+        exe_args = []
+        sources = []
+        with instrumentation.phase('codegen', actions=len(actions)) as record:
+            if self.driver_mode == "interpreter":
+                if num_tests:
+                    raise NotImplementedError(
+                        "Assumptions are not supported by the interpreter "
+                        "driver")
+                src = self.generate_interpreter_code()
+                stream = ActionStreamEncoder(self.port_table).encode(
+                    actions).end()
+                stream_file = self.directory / Path(
+                    f"{self.circuit_name}_actions.bin")
+                with open(stream_file, "wb") as f:
+                    f.write(stream)
+                record['stream_bytes'] = len(stream)
+                exe_args += [stream_file.name]
+                if self.checkpoint_interval is not None:
+                    # peeked values (if any) go to stdout
+                    interval = self.checkpoint_interval
+                    exe_args += ["1", f"+fault_checkpoint={interval}"]
+            else:
+                if self.segment_size is not None and \
+                        self.can_segment(actions):
+                    src, sources = self.generate_segmented_code(
+                        actions, verilator_includes, num_tests, _circuit,
+                        sampler)
+                else:
+                    src = self.generate_code(actions, verilator_includes,
+                                             num_tests, _circuit, sampler)
+                if self.assumption_table is not None:
+                    table_file = self.directory / Path(
+                        f"{self.circuit_name}_assumptions.bin")
+                    with open(table_file, "wb") as f:
+                        f.write(self.assumption_table.astype('<u4').tobytes())
+                    record['table_bytes'] = self.assumption_table.nbytes
+            record['source_bytes'] = len(src) + sum(
+                os.path.getsize(source) for source in sources)
+        self.build_driver(src, sources)
 
         # Run the executable created by verilator and write the standard
         # output to a logfile for later review or processing
-        exe_cmd = [f'./obj_dir/V{self.circuit_name}']
-        result = subprocess_run(exe_cmd, cwd=self.directory,
-                                disp_type=self.disp_type)
+        exe_cmd = [f'./obj_dir/V{self.circuit_name}'] + exe_args
+        with instrumentation.phase('simulate'):
+            result = subprocess_run(exe_cmd, cwd=self.directory,
+                                    disp_type=self.disp_type)
         log = Path(self.directory) / 'obj_dir' / f'{self.circuit_name}.log'
         with open(log, 'w') as f:
             f.write(result.stdout)
 
-    def add_assumptions(self, circuit, actions, i):
-        main_body = ""
+    def build_driver(self, src, sources=()):
+        """
+        Writes the driver source `src` and builds the executable
+        obj_dir/V<circuit_name> with the makefile created by verilator,
+        together with the additional `sources` already written next to the
+        driver (the .cpp files are compiled, make runs in parallel).
+        """
+        self.write_driver(src)
+
+        # Run makefile created by verilator, unless an identical build is
+        # already in the cache
+        make_key = None
+        if self.comp_key is not None:
+            make_key = self.build_cache.key(self.comp_key, src, *sources)
+        with self.lock_build(make_key):
+            if not self.fetch_obj_dir(make_key):
+                makefile = None
+                if sources:
+                    user_classes = [f"{self.circuit_name}_driver"]
+                    user_classes += [source.stem for source in sources
+                                     if source.suffix == ".cpp"]
+                    makefile = f"V{self.circuit_name}_driver.mk"
+                    with open(Path(self.directory) / "obj_dir" / makefile,
+                              "w") as f:
+                        f.write(verilator_user_makefile(self.circuit_name,
+                                                        user_classes))
+                make_cmd = verilator_make_cmd(self.circuit_name,
+                                              makefile=makefile)
+                with instrumentation.phase('make'):
+                    subprocess_run(make_cmd, cwd=self.directory,
+                                   disp_type=self.disp_type,
+                                   capture_output=False)
+                self.store_obj_dir(make_key, self.model_key)
+
+    def write_driver(self, src):
+        driver_file = self.directory / Path(f"{self.circuit_name}_driver.cpp")
+        self.write_source(driver_file, src)
+
+    @staticmethod
+    def write_source(file_name, src):
+        # Leave the file untouched if the source didn't change, so that make
+        # doesn't have to recompile it
+        if file_name.is_file():
+            with open(file_name, "r") as f:
+                if f.read() == src:
+                    return
+        with open(file_name, "w") as f:
+            f.write(src)
+
+    @property
+    def port_table(self):
+        if not hasattr(self, "_port_table"):
+            self._port_table = VerilatorPortTable(self.circuit)
+        return self._port_table
+
+    def generate_interpreter_code(self):
+        includes = [
+            f'"V{self.circuit_name}.h"',
+            '"verilated.h"',
+            '<iostream>',
+            '<fstream>',
+            '<verilated_vcd_c.h>',
+            '<sys/types.h>',
+            '<sys/stat.h>',
+        ]
+        return self.port_table.generate_code(
+            self.circuit_name, includes,
+            checkpoint=self.checkpoint_interval is not None)
+
+    def add_assumptions(self, circuit, num_tests, sampler):
+        """
+        Samples `num_tests` values of each assumed port with
+        `sample_constrained_bvs` into `self.assumption_table` (one row of
+        32-bit words per test, to be written to <circuit_name>_assumptions.bin)
+        and returns the code of a loop that pokes each row, evaluates the
+        circuit and checks the guarantees.
+        """
+        pokes = []
+        columns = []
+        offset = 0
         for port in circuit.interface.ports.values():
             if port.isoutput():
                 for assumption in self.assumptions:
@@ -561,16 +1096,59 @@ for ({loop_expr}) {{
                     if isinstance(assume_port, SelectPath):
                         assume_port = assume_port[-1]
                     if assume_port is port:
-                        pred = assumption.value
-                        randval = constrained_random_bv(len(assume_port), pred)
-                        code = self.make_poke(
-                            len(actions) + i, Poke(port, randval))
-                        for line in code:
-                            main_body += f"  {line}\n"
+                        width = len(port) if isinstance(port, m.ArrayType) \
+                            else 1
+                        n = math.ceil(width / 32)
+                        values = sample_constrained_bvs(
+                            width, assumption.value, num_tests, sampler)
+                        columns += [[(value >> (32 * j)) & 0xFFFFFFFF
+                                     for value in values] for j in range(n)]
+                        name = verilator_name(port.name)
+                        sample = f"fault_sample + {offset}"
+                        if width > max_bits:
+                            pokes.append(f"fault_poke_words(top->{name}, "
+                                         f"{sample}, {n});")
+                        elif n == 2:
+                            pokes.append(f"top->{name} = ((vluint64_t)"
+                                         f"fault_sample[{offset + 1}] << 32)"
+                                         f" | fault_sample[{offset}];")
+                        else:
+                            pokes.append(f"top->{name} = "
+                                         f"fault_sample[{offset}];")
+                        offset += n
                         break
+
+        code = []
+        if columns:
+            self.assumption_table = np.array(columns, dtype=np.uint32).T
+            code += [
+                "std::ifstream fault_samples(",
+                f"    \"{self.circuit_name}_assumptions.bin\", "
+                "std::ios::binary);",
+                f"uint32_t fault_sample[{offset}];",
+            ]
+        code.append(f"for (int i = 0; i < {num_tests}; i++) {{")
+        if columns:
+            code += [
+                "  fault_samples.read(reinterpret_cast<char*>(fault_sample),",
+                "                     sizeof(fault_sample));",
+                "  if (!fault_samples) {",
+                "    std::cerr << \"Failed to read the assumption table\" "
+                "<< std::endl;",
+                "    fault_fail();",
+                "  }",
+            ]
+        code += [f"  {line}" for line in pokes]
+        code += [f"  {line}" for line in self.make_eval(0, Eval())]
+        main_body = "  {\n"
+        for line in code:
+            main_body += f"    {line}\n"
+        main_body += self.add_guarantees(circuit)
+        main_body += "    }\n  }\n"
         return main_body
 
-    def add_guarantees(self, circuit, actions, i):
+    def add_guarantees(self, circuit):
+        # checks of the guarantees in the loop of add_assumptions (over i)
         main_body = ""
         for name, port in circuit.interface.ports.items():
             if port.isinput():
@@ -586,16 +1164,16 @@ for ({loop_expr}) {{
                             code = code.replace("and", "&&")
                             code = code.replace(port, f"top->{port}")
                         main_body += f"""\
-    if (!({code})) {{
-      std::cerr << std::endl;  // end the current line
-      std::cerr << \"Got      : 0x\" << std::hex << top->{name} << std::endl;
-      std::cerr << \"Expected : {code}" << std::endl;
-      std::cerr << \"i        : {i}\" << std::endl;
-      std::cerr << \"Port     : {name}\" << std::endl;
-      #if VM_TRACE
-        tracer->close();
-      #endif
-      exit(1);
-    }}
+      if (!({code})) {{
+        std::cerr << std::endl;  // end the current line
+        std::cerr << \"Got      : 0x\" << std::hex << top->{name} << std::endl;
+        std::cerr << \"Expected : {code}" << std::endl;
+        std::cerr << \"i        : \" << std::dec << i << std::endl;
+        std::cerr << \"Port     : {name}\" << std::endl;
+        #if VM_TRACE
+          tracer->close();
+        #endif
+        exit(1);
+      }}
 """
         return main_body
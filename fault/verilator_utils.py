@@ -1,6 +1,10 @@
+import os
+from functools import lru_cache
 from .subprocess_run import subprocess_run
 
 
+# the version can't change during a session, so only query verilator once
+@lru_cache(maxsize=None)
 def verilator_version(disp_type='on_error'):
     # assemble the command
     cmd = ['verilator', '--version']
@@ -49,11 +53,26 @@ def verilator_comp_cmd(top=None, verilog_filename=None,
     return retval
 
 
-def verilator_make_cmd(top):
+def verilator_make_cmd(top, makefile=None, jobs=None):
+    if makefile is None:
+        makefile = f'V{top}.mk'
+    if jobs is None:
+        jobs = os.cpu_count() or 1
     cmd = []
     cmd += ['make']
     cmd += ['-C', 'obj_dir']
-    cmd += ['-j']
-    cmd += ['-f', f'V{top}.mk']
+    cmd += [f'-j{jobs}']
+    cmd += ['-f', makefile]
     cmd += [f'V{top}']
     return cmd
+
+
+def verilator_user_makefile(top, user_classes):
+    # makefile overriding the driver files passed to verilator with --exe,
+    # e.g. to build a driver split into several files.  The list can be
+    # too long for the command line, so it is written to a file including
+    # the makefile created by verilator.
+    lines = ['override VM_USER_CLASSES = \\']
+    lines += [f'\t{user_class} \\' for user_class in user_classes]
+    lines += ['', f'include V{top}.mk', '']
+    return '\n'.join(lines)
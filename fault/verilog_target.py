@@ -7,6 +7,7 @@ from fault.util import flatten
 import os
 from fault.select_path import SelectPath
 from fault.verilog_utils import verilog_name
+import fault.instrumentation as instrumentation
 
 
 class VerilogTarget(Target):
@@ -43,8 +44,9 @@ class VerilogTarget(Target):
         # Optionally compile this module to verilog first.
         if not self.skip_compile:
             prefix = os.path.splitext(self.directory / self.verilog_file)[0]
-            m.compile(prefix, self.circuit, output=self.magma_output,
-                      **self.magma_opts)
+            with instrumentation.phase('magma_compile'):
+                m.compile(prefix, self.circuit, output=self.magma_output,
+                          **self.magma_opts)
             if not (self.directory / self.verilog_file).is_file():
                 raise Exception(f"Compiling {self.circuit} failed")
 
@@ -0,0 +1,126 @@
+from collections.abc import Mapping
+import numpy as np
+
+
+class EdgeNotFoundError(Exception):
+    pass
+
+
+class Signal:
+    """
+    One signal of a Waveform.  Calling it with a time (or an array of times)
+    linearly interpolates the signal, holding the first/last value outside
+    of the simulated interval.
+    """
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        # (height, rising) -> (indices, times) of the threshold crossings
+        self.crossing_cache = {}
+
+    def __call__(self, t):
+        return np.interp(t, self.x, self.y)
+
+    def crossings(self, height, rising=True):
+        """
+        Returns all crossings of `height` as a pair of arrays: the index j of
+        the sample before each crossing (the crossing is between samples j
+        and j+1) and the interpolated time of the crossing.  Computed once
+        per (height, rising) pair.
+        """
+        key = (height, rising)
+        if key not in self.crossing_cache:
+            x = np.asarray(self.x, dtype=float)
+            y = np.asarray(self.y, dtype=float)
+            above = y > height
+            if rising:
+                idx = np.flatnonzero(~above[:-1] & above[1:])
+            else:
+                idx = np.flatnonzero(above[:-1] & ~above[1:])
+            y0, y1 = y[idx], y[idx + 1]
+            fraction = (height - y0) / (y1 - y0)
+            times = x[idx] + fraction * (x[idx + 1] - x[idx])
+            self.crossing_cache[key] = (idx, times)
+        return self.crossing_cache[key]
+
+    def edges(self, t_start, height, forward=False, count=1, rising=True):
+        """
+        Returns the times of `count` crossings of `height`, ordered by
+        distance from `t_start` (searching forward or backward in time).
+        `count` may be None to return all crossings in that direction.
+        """
+        idx, times = self.crossings(height, rising)
+        if forward:
+            # crossings starting at or after the first sample >= t_start
+            start = np.searchsorted(self.x, t_start, side='left')
+            k = np.searchsorted(idx, start, side='left')
+            found = times[k:] if count is None else times[k:k + count]
+        else:
+            # crossings ending at or before the first sample > t_start, to
+            # catch any edge in the interval containing t_start
+            start = np.searchsorted(self.x, t_start, side='right')
+            start = min(start, len(self.x) - 1)
+            k = np.searchsorted(idx, start, side='left')
+            lo = 0 if count is None else max(k - count, 0)
+            found = times[lo:k][::-1]
+        if count is not None and len(found) < count:
+            msg = f'only {len(found)} of requested {count} edges found'
+            raise EdgeNotFoundError(msg)
+        return found
+
+    def periods(self, t_start, height, forward=False, count=None,
+                rising=True):
+        """
+        Returns the durations of the `count` periods (or all periods, if
+        None) ending before `t_start` (or starting after it, if `forward`),
+        in chronological order.
+        """
+        edges = self.edges(t_start, height, forward=forward, count=(
+            None if count is None else count + 1), rising=rising)
+        if forward:
+            return np.diff(edges)
+        return -np.diff(edges)[::-1]
+
+
+class Waveform(Mapping):
+    """
+    Simulation results: a set of signals sampled at the same time points.
+    Behaves as a (read-only) dictionary from signal names to Signal objects,
+    which are only created for the signals that are actually accessed.
+    """
+    def __init__(self, time, columns):
+        """
+        `time`: array of time points
+        `columns`: dictionary mapping signal names to arrays of values, one
+            per time point
+        """
+        self.time = np.asarray(time, dtype=float)
+        self.columns = columns
+        self.signals = {}
+
+    def __getitem__(self, name):
+        if name not in self.signals:
+            self.signals[name] = Signal(self.time, self.columns[name])
+        return self.signals[name]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def sample(self, queries):
+        """
+        Evaluates the (name, time) pairs in `queries`, returning a list of
+        values in the same order.  Queries are grouped by signal, so that each
+        signal is interpolated with a single vectorized call.
+        """
+        groups = {}
+        for k, (name, _) in enumerate(queries):
+            groups.setdefault(name, []).append(k)
+        values = [None] * len(queries)
+        for name, indices in groups.items():
+            times = np.array([queries[k][1] for k in indices], dtype=float)
+            for k, value in zip(indices, self[name](times).tolist()):
+                values[k] = value
+        return values
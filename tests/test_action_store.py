@@ -0,0 +1,92 @@
+import tempfile
+from hwtypes import BitVector
+import fault
+from fault.actions import Poke, Expect, Step, Read, Loop
+from fault.action_store import ActionStore, OBJECT
+from fault.verilator_interpreter import VerilatorPortTable, ActionStreamEncoder
+from .common import (TestBasicClkCircuit, TestUInt128Circuit,
+                     TestNestedArraysCircuit)
+
+
+def record(tester, circ):
+    tester.poke(circ.I, 1)
+    tester.eval()
+    tester.expect(circ.O, 1)
+    tester.step(2)
+    read = tester.read(circ.O)
+    loop = tester.loop(2)
+    loop.poke(circ.I, loop.index)
+    tester.poke(circ.I, 0, delay=1.5e-9)
+    tester.expect(circ.O, 0, strict=True)
+    return read
+
+
+def test_action_store_round_trip():
+    circ = TestBasicClkCircuit
+    tester = fault.Tester(circ, circ.CLK)
+    compact = fault.Tester(circ, circ.CLK, compact_actions=True)
+    record(tester, circ)
+    read = record(compact, circ)
+    assert isinstance(compact.actions, ActionStore)
+    assert len(compact.actions) == len(tester.actions)
+    assert str(compact.actions) == str(tester.actions)
+
+    # only the Read handle and the loop are stored as objects
+    store = compact.actions
+    assert [type(store.objects[store.values[i]]) for i in range(len(store))
+            if store.ops[i] == OBJECT] == [Read, Loop]
+    assert store[4] is read
+    assert store[-2].delay == 1.5e-9
+    assert store[0].delay is None
+    assert isinstance(store[3], Step) and store[3].steps == 2
+
+    compact.clear()
+    assert isinstance(compact.actions, ActionStore)
+    assert len(compact.actions) == 0
+
+
+def test_action_store_wide_values():
+    circ = TestUInt128Circuit
+    value = BitVector[128](0x0123456789abcdef0011223344556677)
+    store = ActionStore([Poke(circ.I, value), Expect(circ.O, value),
+                         Poke(circ.I, value - 1)])
+    assert [action.value for action in store] == [value, value, value - 1]
+    # one 128-bit value per action in the words pool, and no objects
+    assert len(store.words) == 12
+    assert store.objects == []
+
+
+def test_action_store_encoder():
+    # the action stream is the same whether the actions are stored in a
+    # list or in an ActionStore
+    for circ in [TestUInt128Circuit, TestNestedArraysCircuit]:
+        tester = fault.Tester(circ)
+        for k in range(4):
+            tester.poke(circ.I, [k, k + 1, k + 2]
+                        if circ is TestNestedArraysCircuit else k << 100)
+            tester.eval()
+            tester.expect(circ.O, [k, k + 1, k + 2]
+                          if circ is TestNestedArraysCircuit else k << 100)
+        table = VerilatorPortTable(circ)
+        expected = ActionStreamEncoder(table).encode(tester.actions).end()
+        store = ActionStore(tester.actions)
+        assert ActionStreamEncoder(table).encode(store).end() == expected
+        # expects are numbered from `start` in both cases
+        offset = ActionStreamEncoder(table).encode(tester.actions, start=5)
+        assert ActionStreamEncoder(table).encode(store, start=5).end() == \
+            offset.end() != expected
+
+
+def test_action_store_target():
+    circ = TestBasicClkCircuit
+    tester = fault.Tester(circ, circ.CLK, compact_actions=True)
+    tester.poke(circ.I, 0)
+    tester.eval()
+    tester.expect(circ.O, 0)
+    for k in range(10):
+        tester.poke(circ.I, k % 2)
+        tester.step(2)
+        tester.expect(circ.O, k % 2)
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        tester.compile_and_run("verilator", directory=tempdir,
+                               flags=["-Wno-lint"])
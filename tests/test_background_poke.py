@@ -1,8 +1,11 @@
+import math
 import magma as m
 import fault
 import tempfile
 import pytest
 from pathlib import Path
+from fault.spice_target import SpiceTarget
+from fault.system_verilog_target import SystemVerilogTarget
 from .common import pytest_sim_params, TestBasicCircuit
 
 def plot(xs, ys):
@@ -131,3 +134,97 @@ def test_sin_spice(vsup=1.5, vil_rel=0.4, vih_rel=0.6,
         print('%2d\t'%k, value)
 
     plot(xs, ys)
+
+
+def test_native_sources(tmp_path):
+    # a background clock and sine wave running until the end of the test are
+    # written as sources rather than expanded into pokes
+    dut = m.DeclareCircuit(
+        'myinv',
+        'in_', fault.RealIn,
+        'clk', m.In(m.Bit),
+        'out', fault.RealOut
+    )
+    tester = fault.Tester(dut)
+    tester.poke(dut.clk, 0, delay={'freq': 1e9})
+    tester.poke(dut.in_, 0, delay={
+        'type': 'sin',
+        'freq': 1e6,
+        'amplitude': 0.4,
+        'offset': 0.6
+    })
+    tester.delay(1e-6)
+    target = SpiceTarget(dut, directory=str(tmp_path), vsup=1.5)
+    comp = target.compile(tester.actions)
+    assert comp.pwls == {}
+    assert [source.type_ for source in comp.sources] == ['clock', 'sin']
+    tb_file = target.write_test_bench(comp, tb_file=tmp_path / 'tb.sp')
+    with open(tb_file) as f:
+        tb = f.read()
+    assert 'PULSE(0 1.5 5e-10 ' in tb
+    assert 'SIN(0.6 0.4 ' in tb
+
+    # a clock that is poked again is expanded
+    tester.poke(dut.clk, 1)
+    comp = target.compile(tester.actions)
+    assert [source.type_ for source in comp.sources] == ['sin']
+    assert len(comp.pwls['clk'][0]) > 1000
+
+
+def test_native_sources_verilog(tmp_path):
+    # background clocks and sine waves on real ports are generated by
+    # initial blocks of the testbench (only the code is generated, so no
+    # simulator is needed)
+    dut = m.DeclareCircuit(
+        'mydut',
+        'in_', fault.RealIn,
+        'clk', m.In(m.Bit),
+        'dig', m.In(m.Bit),
+        'out', fault.RealOut
+    )
+    tester = fault.Tester(dut)
+    tester.delay(2e-9)
+    tester.poke(dut.clk, 0, delay={'freq': 1e9, 'duty_cycle': 0.25})
+    tester.poke(dut.in_, 0, delay={
+        'type': 'sin',
+        'freq': 1e6,
+        'amplitude': 0.4,
+        'offset': 0.6
+    })
+    # sine waves can't be generated natively on digital ports
+    tester.poke(dut.dig, 0, delay={'type': 'sin', 'freq': 1e8})
+    tester.delay(1e-7)
+    target = SystemVerilogTarget(dut, simulator='iverilog',
+                                 directory=str(tmp_path),
+                                 ext_model_file=True)
+    actions = target.process_background_pokes(tester.actions)
+    clock, sine = target.periodic_sources
+    assert clock.port is dut.clk and sine.port is dut.in_
+    src = target.generate_code(actions, {})
+    first, second = clock.half_periods
+    assert f'''\
+    initial begin
+        #(2e-09*1s);
+        forever begin
+            clk = 0;
+            #({first}*1s);
+            clk = 1;
+            #({second}*1s);
+        end
+    end
+''' in src
+    assert f'''\
+    real __in__t = 0;
+    initial begin
+        #(2e-09*1s);
+        forever begin
+            in_ = 0.6 + 0.4*$sin({2 * math.pi * sine.freq}*__in__t + 0.0);
+            #({sine.dt}*1s);
+            __in__t = __in__t + {sine.dt};
+        end
+    end
+''' in src
+    assert first == pytest.approx(3 * second)
+    # the sine wave on the digital port is expanded into pokes
+    assert '__dig_t' not in src
+    assert src.count('dig = ') > 50
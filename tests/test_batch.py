@@ -0,0 +1,26 @@
+import tempfile
+import os
+from fault.tester import Tester
+from fault.batch import run_batch
+from .common import TestBasicCircuit
+
+
+def test_run_batch():
+    circ = TestBasicCircuit
+    jobs = []
+    for value in [0, 1, 0, 1]:
+        tester = Tester(circ)
+        tester.poke(circ.I, value)
+        tester.eval()
+        tester.expect(circ.O, value)
+        jobs.append((tester, "verilator", {"flags": ["-Wno-lint"]}))
+    # make the last job fail
+    tester.expect(circ.O, 0)
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        report = run_batch(jobs, processes=2, directory=tempdir)
+        assert not report.passed
+        assert [result.passed for result in report.results] == \
+            [True, True, True, False]
+        assert report.failures[0].index == 3
+        for k in range(4):
+            assert os.path.isdir(os.path.join(tempdir, f"job_{k}"))
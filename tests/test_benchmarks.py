@@ -0,0 +1,13 @@
+import pytest
+from benchmarks.cases import BENCHMARKS
+from benchmarks.runner import measure_case, compare
+
+
+@pytest.mark.parametrize('name', list(BENCHMARKS))
+def test_benchmark_case(name, tmp_path):
+    # run each case at a small size so that the benchmarks keep working
+    result = measure_case(name, 100, str(tmp_path))
+    assert result['name'] == name
+    assert result['amount'] > 0
+    assert result['throughput'] > 0
+    assert compare(result, result, tolerance=0.2) == []
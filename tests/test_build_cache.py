@@ -0,0 +1,37 @@
+import os
+import tempfile
+from pathlib import Path
+from fault.build_cache import BuildCache
+
+
+def test_build_cache_key():
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        src = Path(tempdir) / "foo.v"
+        src.write_text("module foo; endmodule")
+        key = BuildCache.key("verilator", ["-Wall"], 4.0, src)
+        assert key == BuildCache.key("verilator", ["-Wall"], 4.0, src)
+        assert key != BuildCache.key("verilator", ["-Wall", "--trace"], 4.0,
+                                     src)
+        src.write_text("module foo(input I); endmodule")
+        assert key != BuildCache.key("verilator", ["-Wall"], 4.0, src)
+
+
+def test_build_cache_store_fetch():
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        cache = BuildCache(Path(tempdir) / "cache")
+        obj_dir = Path(tempdir) / "build0" / "obj_dir"
+        os.makedirs(obj_dir)
+        (obj_dir / "Vfoo").write_text("exe")
+        key = cache.key("foo")
+        assert cache.lookup(key) is None
+        assert not cache.fetch(key, Path(tempdir) / "build1" / "obj_dir",
+                               "obj_dir")
+
+        cache.store(key, obj_dir)
+        assert cache.lookup(key) is not None
+        dst = Path(tempdir) / "build1" / "obj_dir"
+        assert cache.fetch(key, dst, "obj_dir")
+        assert (dst / "Vfoo").read_text() == "exe"
+        # copies preserve modification times so make doesn't rebuild
+        assert os.path.getmtime(dst / "Vfoo") == \
+            os.path.getmtime(obj_dir / "Vfoo")
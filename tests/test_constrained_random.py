@@ -1,5 +1,5 @@
 import random
-from fault.random import ConstrainedRandomGenerator
+from fault.random import ConstrainedRandomGenerator, sample_constrained_bvs
 
 N = 8
 WIDTH = 8
@@ -19,3 +19,44 @@ def test_constrained_random():
 
     for m in models:
         assert pred(**m)
+
+
+def test_constrained_random_parallel(tmp_path):
+    random.seed(0)
+    v = dict(x=WIDTH, y=WIDTH, z=None)
+
+    def pred(x, y, z):
+        return ((x & y) == 3) & (z | (x == y))
+
+    gen = ConstrainedRandomGenerator(processes=2, solution_cache=tmp_path)
+    models = list(gen.iter_samples(v, pred, N))
+    assert len(models) == len(set(models)) == N
+    for m in models:
+        assert pred(**m)
+
+    # the solutions are cached, so a new generator returns them without
+    # running the solver
+    assert len(list(tmp_path.iterdir())) == 1
+    gen = ConstrainedRandomGenerator(max_epochs=0, solution_cache=tmp_path)
+    assert gen(v, pred, N) == set(models)
+
+
+def test_sample_constrained_bvs():
+    random.seed(0)
+    # a sparse predicate, which rejection sampling would take forever to
+    # satisfy
+    values = sample_constrained_bvs(32, lambda x: (x & 0xFFFFFFF0) == 0x1234560,
+                                    100)
+    assert len(values) == 100
+    assert all(value & 0xFFFFFFF0 == 0x1234560 for value in values)
+    assert len(set(values)) == 16
+
+    values = sample_constrained_bvs(8, lambda x: x[0] == 1, 100)
+    assert len(values) == 100
+    assert all(value & 1 for value in values)
+
+    # a sparse predicate that can only be evaluated on concrete values is
+    # still sampled by rejection
+    values = sample_constrained_bvs(16, lambda x: x.as_uint() % 97 == 3, 100)
+    assert len(values) == 100
+    assert all(value % 97 == 3 for value in values)
@@ -0,0 +1,64 @@
+import tempfile
+import numpy as np
+import pytest
+import fault
+from fault.actions import Poke, Expect, Eval, Step
+from .common import TestBasicClkCircuit, TestUInt128Circuit, TestByteCircuit
+
+
+def test_drive_actions():
+    circ = TestByteCircuit
+    values = np.array([0, 1, 255, -1])
+    tester = fault.Tester(circ)
+    tester.drive([(circ.I, values)], expect={'O': values},
+                 step_per_row=False)
+    assert len(tester.actions) == 3 * len(values)
+    expected = fault.Tester(circ)
+    for value in values.tolist():
+        expected.poke(circ.I, value)
+        expected.eval()
+        expected.expect(circ.O, value)
+    assert str(tester.actions) == str(expected.actions)
+
+
+@pytest.mark.parametrize('compact_actions', [False, True])
+def test_drive_wide(compact_actions):
+    circ = TestUInt128Circuit
+    values = [0, 1 << 127, (1 << 128) - 1, 0x0123456789abcdef0011223344556677]
+    words = np.array([[(v >> (32 * k)) & 0xffffffff for k in range(4)]
+                      for v in values], dtype=np.uint32)
+    for data in [np.array(values, dtype=object), words]:
+        tester = fault.Tester(circ, compact_actions=compact_actions)
+        tester.drive({'I': data}, expect={'O': data}, step_per_row=False)
+        pokes = [action for action in tester.actions
+                 if isinstance(action, Poke)]
+        assert [poke.value.as_uint() for poke in pokes] == values
+
+
+def test_drive_errors():
+    circ = TestByteCircuit
+    tester = fault.Tester(circ)
+    with pytest.raises(ValueError):
+        tester.drive({'I': [0, 256]}, step_per_row=False)
+    with pytest.raises(ValueError):
+        tester.drive({'I': [0, 1]}, expect={'O': [0]}, step_per_row=False)
+    with pytest.raises(ValueError):
+        tester.drive({'O': [0, 1]}, step_per_row=False)
+    with pytest.raises(RuntimeError):
+        # no clock
+        tester.drive({'I': [0, 1]})
+    assert len(tester.actions) == 0
+
+
+@pytest.mark.parametrize('compact_actions', [False, True])
+def test_drive_verilator(compact_actions):
+    circ = TestBasicClkCircuit
+    values = np.random.RandomState(0).randint(0, 2, size=100)
+    tester = fault.Tester(circ, circ.CLK, compact_actions=compact_actions)
+    tester.drive({'I': values}, expect={'O': values})
+    assert isinstance(tester.actions[3], Step)
+    assert isinstance(tester.actions[1], Eval)
+    assert isinstance(tester.actions[2], Expect)
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        tester.compile_and_run("verilator", directory=tempdir,
+                               flags=["-Wno-lint"])
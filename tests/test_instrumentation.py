@@ -0,0 +1,66 @@
+import json
+import sys
+import pytest
+import fault.instrumentation as instrumentation
+from fault.subprocess_run import subprocess_run
+
+
+def test_instrumentation_run(tmp_path):
+    records = []
+    log = tmp_path / 'runs.jsonl'
+    sinks = [records.append, instrumentation.JSONLinesSink(log)]
+    for sink in sinks:
+        instrumentation.add_sink(sink)
+    try:
+        with instrumentation.run(target='test', actions=3) as run:
+            with instrumentation.phase('codegen') as record:
+                record['source_bytes'] = 123
+            with instrumentation.phase('simulate'):
+                cmd = [sys.executable, '-c', 'sum(range(100000))']
+                subprocess_run(cmd, use_fault_cfg=False)
+            run['extra'] = 'info'
+    finally:
+        for sink in sinks:
+            instrumentation.remove_sink(sink)
+
+    assert len(records) == 1
+    record = records[0]
+    assert record['event'] == 'run'
+    assert record['status'] == 'passed'
+    assert record['target'] == 'test'
+    assert record['actions'] == 3
+    assert record['extra'] == 'info'
+    assert [phase['phase'] for phase in record['phases']] == \
+        ['codegen', 'simulate']
+    assert record['phases'][0]['source_bytes'] == 123
+    for phase in record['phases']:
+        assert 0 <= phase['wall_time'] <= record['wall_time']
+    if instrumentation.resource is not None:
+        assert record['phases'][1]['child_cpu_time'] > 0
+        assert record['max_rss'] > 0
+
+    # the same record is written to the JSON lines file
+    lines = log.read_text().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0]) == record
+
+
+def test_instrumentation_failure():
+    records = []
+    instrumentation.add_sink(records.append)
+    try:
+        with pytest.raises(AssertionError):
+            with instrumentation.run(target='test'):
+                with instrumentation.phase('simulate'):
+                    raise AssertionError
+        # phases outside of a run are emitted on their own
+        with instrumentation.phase('compile'):
+            pass
+    finally:
+        instrumentation.remove_sink(records.append)
+
+    assert [record['event'] for record in records] == ['run', 'phase']
+    assert records[0]['status'] == 'failed'
+    assert records[0]['error'] == 'AssertionError'
+    assert records[0]['phases'][0]['phase'] == 'simulate'
+    assert records[1]['phase'] == 'compile'
@@ -0,0 +1,81 @@
+import numpy as np
+from hwtypes import BitVector
+import fault
+from fault.actions import Poke, Expect, Eval, Step
+from fault.numpy_target import NumpyTarget
+from fault.test_vectors import (generate_simulator_test_vectors,
+                                iter_simulator_test_vectors)
+from .common import (TestBasicCircuit, TestBasicClkCircuit, TestByteCircuit,
+                     TestNestedArraysCircuit, SimpleALU, AndCircuit)
+
+
+def test_numpy_target_basic():
+    circ = TestBasicCircuit
+    actions = [
+        Poke(circ.I, BitVector[1](1)),
+        Expect(circ.O, BitVector[1](0)),
+        Eval(),
+        Expect(circ.O, BitVector[1](1)),
+    ]
+    NumpyTarget(circ).run(actions)
+
+
+def test_numpy_target_nested_arrays():
+    circ = TestNestedArraysCircuit
+    tester = fault.Tester(circ)
+    tester.poke(circ.I, [1, 2, 3])
+    tester.eval()
+    tester.expect(circ.O, [1, 2, 3])
+    tester.compile_and_run("numpy")
+
+
+def test_numpy_target_alu():
+    circ = SimpleALU
+    tester = fault.Tester(circ, circ.CLK)
+    tester.poke(circ.CLK, 0)
+    tester.poke(circ.a, 7)
+    tester.poke(circ.b, 3)
+    for opcode, result in enumerate([10, 4, 21, (3 - 7) % (1 << 16)]):
+        tester.poke(circ.config_data, opcode)
+        tester.poke(circ.config_en, 1)
+        tester.step(2)
+        tester.expect(circ.c, result)
+    tester.compile_and_run("numpy")
+
+
+def test_numpy_target_batch():
+    # simulate many copies of the circuit at once
+    circ = SimpleALU
+    a = np.arange(1000, dtype=np.uint64)
+    b = np.arange(1000, dtype=np.uint64)[::-1] * 7
+    actions = [
+        Poke(circ.CLK, 0),
+        Poke(circ.config_data, 2),
+        Poke(circ.config_en, 1),
+        Step(circ.CLK, 2),
+        Poke(circ.a, a),
+        Poke(circ.b, b),
+        Eval(),
+        Expect(circ.c, (a * b) % (1 << 16)),
+    ]
+    NumpyTarget(circ, circ.CLK, batch=1000).run(actions)
+
+
+def test_numpy_clk_circuit():
+    circ = TestBasicClkCircuit
+    tester = fault.Tester(circ, circ.CLK)
+    tester.poke(circ.I, 1)
+    tester.step(2)
+    tester.expect(circ.O, 1)
+    tester.compile_and_run("numpy")
+
+
+def test_numpy_simulator_test_vectors():
+    for circ in [AndCircuit, TestByteCircuit]:
+        assert generate_simulator_test_vectors(circ, backend='numpy') == \
+            generate_simulator_test_vectors(circ)
+        # each chunk is simulated as a separate batch
+        chunks = iter_simulator_test_vectors(circ, chunk_size=3,
+                                             backend='numpy')
+        assert [vector for chunk in chunks for vector in chunk] == \
+            generate_simulator_test_vectors(circ, flatten=False)
@@ -1,4 +1,5 @@
-from fault.pwl import pwc_to_pwl
+import numpy as np
+from fault.pwl import pwc_to_pwl, pwc_to_pwl_array, write_pwl_file
 from math import isclose
 
 
@@ -18,3 +19,23 @@ def test_spice_target_pwl(t_tr=0.2e-9, t_stop=20e-9):
 
     run_test([(0, 1.2), (10e-9, 3.4), (15e-9, 5.6)],
              [(0, 1.2), (10e-9, 1.2), (10.2e-9, 3.4), (15e-9, 3.4), (15.2e-9, 5.6), (20e-9, 5.6)])  # noqa
+
+
+def test_pwl_overlap(t_tr=0.2e-9, t_stop=20e-9):
+    # steps at the same time keep the later value, and a ramp that would
+    # overlap the next step ends halfway to it
+    meas = pwc_to_pwl([(1e-9, 1.2), (1e-9, 2.3), (1.1e-9, 3.4),
+                       (25e-9, 5.6)], t_stop, t_tr=t_tr)
+    expct = [(0, 0), (1e-9, 0), (1.05e-9, 2.3), (1.1e-9, 2.3), (1.3e-9, 3.4),
+             (20e-9, 5.6)]
+    assert len(meas) == len(expct)
+    check_pwl_result(meas=meas, expct=expct)
+
+
+def test_pwl_file(tmp_path):
+    times = np.arange(1, 1001) * 1e-9
+    values = np.arange(1000) % 2
+    pwl = pwc_to_pwl_array(times, values, 1e-6, t_tr=0.2e-9)
+    assert pwl.shape == (2000, 2)
+    write_pwl_file(tmp_path / 'stim.pwl', pwl)
+    assert np.allclose(np.loadtxt(tmp_path / 'stim.pwl'), pwl)
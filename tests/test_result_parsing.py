@@ -2,6 +2,7 @@ from fault.psf_parse import psf_parse
 from fault.nutascii_parse import nutascii_parse
 from math import isclose
 from pathlib import Path
+import numpy as np
 
 
 def check_spice_result(meas, expct):
@@ -22,3 +23,30 @@ def test_spice_target_psf_parse():
     check_spice_result(results['in_'], [(0, 2), (1, 2), (2.5, 3.5), (4, 5),
                                         (5.5, 6.5), (7, 8), (8, 8)])
     check_spice_result(results['out<0>'], [(1, 3), (4, 6), (7, 9)])
+
+
+def test_nutbin_parse():
+    # same data as ngspice.raw, in binary format
+    results = nutascii_parse(Path('tests/data/ngspice_bin.raw').resolve())
+    check_spice_result(results['in_'], [(0, 2), (1, 2), (2.5, 3.5), (4, 5),
+                                        (5.5, 6.5), (7, 8), (8, 8)])
+    check_spice_result(results['out<0>'], [(1, 3), (4, 6), (7, 9)])
+
+
+def test_nutbin_parse_big_endian(tmp_path):
+    # the byte order of binary raw files depends on the simulator
+    data = Path('tests/data/ngspice_bin.raw').read_bytes()
+    start = data.index(b'Binary:\n') + len(b'Binary:\n')
+    values = np.frombuffer(data[start:], dtype='<f8').astype('>f8')
+    raw_file = tmp_path / 'big_endian.raw'
+    raw_file.write_bytes(data[:start] + values.tobytes())
+    results = nutascii_parse(raw_file, signals=['OUT<0>'])
+    assert list(results) == ['out<0>']
+    check_spice_result(results['out<0>'], [(1, 3), (4, 6), (7, 9)])
+
+
+def test_waveform_sample():
+    results = nutascii_parse(Path('tests/data/ngspice.raw').resolve())
+    queries = [('in_', 2.5), ('out<0>', 4), ('in_', 0), ('out<0>', 8)]
+    assert results.sample(queries) == [3.5, 6, 2, 9]
+    assert sorted(results) == ['in_', 'out<0>']
@@ -0,0 +1,54 @@
+import shutil
+from pathlib import Path
+import pytest
+import magma as m
+import fault
+from fault.spice_sweep import spice_sweep, sweep_points
+
+
+def test_sweep_points():
+    points = sweep_points({'vsup': [1.0, 1.5], 'temp': [0, 27, 85]})
+    assert len(points) == 6
+    assert points[0] == {'vsup': 1.0, 'temp': 0}
+    assert points[-1] == {'vsup': 1.5, 'temp': 85}
+    assert sweep_points([{'vsup': 1.2}]) == [{'vsup': 1.2}]
+
+
+def test_spice_sweep_reserved_names():
+    # names set by spice_sweep itself can't be swept
+    for name in ['directory', 'params', 'circuit']:
+        with pytest.raises(ValueError):
+            spice_sweep(None, {name: [0, 1]})
+    # every conflicting name is reported
+    with pytest.raises(ValueError, match="'circuit', 'directory'"):
+        spice_sweep(None, [{'directory': 0}], circuit=None)
+
+
+@pytest.mark.skipif(shutil.which('ngspice') is None,
+                    reason='ngspice not installed')
+def test_spice_sweep(tmp_path):
+    myinv = m.DeclareCircuit(
+        'myinv',
+        'in_', fault.RealIn,
+        'out', fault.RealOut,
+        'vdd', fault.RealIn,
+        'vss', fault.RealIn
+    )
+
+    tester = fault.Tester(myinv)
+    tester.poke(myinv.vdd, 1.5)
+    tester.poke(myinv.vss, 0)
+    tester.poke(myinv.in_, 0)
+    tester.delay(1e-9)
+    out = tester.read(myinv.out)
+
+    grid = {'temp': [0, 85], 'vsup': [1.2, 1.5]}
+    result = spice_sweep(tester, grid, reads={'out': out},
+                         directory=tmp_path, processes=2,
+                         model_paths=[Path('tests/spice/myinv.sp').resolve()])
+
+    assert result.passed, result.errors
+    assert len(result) == 4
+    assert list(result['temp']) == [0, 0, 85, 85]
+    assert list(result['vsup']) == [1.2, 1.5, 1.2, 1.5]
+    assert all(value > 1.0 for value in result['out'])
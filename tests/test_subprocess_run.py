@@ -0,0 +1,40 @@
+import sys
+import time
+import pytest
+from fault.subprocess_run import subprocess_run
+
+
+def python_cmd(code):
+    return [sys.executable, '-c', code]
+
+
+def test_subprocess_run_large_stderr():
+    # writing lots of STDERR before any STDOUT must not stall the subprocess
+    code = ("import sys\n"
+            "sys.stderr.write('e' * 100 + '\\n' * 10000)\n"
+            "sys.stderr.write('x\\n' * 100000)\n"
+            "print('done')")
+    result = subprocess_run(python_cmd(code))
+    assert result.stdout == 'done\n'
+    assert result.stderr.count('x\n') == 100000
+
+
+def test_subprocess_run_err_str_kill():
+    code = ("import time\n"
+            "print('ERROR: something went wrong', flush=True)\n"
+            "time.sleep(60)")
+    start = time.time()
+    with pytest.raises(AssertionError):
+        subprocess_run(python_cmd(code), err_str='ERROR')
+    assert time.time() - start < 30
+
+
+def test_subprocess_run_log(tmp_path):
+    log_file = tmp_path / 'sim.log'
+    code = "for k in range(10000): print(k)"
+    result = subprocess_run(python_cmd(code), log_file=log_file,
+                            capture_output=False, tail_lines=10)
+    # only the tail is kept in memory, while the log has everything
+    assert result.stdout.split() == [str(k) for k in range(9990, 10000)]
+    with open(log_file) as f:
+        assert f.read().split() == [str(k) for k in range(10000)]
@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+import pytest
+import fault
+from .common import TestBasicCircuit
+
+
+@pytest.mark.skipif(shutil.which('iverilog') is None,
+                    reason='iverilog not installed')
+def test_sv_incremental_compile():
+    circ = TestBasicCircuit
+
+    def make_tester(value):
+        tester = fault.Tester(circ)
+        tester.poke(circ.I, value)
+        tester.eval()
+        tester.expect(circ.O, value)
+        return tester
+
+    with tempfile.TemporaryDirectory(dir='.') as tmp_dir:
+        tb_file = os.path.join(tmp_dir, f'{circ.name}_tb.sv')
+        bin_file = os.path.join(tmp_dir, f'{circ.name}_tb')
+        kwargs = dict(target='system-verilog', simulator='iverilog',
+                      directory=tmp_dir)
+
+        make_tester(1).compile_and_run(**kwargs)
+        tb_mtime = os.stat(tb_file).st_mtime_ns
+        bin_mtime = os.stat(bin_file).st_mtime_ns
+
+        # same actions: neither the testbench nor the binary is rebuilt
+        make_tester(1).compile_and_run(**kwargs)
+        assert os.stat(tb_file).st_mtime_ns == tb_mtime
+        assert os.stat(bin_file).st_mtime_ns == bin_mtime
+
+        # different actions: the testbench is recompiled
+        make_tester(0).compile_and_run(**kwargs)
+        assert os.stat(tb_file).st_mtime_ns != tb_mtime
+        assert os.stat(bin_file).st_mtime_ns != bin_mtime
@@ -1,10 +1,16 @@
 from itertools import product
+import numpy as np
 import pytest
 from hwtypes import Bit
 import magma as m
 import mantle
 from fault.test_vectors import (generate_function_test_vectors,
-                                generate_simulator_test_vectors)
+                                generate_simulator_test_vectors,
+                                iter_function_test_vectors,
+                                iter_simulator_test_vectors,
+                                map_function_test_vectors,
+                                map_simulator_test_vectors, iter_indices,
+                                decode_indices)
 from fault.value import AnyValue
 from .common import TestBasicCircuit, TestArrayCircuit, TestSIntCircuit
 
@@ -55,3 +61,73 @@ def test_combinational_circuit():
     prev_inputs = test_vectors[-2].test_vector[:3]
     expected = Bit(f(*prev_inputs))
     assert vec[3] == expected
+
+
+@pytest.mark.parametrize("Circuit", [TestArrayCircuit, TestSIntCircuit])
+def test_iter_function_test_vectors(Circuit):
+    def fn(I):
+        return I
+    expected = generate_function_test_vectors(Circuit, fn, flatten=False)
+    for vectorized in [False, True]:
+        vectors = []
+        for shard in range(3):
+            for chunk in iter_function_test_vectors(
+                    Circuit, fn, chunk_size=3, shard=shard, num_shards=3,
+                    vectorized=vectorized):
+                assert len(chunk) <= 3
+                vectors += chunk
+        assert vectors == expected
+
+
+@pytest.mark.parametrize("Circuit", [TestArrayCircuit, TestSIntCircuit])
+def test_iter_simulator_test_vectors(Circuit):
+    expected = generate_simulator_test_vectors(Circuit, flatten=False)
+    vectors = []
+    for shard in range(3):
+        for chunk in iter_simulator_test_vectors(
+                Circuit, chunk_size=3, shard=shard, num_shards=3):
+            assert len(chunk) <= 3
+            vectors += chunk
+    assert vectors == expected
+    shards = map_simulator_test_vectors(
+        Circuit, lambda chunks: [v for c in chunks for v in c],
+        num_shards=2, processes=2, chunk_size=3)
+    assert shards[0] + shards[1] == expected
+
+
+def test_stratified_test_vectors():
+    def fn(I):
+        return I
+    vectors = [vector for chunk in iter_function_test_vectors(
+        TestArrayCircuit, fn, mode='stratified', samples=4, seed=1)
+        for vector in chunk]
+    # one vector from each quarter of the inputs
+    assert [int(vector[0]) // 2 for vector in vectors] == [0, 1, 2, 3]
+    assert all(vector[0] == vector[1] for vector in vectors)
+    # the vectors don't depend on the sharding
+    shards = map_function_test_vectors(
+        TestArrayCircuit, fn, lambda chunks: [v for c in chunks for v in c],
+        num_shards=2, processes=2, mode='stratified', samples=4, seed=1)
+    assert shards[0] + shards[1] == vectors
+
+
+def test_stratified_indices_wide():
+    # two 32-bit inputs: the strata are drawn with vectorized 64-bit
+    # arithmetic rather than Python ints
+    total, samples = 1 << 64, 1000
+    indices = list(iter_indices(total, chunk_size=256, samples=samples,
+                                seed=2))
+    assert all(chunk.dtype != object for chunk in indices)
+    q, r = divmod(total, samples)
+    for k, index in enumerate(int(i) for chunk in indices for i in chunk):
+        assert k * q + min(k, r) <= index < (k + 1) * q + min(k + 1, r)
+    # an SInt[62] input and a Bit: 2 ** 63 vectors, indexed with uint64
+    # arrays, but the digits of the SInt input are decoded as int64
+    domains = [(None, range(-2 ** 61, 2 ** 61)), (None, range(2))]
+    for samples in [None, 1000]:
+        chunk = next(iter_indices(1 << 63, chunk_size=256, samples=samples))
+        assert chunk.dtype == np.uint64
+        sint, bit = decode_indices(chunk, domains)
+        assert [(int(a), int(b)) for a, b in zip(sint, bit)] == \
+            [(-2 ** 61 + int(index) // 2, int(index) % 2)
+             for index in chunk]
@@ -3,7 +3,7 @@ from hwtypes import BitVector
 import fault
 from fault.actions import Poke, Expect, Eval, Step, Print
 from fault.array import Array
-from fault.vector_builder import VectorBuilder
+from fault.vector_builder import VectorBuilder, VectorStore
 from .common import (TestBasicCircuit, TestBasicClkCircuit,
                      TestNestedArraysCircuit)
 
@@ -49,3 +49,48 @@ def test_tester_nested_arrays():
         builder.process(Expect(circ.O[i], BitVector[4](val)))
         expected.append(val)
     assert builder.vectors == [[Array(expected, 3), Array(expected, 3)]]
+
+
+def test_vector_store_delta():
+    circ = TestBasicClkCircuit
+    tester = fault.Tester(circ, circ.CLK)
+    tester.poke(circ.CLK, 0)
+    tester.poke(circ.I, 1)
+    for k in range(100):
+        tester.step(2)
+        tester.expect(circ.O, 1)
+    builder = VectorBuilder(circ)
+    for action in tester.actions:
+        builder.process(action)
+    store = builder.store
+    assert len(store) == len(builder.vectors) == 201
+    # I never changes, O is only known every other cycle and CLK changes
+    # at every cycle
+    assert [len(cycles) for cycles in store.cycles] == [1, 200, 201]
+    states, values = store.dense(0)
+    assert list(values) == [1] * 201
+    assert store.value(2, 200) == BitVector[1](0)
+
+
+def test_vector_store_save(tmp_path):
+    circ = TestNestedArraysCircuit
+    tester = fault.Tester(circ)
+    for k in range(10):
+        tester.poke(circ.I, [k, k + 1, k + 2])
+        tester.eval()
+        tester.expect(circ.O, [k, k + 1, k + 2])
+    file = str(tmp_path / "vectors.npz")
+    vectors = tester.serialize(file)
+    store = VectorStore.load(file)
+    assert len(store) == len(vectors)
+    assert store.vectors()[-1] == [value for port in vectors[-1]
+                                   for value in port.value]
+
+    builder = VectorBuilder(circ)
+    for action in tester.actions:
+        builder.process(action)
+    assert builder.store.diff(store) == {}
+    builder.process(Poke(circ.I[1], BitVector[4](0)))
+    diff = builder.store.diff(store)
+    assert list(diff) == [store.names[1]]
+    assert list(diff[store.names[1]]) == [len(store) - 1]
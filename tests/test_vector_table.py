@@ -0,0 +1,45 @@
+import os
+import tempfile
+import pytest
+import fault
+from .common import pytest_sim_params, TestBasicClkCircuit, TestByteCircuit
+
+
+def pytest_generate_tests(metafunc):
+    pytest_sim_params(metafunc, 'system-verilog')
+
+
+def test_vector_table(target, simulator):
+    circ = TestByteCircuit
+    tester = fault.Tester(circ)
+    for k in range(1000):
+        tester.poke(circ.I, k % 256)
+        tester.eval()
+        tester.expect(circ.O, k % 256)
+    tester.print("done\n")
+    tester.poke(circ.I, 0xAB)
+    tester.expect(circ.O, 0xAB)
+
+    with tempfile.TemporaryDirectory(dir='.') as tmp_dir:
+        tester.compile_and_run(target=target, simulator=simulator,
+                               directory=tmp_dir, vector_table=True)
+        # the actions are stored in the vector file, not the testbench
+        with open(os.path.join(tmp_dir, f'{circ.name}_tb.sv')) as f:
+            tb = f.read()
+        assert tb.count('__vt_replay(') == 3
+        with open(os.path.join(tmp_dir, f'{circ.name}_vectors.hex')) as f:
+            assert len(f.read().split()) == 2048
+
+
+def test_vector_table_failure(target, simulator):
+    if simulator == 'ncsim':
+        pytest.skip('ncsim errors are not detected from its output')
+    circ = TestBasicClkCircuit
+    tester = fault.Tester(circ, circ.CLK)
+    tester.poke(circ.I, 1)
+    tester.step(2)
+    tester.expect(circ.O, 0)
+    with tempfile.TemporaryDirectory(dir='.') as tmp_dir:
+        with pytest.raises(AssertionError):
+            tester.compile_and_run(target=target, simulator=simulator,
+                                   directory=tmp_dir, vector_table=True)
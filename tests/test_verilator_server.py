@@ -0,0 +1,31 @@
+import tempfile
+import pytest
+from fault.verilator_server import VerilatorServer
+from .common import TestUInt128Circuit, TestBasicClkCircuit
+
+
+def test_verilator_server_peek():
+    circ = TestUInt128Circuit
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        with VerilatorServer(circ, directory=tempdir,
+                             flags=["-Wno-lint"]) as server:
+            # the simulator stays up between commands, so the stimulus can
+            # depend on values read back from it
+            value = 0x1234
+            for _ in range(4):
+                server.poke(circ.I, value)
+                server.eval()
+                value = int(server.peek(circ.O)) * 3 + 1
+            server.expect(circ.O, (value - 1) // 3)
+
+
+def test_verilator_server_expect_failure():
+    circ = TestBasicClkCircuit
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        server = VerilatorServer(circ, circ.CLK, directory=tempdir,
+                                 flags=["-Wno-lint"])
+        server.poke(circ.I, 1)
+        server.step(2)
+        server.expect(circ.O, 0)
+        with pytest.raises(AssertionError):
+            server.flush()
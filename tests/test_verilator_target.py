@@ -1,11 +1,15 @@
+import re
 import tempfile
+import pytest
 import magma as m
 import fault
 from hwtypes import BitVector
 from fault.actions import Poke, Expect, Eval, Step, Print, Peek
 from fault.tester import Tester
+from fault.array import Array
 import os.path
-from .common import TestBasicCircuit, TestBasicClkCircuit
+from .common import (TestBasicCircuit, TestBasicClkCircuit,
+                     TestNestedArraysCircuit, TestUInt128Circuit)
 
 
 def test_verilator_peeks():
@@ -70,3 +74,141 @@ def test_verilator_trace():
         target.run(actions)
         assert os.path.isfile(f"{tempdir}/logs/BasicClkCircuit.vcd"), \
             "Expected VCD to exist"
+
+
+def test_verilator_build_cache():
+    circ = TestBasicCircuit
+    flags = ["-Wno-lint"]
+    tester = Tester(circ)
+    tester.poke(circ.I, 1)
+    tester.eval()
+    tester.expect(circ.O, 1)
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        cache_dir = os.path.join(tempdir, "cache")
+        build0 = os.path.join(tempdir, "build0")
+        build1 = os.path.join(tempdir, "build1")
+        tester.compile_and_run(target="verilator", directory=build0,
+                               flags=flags, build_cache=cache_dir)
+        tester.compile_and_run(target="verilator", directory=build1,
+                               flags=flags, build_cache=cache_dir)
+        # the second build is restored from the cache rather than rebuilt
+        exe0 = os.path.join(build0, "obj_dir", "VBasicCircuit")
+        exe1 = os.path.join(build1, "obj_dir", "VBasicCircuit")
+        assert os.path.getmtime(exe0) == os.path.getmtime(exe1)
+
+
+def test_verilator_interpreter_driver():
+    circ = TestBasicClkCircuit
+    flags = ["-Wno-lint"]
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        exe = os.path.join(tempdir, "obj_dir", "VBasicClkCircuit")
+        mtime = None
+        for value in [0, 1]:
+            tester = Tester(circ, circ.CLK)
+            tester.poke(circ.I, value)
+            tester.eval()
+            tester.expect(circ.O, value)
+            tester.step(2)
+            tester.poke(circ.I, 1 - value)
+            tester.eval()
+            tester.expect(circ.O, 1 - value)
+            tester.compile_and_run(target="verilator", directory=tempdir,
+                                   flags=flags, driver_mode="interpreter",
+                                   skip_verilator=mtime is not None)
+            # the driver doesn't depend on the actions, so changing the
+            # stimulus doesn't rebuild the executable
+            if mtime is not None:
+                assert os.path.getmtime(exe) == mtime
+            mtime = os.path.getmtime(exe)
+
+
+def test_verilator_constant_pool():
+    flags = ["-Wno-lint"]
+    wide = BitVector[128](0x0123456789abcdef0011223344556677)
+    array = Array([BitVector[4](v) for v in [1, 7, 12]], 3)
+    for circ, value in [(TestUInt128Circuit, wide),
+                        (TestNestedArraysCircuit, array)]:
+        actions = [Poke(circ.I, value), Eval(), Expect(circ.O, value)] * 3
+        with tempfile.TemporaryDirectory(dir=".") as tempdir:
+            m.compile(f"{tempdir}/{circ.name}", circ, output="coreir-verilog")
+            target = fault.verilator_target.VerilatorTarget(
+                circ, directory=f"{tempdir}/",
+                flags=flags, skip_compile=True)
+            target.run(actions)
+            driver = os.path.join(tempdir, f"{circ.name}_driver.cpp")
+            with open(driver) as f:
+                src = f.read()
+        # the value is stored once and copied in bulk by every action
+        assert src.count("fault_pool + 0") == 6
+        assert "fault_pool + 4" not in src
+
+
+def test_verilator_checkpoint_replay():
+    circ = TestBasicClkCircuit
+    tester = Tester(circ, circ.CLK)
+    for k in range(200):
+        tester.poke(circ.I, k % 2)
+        tester.eval()
+        # fail near the end of the test
+        tester.expect(circ.O, k % 2 if k != 150 else 1 - k % 2)
+        tester.step(2)
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        with pytest.raises(AssertionError):
+            tester.compile_and_run(target="verilator", directory=tempdir,
+                                   flags=["-Wno-lint"],
+                                   driver_mode="interpreter",
+                                   checkpoint_interval=50)
+        # only the cycles before the failure are traced
+        assert not os.path.exists(os.path.join(tempdir, "logs",
+                                               f"{circ.name}.vcd"))
+        vcd = os.path.join(tempdir, "logs", f"{circ.name}_failure.vcd")
+        assert os.path.getsize(vcd) > 0
+
+
+def test_verilator_segmented_driver():
+    circ = TestNestedArraysCircuit
+    flags = ["-Wno-lint"]
+    actions = []
+    for k in range(100):
+        value = Array([BitVector[4]((k + j) % 16) for j in range(3)], 3)
+        actions += [Poke(circ.I, value), Eval(), Expect(circ.O, value)]
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        m.compile(f"{tempdir}/{circ.name}", circ, output="coreir-verilog")
+        target = fault.verilator_target.VerilatorTarget(
+            circ, directory=f"{tempdir}/",
+            flags=flags, skip_compile=True, segment_size=50)
+        target.run(actions)
+        # the actions are split into functions in separate files
+        for k in range(min(4, target.segment_files())):
+            assert os.path.isfile(
+                os.path.join(tempdir, f"{circ.name}_driver_{k}.cpp"))
+        # failures are still detected in a segment
+        actions[-1] = Expect(circ.O, Array([BitVector[4](0)] * 3, 3))
+        with pytest.raises(AssertionError):
+            target.run(actions)
+
+
+def test_verilator_many_segments():
+    # one file per segment would give a list of files too long to be
+    # passed on the command line (over 128KiB), and a number of files
+    # growing with the test
+    circ = TestBasicCircuit
+    flags = ["-Wno-lint"]
+    actions = []
+    for k in range(2000):
+        actions += [Poke(circ.I, k % 2), Eval(), Expect(circ.O, k % 2)]
+    with tempfile.TemporaryDirectory(dir=".") as tempdir:
+        m.compile(f"{tempdir}/{circ.name}", circ, output="coreir-verilog")
+        target = fault.verilator_target.VerilatorTarget(
+            circ, directory=f"{tempdir}/",
+            flags=flags, skip_compile=True, segment_size=1)
+        target.run(actions)
+        with open(os.path.join(tempdir, f"{circ.name}_driver.cpp")) as f:
+            num_segments = len(re.findall(r"^  fault_segment_\d+\(top\);$",
+                                          f.read(), re.MULTILINE))
+        assert num_segments >= len(actions)
+        assert sum(len(f"{circ.name}_driver_{k} ")
+                   for k in range(num_segments)) > 128 * 1024
+        files = [name for name in os.listdir(tempdir)
+                 if name.startswith(f"{circ.name}_driver_")]
+        assert len(files) == target.segment_files()
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from fault.waveform import Signal, Waveform, EdgeNotFoundError
+
+
+def square_wave(period=1.0, duty=0.25, cycles=10, points=100):
+    # trapezoidal wave with finite rise/fall times, so that crossings are
+    # interpolated between samples
+    x = np.linspace(0, cycles * period, cycles * points + 1)
+    y = ((x % period) < duty * period).astype(float)
+    return Signal(x, y)
+
+
+def test_signal_edges():
+    sig = square_wave()
+    # crossings of 0.5 are halfway between the samples around each edge
+    rising = sig.edges(5.0, 0.5, count=3)
+    assert np.allclose(rising, [4.995, 3.995, 2.995])
+    falling = sig.edges(5.0, 0.5, count=2, rising=False)
+    assert np.allclose(falling, [4.245, 3.245])
+    forward = sig.edges(5.5, 0.5, forward=True, count=2)
+    assert np.allclose(forward, [5.995, 6.995])
+    forward = sig.edges(5.5, 0.5, forward=True, count=1, rising=False)
+    assert np.allclose(forward, [6.245])
+    with pytest.raises(EdgeNotFoundError):
+        sig.edges(2.5, 0.5, count=4)
+
+
+def test_signal_periods():
+    x = np.linspace(0, 10, 10001)
+    # frequency increasing over time
+    sig = Signal(x, np.sin(2 * np.pi * (x + 0.01 * x ** 2)))
+    periods = sig.periods(10, 0, count=5)
+    assert len(periods) == 5
+    assert np.all(np.diff(periods) < 0)
+    assert len(sig.periods(10, 0)) == len(sig.crossings(0)[0]) - 1
+    # periods after t_start, in chronological order
+    forward = sig.periods(0, 0, forward=True, count=5)
+    assert len(forward) == 5
+    assert np.all(np.diff(forward) < 0)
+    assert np.allclose(forward, sig.periods(10, 0)[:5])
+
+
+def test_waveform_lazy_signals():
+    wave = Waveform([0, 1, 2], {'a': np.array([0, 1, 0]),
+                                'b': np.array([1, 1, 1])})
+    assert wave.signals == {}
+    assert wave['a'](0.5) == 0.5
+    assert list(wave.signals) == ['a']